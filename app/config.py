@@ -15,9 +15,107 @@ class Config:
     MINIMAX_API_KEY: str = os.getenv("MINIMAX_API_KEY", "")
     MINIMAX_GROUP_ID: str = os.getenv("MINIMAX_GROUP_ID", "")
     MINIMAX_BASE_URL: str = "https://api.minimax.chat/v1"
+    MINIMAX_MAX_CONNECTIONS: int = int(os.getenv("MINIMAX_MAX_CONNECTIONS", "20"))
+    MINIMAX_KEEPALIVE_TIMEOUT: float = float(os.getenv("MINIMAX_KEEPALIVE_TIMEOUT", "60"))
+    # Most MiniMax calls in flight at once; more wait in a fair queue
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    # Retries (jittered exponential backoff, honouring Retry-After), circuit
+    # breaker (consecutive failures to open, seconds until a probe) and
+    # hedging (second request once the first is slower than p95)
+    MINIMAX_MAX_ATTEMPTS: int = int(os.getenv("MINIMAX_MAX_ATTEMPTS", "3"))
+    MINIMAX_RETRY_BASE_DELAY: float = float(os.getenv("MINIMAX_RETRY_BASE_DELAY", "0.5"))
+    MINIMAX_RETRY_MAX_DELAY: float = float(os.getenv("MINIMAX_RETRY_MAX_DELAY", "8"))
+    MINIMAX_BREAKER_THRESHOLD: int = int(os.getenv("MINIMAX_BREAKER_THRESHOLD", "5"))
+    MINIMAX_BREAKER_RESET: float = float(os.getenv("MINIMAX_BREAKER_RESET", "30"))
+    MINIMAX_HEDGE: bool = os.getenv("MINIMAX_HEDGE", "false").lower() in ("1", "true", "yes")
+    # Stream replies where a caller shows progress
+    MINIMAX_STREAM: bool = os.getenv("MINIMAX_STREAM", "true").lower() in ("1", "true", "yes")
     
     # Database
     DATABASE_URL: str = os.getenv("DATABASE_URL", "bot.db")
+    DB_READER_THREADS: int = int(os.getenv("DB_READER_THREADS", "4"))
+    
+    # Connection pool (one writer + N readers, WAL mode)
+    DB_POOLED: bool = os.getenv("DB_POOLED", "true").lower() in ("1", "true", "yes")
+    DB_READ_POOL_SIZE: int = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+    DB_CACHE_SIZE_KB: int = int(os.getenv("DB_CACHE_SIZE_KB", "16384"))
+    DB_MMAP_SIZE: int = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+    DB_STATEMENT_CACHE: int = int(os.getenv("DB_STATEMENT_CACHE", "256"))
+    
+    # Message ingestion (write-behind buffer)
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "200"))
+    INGEST_FLUSH_INTERVAL: float = float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0"))
+    INGEST_MAX_QUEUE: int = int(os.getenv("INGEST_MAX_QUEUE", "10000"))
+    
+    # Group settings cache TTL in seconds (writes invalidate immediately)
+    GROUP_CACHE_TTL: float = float(os.getenv("GROUP_CACHE_TTL", "300"))
+    
+    # Summary result cache (memory LRU + optional SQLite tier)
+    SUMMARY_CACHE_SIZE: int = int(os.getenv("SUMMARY_CACHE_SIZE", "512"))
+    SUMMARY_CACHE_TTL: float = float(os.getenv("SUMMARY_CACHE_TTL", "3600"))
+    SUMMARY_CACHE_PERSISTENT: bool = os.getenv("SUMMARY_CACHE_PERSISTENT", "false").lower() in ("1", "true", "yes")
+    
+    # How long a /summary waits for its (possibly shared) generation
+    SUMMARY_WAIT_TIMEOUT: float = float(os.getenv("SUMMARY_WAIT_TIMEOUT", "90"))
+    # Minimum seconds between progressive edits of a streamed summary
+    SUMMARY_EDIT_INTERVAL: float = float(os.getenv("SUMMARY_EDIT_INTERVAL", "2.0"))
+    
+    # Incremental summaries: update a per-group running summary with new
+    # messages, rebuilding from scratch after SUMMARY_MAX_CHAIN updates
+    SUMMARY_INCREMENTAL: bool = os.getenv("SUMMARY_INCREMENTAL", "true").lower() in ("1", "true", "yes")
+    SUMMARY_MAX_CHAIN: int = int(os.getenv("SUMMARY_MAX_CHAIN", "5"))
+    
+    # Summary prompts: candidate recent messages, transcript token budget
+    # (filled newest-first), and per-message cap before eliding the middle
+    SUMMARY_CANDIDATE_MESSAGES: int = int(os.getenv("SUMMARY_CANDIDATE_MESSAGES", "500"))
+    SUMMARY_TOKEN_BUDGET: int = int(os.getenv("SUMMARY_TOKEN_BUDGET", "6000"))
+    SUMMARY_MAX_MESSAGE_TOKENS: int = int(os.getenv("SUMMARY_MAX_MESSAGE_TOKENS", "300"))
+    
+    # Cap time-window transcripts at this many tokens of the most salient
+    # messages, picked locally (0 keeps every message)
+    SUMMARY_PREFILTER_TOKENS: int = int(os.getenv("SUMMARY_PREFILTER_TOKENS", "0"))
+    
+    # Map-reduce summaries of long windows: transcript tokens per chunk and
+    # parallel chunk calls (retries are MINIMAX_MAX_ATTEMPTS per call)
+    SUMMARY_CHUNK_TOKENS: int = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+    SUMMARY_MAP_CONCURRENCY: int = int(os.getenv("SUMMARY_MAP_CONCURRENCY", "4"))
+    
+    # Topic summaries (/summary topics): at most this many threads (smaller
+    # ones are pooled), a new thread after this long a pause, and the
+    # similarity a message needs to join an existing thread
+    SUMMARY_TOPIC_MAX: int = int(os.getenv("SUMMARY_TOPIC_MAX", "5"))
+    SUMMARY_TOPIC_GAP_MINUTES: int = int(os.getenv("SUMMARY_TOPIC_GAP_MINUTES", "30"))
+    SUMMARY_TOPIC_SIMILARITY: float = float(os.getenv("SUMMARY_TOPIC_SIMILARITY", "0.12"))
+    
+    # Daily digests for groups that opt in, generated at jittered times
+    # spread over an off-peak window (local time) with at most
+    # DIGEST_CONCURRENCY generations at once
+    DIGEST_ENABLED: bool = os.getenv("DIGEST_ENABLED", "true").lower() in ("1", "true", "yes")
+    DIGEST_WINDOW_START_HOUR: int = int(os.getenv("DIGEST_WINDOW_START_HOUR", "4"))
+    DIGEST_WINDOW_HOURS: float = float(os.getenv("DIGEST_WINDOW_HOURS", "3"))
+    DIGEST_CONCURRENCY: int = int(os.getenv("DIGEST_CONCURRENCY", "2"))
+    
+    # Persistent summary queue: with SUMMARY_QUEUE on, /summary only enqueues
+    # and `python -m app.worker` runs WORKER_CONCURRENCY jobs at a time. A
+    # job's lease lapses after JOB_LEASE_SECONDS without a heartbeat, and it
+    # is attempted at most JOB_MAX_ATTEMPTS times
+    SUMMARY_QUEUE: bool = os.getenv("SUMMARY_QUEUE", "false").lower() in ("1", "true", "yes")
+    WORKER_CONCURRENCY: int = int(os.getenv("WORKER_CONCURRENCY", "4"))
+    WORKER_POLL_INTERVAL: float = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+    JOB_LEASE_SECONDS: float = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    
+    # Near-duplicate collapsing at ingest: a message matching one of the same
+    # sender's messages among the group's last DEDUP_WINDOW_SIZE from the past
+    # DEDUP_WINDOW_SECONDS (SimHash within DEDUP_MAX_DISTANCE bits) only bumps
+    # its repeat count
+    DEDUP_ENABLED: bool = os.getenv("DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+    DEDUP_WINDOW_SIZE: int = int(os.getenv("DEDUP_WINDOW_SIZE", "200"))
+    DEDUP_WINDOW_SECONDS: int = int(os.getenv("DEDUP_WINDOW_SECONDS", "600"))
+    DEDUP_MAX_DISTANCE: int = int(os.getenv("DEDUP_MAX_DISTANCE", "3"))
+    
+    # Recent-message tail cache (global memory cap across groups)
+    TAIL_CACHE_MAX_BYTES: int = int(os.getenv("TAIL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
     
     # Admin
     ADMIN_USER_ID: Optional[int] = None
@@ -26,6 +124,31 @@ class Config:
     WEBHOOK_URL: str = os.getenv("WEBHOOK_URL", "")
     WEBHOOK_SECRET: str = os.getenv("WEBHOOK_SECRET", "")
     
+    # Bearer token for GET /metrics; defaults to WEBHOOK_SECRET, and the
+    # endpoint is not served at all without either
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
+    
+    # Fast-ack webhook: answer Telegram at once and process updates from
+    # per-chat queues (at most WEBHOOK_CHAT_QUEUE each, WEBHOOK_MAX_PENDING in
+    # all) with WEBHOOK_WORKERS workers; off processes each update in-request
+    WEBHOOK_FAST_ACK: bool = os.getenv("WEBHOOK_FAST_ACK", "true").lower() in ("1", "true", "yes")
+    WEBHOOK_WORKERS: int = int(os.getenv("WEBHOOK_WORKERS", "32"))
+    WEBHOOK_CHAT_QUEUE: int = int(os.getenv("WEBHOOK_CHAT_QUEUE", "100"))
+    WEBHOOK_MAX_PENDING: int = int(os.getenv("WEBHOOK_MAX_PENDING", "5000"))
+    
+    # Outgoing message pacing: TELEGRAM_GLOBAL_RATE messages a second overall,
+    # TELEGRAM_GROUP_RATE_PER_MINUTE per group and TELEGRAM_PRIVATE_RATE a
+    # second per private chat, in bursts of TELEGRAM_CHAT_BURST. Flood-control
+    # replies are waited out and retried TELEGRAM_FLOOD_RETRIES times if the
+    # wait is at most TELEGRAM_MAX_RETRY_AFTER seconds
+    TELEGRAM_RATE_LIMIT: bool = os.getenv("TELEGRAM_RATE_LIMIT", "true").lower() in ("1", "true", "yes")
+    TELEGRAM_GLOBAL_RATE: float = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+    TELEGRAM_GROUP_RATE_PER_MINUTE: float = float(os.getenv("TELEGRAM_GROUP_RATE_PER_MINUTE", "20"))
+    TELEGRAM_PRIVATE_RATE: float = float(os.getenv("TELEGRAM_PRIVATE_RATE", "1"))
+    TELEGRAM_CHAT_BURST: float = float(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+    TELEGRAM_FLOOD_RETRIES: int = int(os.getenv("TELEGRAM_FLOOD_RETRIES", "2"))
+    TELEGRAM_MAX_RETRY_AFTER: float = float(os.getenv("TELEGRAM_MAX_RETRY_AFTER", "60"))
+    
     def __post_init__(self):
         """Validate required config."""
         if not self.TELEGRAM_BOT_TOKEN:
@@ -1,14 +1,36 @@
 """SQLite database management."""
+import asyncio
 import json
+import logging
+import queue
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Generator, Optional
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Generator, Optional
 
 from app.config import config
 
+logger = logging.getLogger(__name__)
+
+
+def to_epoch_ms(value: str) -> int:
+    """Convert a naive local ISO datetime string to epoch milliseconds."""
+    return int(datetime.fromisoformat(value).timestamp() * 1000)
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+# Rows not yet backfilled fall back to the TEXT column
+_LEGACY_MESSAGE_TS = "COALESCE(ts, CAST(strftime('%s', timestamp) AS INTEGER) * 1000)"
+
 
 @dataclass
 class GroupSettings:
@@ -21,6 +43,8 @@ class GroupSettings:
     language: str = "zh-CN"
     created_at: str = ""
     updated_at: str = ""
+    digest_enabled: bool = False  # Post a daily digest
+    digest_last_at: int = 0       # epoch milliseconds of the last digest
 
 
 @dataclass
@@ -31,82 +55,412 @@ class PaidUser:
     group_id: int
     expire_date: str
     created_at: str = ""
+    expire_at: int = 0  # epoch milliseconds
+
+
+@dataclass
+class SummaryCheckpoint:
+    """Running summary of a group up to a message id."""
+    group_id: int
+    summary: str
+    last_message_id: int
+    language: str
+    summary_length: str
+    prompt_version: int
+    chain_length: int = 0  # Incremental updates since the last full rebuild
+    updated_at: int = 0    # epoch milliseconds
+
+
+@dataclass
+class QueuedJob:
+    """A summary job claimed from the persistent queue."""
+    id: int
+    group_id: int
+    payload: dict
+    priority: int
+    attempts: int      # Claims so far, including this one
+    max_attempts: int
+    lease_owner: str
+    created_at: int    # epoch milliseconds
 
 
 class Database:
-    """SQLite database wrapper."""
+    """
+    SQLite database wrapper.
     
-    def __init__(self, db_path: str = None):
+    With pooling enabled (DB_POOLED) the database keeps one long-lived writer
+    connection and up to `read_pool_size` reader connections in WAL mode, so
+    readers never wait behind the writer and connections are reused instead
+    of being opened per operation. Otherwise each operation opens and closes
+    its own connection.
+    """
+    
+    def __init__(self, db_path: str = None, pooled: bool = None, read_pool_size: int = None):
         self.db_path = db_path or config.DATABASE_URL
+        self.pooled = config.DB_POOLED if pooled is None else pooled
+        self.read_pool_size = read_pool_size or config.DB_READ_POOL_SIZE
+        
+        self._write_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._readers: queue.LifoQueue = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        
         self._init_db()
     
     def _get_connection(self) -> sqlite3.Connection:
         """Get database connection."""
-        conn = sqlite3.connect(self.db_path)
+        conn = sqlite3.connect(
+            self.db_path,
+            check_same_thread=not self.pooled,
+            cached_statements=config.DB_STATEMENT_CACHE
+        )
         conn.row_factory = sqlite3.Row
+        if self.pooled:
+            self._configure_connection(conn)
         return conn
     
+    def _configure_connection(self, conn: sqlite3.Connection):
+        """Apply per-connection pragmas for pooled connections."""
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute("PRAGMA busy_timeout=5000")
+        # Negative cache_size is in KiB rather than pages
+        conn.execute(f"PRAGMA cache_size=-{int(config.DB_CACHE_SIZE_KB)}")
+        conn.execute(f"PRAGMA mmap_size={int(config.DB_MMAP_SIZE)}")
+    
+    def _acquire_reader(self) -> sqlite3.Connection:
+        """Take a reader connection from the pool, opening one if below the limit."""
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._reader_lock:
+            if self._reader_count < self.read_pool_size:
+                self._reader_count += 1
+                return self._get_connection()
+        
+        return self._readers.get()
+    
     @contextmanager
-    def _cursor(self) -> Generator[sqlite3.Cursor, None, None]:
+    def _cursor(self, readonly: bool = False) -> Generator[sqlite3.Cursor, None, None]:
         """Context manager for cursor."""
-        conn = self._get_connection()
-        try:
+        if not self.pooled:
+            conn = self._get_connection()
+            try:
+                cursor = conn.cursor()
+                yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+            return
+        
+        if readonly:
+            conn = self._acquire_reader()
             cursor = conn.cursor()
-            yield cursor
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+            try:
+                yield cursor
+            finally:
+                # Closing the cursor ends the read snapshot
+                cursor.close()
+                self._readers.put(conn)
+            return
+        
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._get_connection()
+            conn = self._writer
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+    
+    def close(self):
+        """Close pooled connections."""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._reader_lock:
+            self._reader_count = 0
+    
+    # ========== Schema ==========
+    
+    def _migrations(self) -> list[Callable[[sqlite3.Cursor], None]]:
+        """Schema migrations in order; PRAGMA user_version is the count applied."""
+        return [
+            self._migrate_v1_base_schema,
+            self._migrate_v2_epoch_timestamps,
+            self._migrate_v3_telegram_message_ids,
+            self._migrate_v4_summary_cache,
+            self._migrate_v5_summary_checkpoints,
+            self._migrate_v6_repeat_counts,
+            self._migrate_v7_reply_chains,
+            self._migrate_v8_digests,
+            self._migrate_v9_summary_jobs,
+        ]
     
     def _init_db(self):
-        """Initialize database tables."""
+        """Create the schema or upgrade it to the latest version."""
         with self._cursor() as cursor:
-            # Groups table
+            cursor.execute("PRAGMA user_version")
+            version = cursor.fetchone()[0]
+        
+        for target, migration in enumerate(self._migrations(), start=1):
+            if version >= target:
+                continue
+            # Each migration and its version bump commit atomically
+            with self._cursor() as cursor:
+                cursor.execute("BEGIN")
+                migration(cursor)
+                cursor.execute(f"PRAGMA user_version = {target}")
+        
+        with self._cursor(readonly=True) as cursor:
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS groups (
-                    group_id INTEGER PRIMARY KEY,
-                    group_name TEXT NOT NULL,
-                    owner_id INTEGER NOT NULL,
-                    is_premium INTEGER DEFAULT 0,
-                    summary_length TEXT DEFAULT 'medium',
-                    language TEXT DEFAULT 'zh-CN',
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
+                SELECT 1 FROM sqlite_master
+                WHERE type = 'index' AND name = 'idx_messages_ts_pending'
             """)
-            
-            # Paid users table
+            self._backfill_pending = cursor.fetchone() is not None
+    
+    def _migrate_v1_base_schema(self, cursor: sqlite3.Cursor):
+        """Original tables; IF NOT EXISTS so unversioned databases pass through."""
+        # Groups table
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS groups (
+                group_id INTEGER PRIMARY KEY,
+                group_name TEXT NOT NULL,
+                owner_id INTEGER NOT NULL,
+                is_premium INTEGER DEFAULT 0,
+                summary_length TEXT DEFAULT 'medium',
+                language TEXT DEFAULT 'zh-CN',
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                updated_at TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Paid users table
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS paid_users (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                user_name TEXT,
+                group_id INTEGER NOT NULL,
+                expire_date TEXT NOT NULL,
+                created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(user_id, group_id)
+            )
+        """)
+        
+        # Messages table (for summary)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_id INTEGER NOT NULL,
+                user_id INTEGER NOT NULL,
+                user_name TEXT,
+                text TEXT,
+                timestamp TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        # Retention trims by id range within a group
+        cursor.execute("""
+            CREATE INDEX IF NOT EXISTS idx_messages_group_id
+            ON messages(group_id, id)
+        """)
+    
+    def _migrate_v2_epoch_timestamps(self, cursor: sqlite3.Cursor):
+        """
+        Add integer epoch-millisecond columns and covering indexes.
+        
+        `messages.ts` replaces the TEXT `timestamp`; existing rows are converted
+        later in chunks by backfill_message_timestamps(), tracked by a partial
+        index over the rows still missing `ts`. `paid_users.expire_at` replaces
+        the ISO `expire_date` for comparisons and is filled here, since the
+        table is small and its local-time strings need Python to parse.
+        """
+        cursor.execute("ALTER TABLE messages ADD COLUMN ts INTEGER")
+        cursor.execute("ALTER TABLE paid_users ADD COLUMN expire_at INTEGER")
+        
+        cursor.execute("""
+            CREATE INDEX idx_messages_ts_pending
+            ON messages(id) WHERE ts IS NULL
+        """)
+        
+        # Summary reads: newest rows of a group straight from the index
+        cursor.execute("""
+            CREATE INDEX idx_messages_group_recent
+            ON messages(group_id, id, ts, user_name, text)
+        """)
+        
+        # Time-window reads
+        cursor.execute("""
+            CREATE INDEX idx_messages_group_ts
+            ON messages(group_id, ts)
+        """)
+        cursor.execute("DROP INDEX IF EXISTS idx_messages_group_time")
+        
+        cursor.execute("SELECT id, expire_date FROM paid_users")
+        cursor.executemany(
+            "UPDATE paid_users SET expire_at = ? WHERE id = ?",
+            [(to_epoch_ms(row["expire_date"]), row["id"]) for row in cursor.fetchall()]
+        )
+        cursor.execute("""
+            CREATE INDEX idx_paid_users_group_expire
+            ON paid_users(group_id, expire_at)
+        """)
+    
+    def _migrate_v3_telegram_message_ids(self, cursor: sqlite3.Cursor):
+        """Keep Telegram's message_id so commands can refer to stored messages."""
+        cursor.execute("ALTER TABLE messages ADD COLUMN tg_message_id INTEGER")
+        cursor.execute("""
+            CREATE INDEX idx_messages_group_tg
+            ON messages(group_id, tg_message_id)
+        """)
+    
+    def _migrate_v4_summary_cache(self, cursor: sqlite3.Cursor):
+        """Persistent tier of the summary result cache."""
+        cursor.execute("""
+            CREATE TABLE summary_cache (
+                cache_key TEXT PRIMARY KEY,
+                group_id INTEGER NOT NULL,
+                summary TEXT NOT NULL,
+                created_at INTEGER NOT NULL
+            )
+        """)
+        cursor.execute("""
+            CREATE INDEX idx_summary_cache_created
+            ON summary_cache(created_at)
+        """)
+    
+    def _migrate_v5_summary_checkpoints(self, cursor: sqlite3.Cursor):
+        """Per-group running summary used by incremental summaries."""
+        cursor.execute("""
+            CREATE TABLE summary_checkpoints (
+                group_id INTEGER PRIMARY KEY,
+                summary TEXT NOT NULL,
+                last_message_id INTEGER NOT NULL,
+                language TEXT NOT NULL,
+                summary_length TEXT NOT NULL,
+                prompt_version INTEGER NOT NULL,
+                chain_length INTEGER NOT NULL DEFAULT 0,
+                updated_at INTEGER NOT NULL
+            )
+        """)
+    
+    def _migrate_v6_repeat_counts(self, cursor: sqlite3.Cursor):
+        """Near-duplicate messages are stored once with a repeat count."""
+        cursor.execute("ALTER TABLE messages ADD COLUMN repeat_count INTEGER NOT NULL DEFAULT 1")
+        
+        # Keep summary reads index-only
+        cursor.execute("DROP INDEX idx_messages_group_recent")
+        cursor.execute("""
+            CREATE INDEX idx_messages_group_recent
+            ON messages(group_id, id, ts, user_name, text, repeat_count)
+        """)
+    
+    def _migrate_v7_reply_chains(self, cursor: sqlite3.Cursor):
+        """Remember which message each one replied to, for topic threading."""
+        cursor.execute("ALTER TABLE messages ADD COLUMN reply_to_tg_id INTEGER")
+        
+        cursor.execute("DROP INDEX idx_messages_group_recent")
+        cursor.execute("""
+            CREATE INDEX idx_messages_group_recent
+            ON messages(group_id, id, ts, user_name, text, repeat_count, tg_message_id, reply_to_tg_id)
+        """)
+    
+    def _migrate_v8_digests(self, cursor: sqlite3.Cursor):
+        """Per-group daily digest switch and when the last one went out."""
+        cursor.execute("ALTER TABLE groups ADD COLUMN digest_enabled INTEGER NOT NULL DEFAULT 0")
+        cursor.execute("ALTER TABLE groups ADD COLUMN digest_last_at INTEGER NOT NULL DEFAULT 0")
+        
+        # Only the opted-in groups are scanned for due digests
+        cursor.execute("""
+            CREATE INDEX idx_groups_digest
+            ON groups(digest_last_at) WHERE digest_enabled = 1
+        """)
+    
+    def _migrate_v9_summary_jobs(self, cursor: sqlite3.Cursor):
+        """
+        Persistent queue of summary jobs for separate worker processes.
+        
+        A queued job is available from `available_at`; a claimed (running)
+        job's `available_at` is its lease expiry, after which another worker
+        may claim it again.
+        """
+        cursor.execute("""
+            CREATE TABLE summary_jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                group_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                priority INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                available_at INTEGER NOT NULL,
+                lease_owner TEXT,
+                last_error TEXT,
+                created_at INTEGER NOT NULL,
+                updated_at INTEGER NOT NULL
+            )
+        """)
+        
+        # Claims scan open jobs in priority, then arrival, order
+        cursor.execute("""
+            CREATE INDEX idx_summary_jobs_open
+            ON summary_jobs(priority, id) WHERE status IN ('queued', 'running')
+        """)
+        cursor.execute("""
+            CREATE INDEX idx_summary_jobs_closed
+            ON summary_jobs(updated_at) WHERE status IN ('done', 'failed')
+        """)
+    
+    def _message_ts(self) -> str:
+        """SQL for a message's epoch-ms time; plain `ts` keeps reads index-only."""
+        return _LEGACY_MESSAGE_TS if self._backfill_pending else "ts"
+    
+    def backfill_message_timestamps(self, chunk_size: int = 2000) -> int:
+        """
+        Convert one chunk of legacy TEXT timestamps to `ts`.
+        
+        Returns:
+            Number of rows converted; 0 once the backfill is complete
+        """
+        if not self._backfill_pending:
+            return 0
+        
+        with self._cursor() as cursor:
+            # CURRENT_TIMESTAMP values are UTC, which is what strftime('%s') assumes
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS paid_users (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER NOT NULL,
-                    user_name TEXT,
-                    group_id INTEGER NOT NULL,
-                    expire_date TEXT NOT NULL,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, group_id)
+                UPDATE messages
+                SET ts = CAST(strftime('%s', timestamp) AS INTEGER) * 1000
+                WHERE id IN (
+                    SELECT id FROM messages WHERE ts IS NULL ORDER BY id LIMIT ?
                 )
-            """)
+            """, (chunk_size,))
+            converted = cursor.rowcount
             
-            # Messages table (for summary)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    group_id INTEGER NOT NULL,
-                    user_id INTEGER NOT NULL,
-                    user_name TEXT,
-                    text TEXT,
-                    timestamp TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
+            if converted == 0:
+                cursor.execute("DROP INDEX IF EXISTS idx_messages_ts_pending")
+                self._backfill_pending = False
             
-            # Create index for faster queries
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_messages_group_time 
-                ON messages(group_id, timestamp)
-            """)
+            return converted
     
     # ========== Group Operations ==========
     
@@ -127,26 +481,49 @@ class Database:
     
     def get_group(self, group_id: int) -> Optional[GroupSettings]:
         """Get group settings."""
-        with self._cursor() as cursor:
+        with self._cursor(readonly=True) as cursor:
             cursor.execute("SELECT * FROM groups WHERE group_id = ?", (group_id,))
             row = cursor.fetchone()
             
             if row:
-                return GroupSettings(
-                    group_id=row["group_id"],
-                    group_name=row["group_name"],
-                    owner_id=row["owner_id"],
-                    is_premium=bool(row["is_premium"]),
-                    summary_length=row["summary_length"],
-                    language=row["language"],
-                    created_at=row["created_at"],
-                    updated_at=row["updated_at"]
-                )
+                return self._group_from_row(row)
         return None
     
+    @staticmethod
+    def _group_from_row(row: sqlite3.Row) -> GroupSettings:
+        return GroupSettings(
+            group_id=row["group_id"],
+            group_name=row["group_name"],
+            owner_id=row["owner_id"],
+            is_premium=bool(row["is_premium"]),
+            summary_length=row["summary_length"],
+            language=row["language"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            digest_enabled=bool(row["digest_enabled"]),
+            digest_last_at=row["digest_last_at"]
+        )
+    
+    def get_due_digest_groups(self, before_ms: int) -> list[GroupSettings]:
+        """Groups with digests on whose last digest went out before `before_ms`."""
+        with self._cursor(readonly=True) as cursor:
+            cursor.execute("""
+                SELECT * FROM groups
+                WHERE digest_enabled = 1 AND digest_last_at < ?
+            """, (before_ms,))
+            return [self._group_from_row(row) for row in cursor.fetchall()]
+    
+    def mark_digest_sent(self, group_id: int, at_ms: int):
+        """Record when a group's digest went out (or was found unnecessary)."""
+        with self._cursor() as cursor:
+            cursor.execute(
+                "UPDATE groups SET digest_last_at = ? WHERE group_id = ?",
+                (at_ms, group_id)
+            )
+    
     def update_group_settings(self, group_id: int, **kwargs) -> bool:
         """Update group settings."""
-        allowed_fields = {"is_premium", "summary_length", "language"}
+        allowed_fields = {"is_premium", "summary_length", "language", "digest_enabled"}
         updates = {k: v for k, v in kwargs.items() if k in allowed_fields}
         
         if not updates:
@@ -174,30 +551,31 @@ class Database:
     def add_paid_user(self, user_id: int, user_name: str, group_id: int, expire_date: str) -> bool:
         """Add a paid user."""
         now = datetime.now().isoformat()
+        expire_at = to_epoch_ms(expire_date)
         with self._cursor() as cursor:
             try:
                 cursor.execute("""
-                    INSERT INTO paid_users (user_id, user_name, group_id, expire_date, created_at)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (user_id, user_name, group_id, expire_date, now))
+                    INSERT INTO paid_users (user_id, user_name, group_id, expire_date, expire_at, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (user_id, user_name, group_id, expire_date, expire_at, now))
                 return True
             except sqlite3.IntegrityError:
                 # Update existing
                 cursor.execute("""
                     UPDATE paid_users 
-                    SET user_name = ?, expire_date = ?
+                    SET user_name = ?, expire_date = ?, expire_at = ?
                     WHERE user_id = ? AND group_id = ?
-                """, (user_name, expire_date, user_id, group_id))
+                """, (user_name, expire_date, expire_at, user_id, group_id))
                 return True
         return False
     
     def get_paid_users(self, group_id: int) -> list[PaidUser]:
         """Get all paid users for a group."""
-        with self._cursor() as cursor:
+        with self._cursor(readonly=True) as cursor:
             cursor.execute("""
                 SELECT * FROM paid_users 
                 WHERE group_id = ?
-                ORDER BY expire_date DESC
+                ORDER BY expire_at DESC
             """, (group_id,))
             
             return [
@@ -206,24 +584,20 @@ class Database:
                     user_name=row["user_name"],
                     group_id=row["group_id"],
                     expire_date=row["expire_date"],
-                    created_at=row["created_at"]
+                    created_at=row["created_at"],
+                    expire_at=row["expire_at"]
                 )
                 for row in cursor.fetchall()
             ]
     
     def is_paid_user(self, user_id: int, group_id: int) -> bool:
         """Check if user is paid and not expired."""
-        with self._cursor() as cursor:
+        with self._cursor(readonly=True) as cursor:
             cursor.execute("""
-                SELECT expire_date FROM paid_users
-                WHERE user_id = ? AND group_id = ?
-            """, (user_id, group_id))
-            row = cursor.fetchone()
-            
-            if row:
-                expire_date = datetime.fromisoformat(row["expire_date"])
-                return expire_date > datetime.now()
-        return False
+                SELECT 1 FROM paid_users
+                WHERE user_id = ? AND group_id = ? AND expire_at > ?
+            """, (user_id, group_id, _now_ms()))
+            return cursor.fetchone() is not None
     
     def remove_paid_user(self, user_id: int, group_id: int) -> bool:
         """Remove a paid user."""
@@ -235,29 +609,81 @@ class Database:
     
     # ========== Messages Operations ==========
     
-    def add_message(self, group_id: int, user_id: int, user_name: str, text: str):
-        """Store a message."""
+    def add_message(
+        self,
+        group_id: int,
+        user_id: int,
+        user_name: str,
+        text: str,
+        ts: int = None,
+        tg_message_id: int = None,
+        reply_to_tg_id: int = None
+    ):
+        """Store a message; `ts` is epoch milliseconds and defaults to now."""
         with self._cursor() as cursor:
             cursor.execute("""
-                INSERT INTO messages (group_id, user_id, user_name, text)
-                VALUES (?, ?, ?, ?)
-            """, (group_id, user_id, user_name, text))
+                INSERT INTO messages (group_id, user_id, user_name, text, ts, tg_message_id, reply_to_tg_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (group_id, user_id, user_name, text, ts or _now_ms(), tg_message_id, reply_to_tg_id))
+    
+    def add_messages(self, rows: list[tuple]) -> list[int]:
+        """
+        Store a batch of messages in one transaction.
+        
+        Args:
+            rows: (group_id, user_id, user_name, text, ts, tg_message_id,
+                reply_to_tg_id, repeat_count) tuples
+        
+        Returns:
+            The ids assigned to the rows, in order
+        """
+        if not rows:
+            return []
+        with self._cursor() as cursor:
+            cursor.executemany("""
+                INSERT INTO messages (
+                    group_id, user_id, user_name, text, ts, tg_message_id, reply_to_tg_id, repeat_count
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            # One writer per transaction, so AUTOINCREMENT ids are consecutive
+            cursor.execute("SELECT last_insert_rowid() AS last_id")
+            last_id = cursor.fetchone()["last_id"]
+            return list(range(last_id - len(rows) + 1, last_id + 1))
+    
+    def add_repeat_counts(self, increments: list[tuple[int, int]]):
+        """Count further copies of stored messages, given (extra_copies, message_id) pairs."""
+        if not increments:
+            return
+        with self._cursor() as cursor:
+            cursor.executemany(
+                "UPDATE messages SET repeat_count = repeat_count + ? WHERE id = ?",
+                increments
+            )
     
     def get_recent_messages(self, group_id: int, limit: int = 100) -> list[dict]:
         """Get recent messages for a group."""
-        with self._cursor() as cursor:
-            cursor.execute("""
-                SELECT user_name, text, timestamp FROM messages
+        with self._cursor(readonly=True) as cursor:
+            # Ids are assigned in arrival order, so they order messages
+            # exactly, even within the same millisecond
+            cursor.execute(f"""
+                SELECT id, user_name, text, {self._message_ts()} AS ts, repeat_count,
+                       tg_message_id, reply_to_tg_id
+                FROM messages
                 WHERE group_id = ?
-                ORDER BY timestamp DESC
+                ORDER BY id DESC
                 LIMIT ?
             """, (group_id, limit))
             
             return [
                 {
+                    "id": row["id"],
                     "user_name": row["user_name"],
                     "text": row["text"],
-                    "timestamp": row["timestamp"]
+                    "timestamp": row["ts"],
+                    "repeat_count": row["repeat_count"],
+                    "tg_message_id": row["tg_message_id"],
+                    "reply_to": row["reply_to_tg_id"]
                 }
                 for row in cursor.fetchall()
             ][::-1]  # Reverse to chronological order
@@ -266,7 +692,10 @@ class Database:
         """Clear messages for a group."""
         with self._cursor() as cursor:
             cursor.execute("DELETE FROM messages WHERE group_id = ?", (group_id,))
-            return cursor.rowcount
+            deleted = cursor.rowcount
+            # The running summary describes messages that no longer exist
+            cursor.execute("DELETE FROM summary_checkpoints WHERE group_id = ?", (group_id,))
+            return deleted
     
     def trim_messages(self, group_id: int, keep_count: int) -> int:
         """Keep only the most recent N messages for a group.
@@ -278,34 +707,483 @@ class Database:
         Returns:
             Number of messages deleted
         """
+        if keep_count <= 0:
+            return self.clear_messages(group_id)
+        
         with self._cursor() as cursor:
-            # Get IDs of messages to keep (most recent)
+            # Find the oldest message id that is still kept
             cursor.execute("""
-                SELECT id FROM messages 
+                SELECT id FROM messages
                 WHERE group_id = ?
-                ORDER BY timestamp DESC
-                LIMIT ?
-            """, (group_id, keep_count))
-            keep_ids = [row["id"] for row in cursor.fetchall()]
+                ORDER BY id DESC
+                LIMIT 1 OFFSET ?
+            """, (group_id, keep_count - 1))
+            row = cursor.fetchone()
             
-            if not keep_ids:
+            if not row:
                 return 0
             
-            # Delete all messages not in the keep list
-            placeholders = ",".join("?" * len(keep_ids))
-            cursor.execute(f"""
-                DELETE FROM messages 
-                WHERE group_id = ? AND id NOT IN ({placeholders})
-            """, [group_id] + keep_ids)
+            # Everything older is a single range on the (group_id, id) index
+            cursor.execute("""
+                DELETE FROM messages
+                WHERE group_id = ? AND id < ?
+            """, (group_id, row["id"]))
             
             return cursor.rowcount
     
+    def get_messages_page(
+        self,
+        group_id: int,
+        start_ms: int,
+        end_ms: int,
+        after: tuple[int, int] = None,
+        limit: int = 500
+    ) -> list[dict]:
+        """
+        Get one page of messages with start_ms <= ts < end_ms, oldest first.
+        
+        Pages are keyed on (ts, id): pass the last row's (timestamp, id) as
+        `after` to continue, so every page is a seek on the (group_id, ts)
+        index rather than an OFFSET scan. Until the timestamp backfill is
+        done, legacy rows are matched on their TEXT timestamp instead.
+        """
+        after_ts, after_id = after if after else (start_ms - 1, 0)
+        ts = self._message_ts()
+        with self._cursor(readonly=True) as cursor:
+            cursor.execute(f"""
+                SELECT id, user_name, text, {ts} AS ts, repeat_count, tg_message_id, reply_to_tg_id
+                FROM messages
+                WHERE group_id = ?
+                  AND {ts} >= ? AND {ts} < ?
+                  AND ({ts}, id) > (?, ?)
+                ORDER BY {ts}, id
+                LIMIT ?
+            """, (group_id, start_ms, end_ms, after_ts, after_id, limit))
+            
+            return [
+                {
+                    "id": row["id"],
+                    "user_name": row["user_name"],
+                    "text": row["text"],
+                    "timestamp": row["ts"],
+                    "repeat_count": row["repeat_count"],
+                    "tg_message_id": row["tg_message_id"],
+                    "reply_to": row["reply_to_tg_id"]
+                }
+                for row in cursor.fetchall()
+            ]
+    
+    def iter_messages_between(
+        self,
+        group_id: int,
+        start_ms: int,
+        end_ms: int,
+        page_size: int = 500
+    ) -> Generator[dict, None, None]:
+        """Stream messages in a time window, oldest first, one page at a time."""
+        after = None
+        while True:
+            page = self.get_messages_page(group_id, start_ms, end_ms, after, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            after = (page[-1]["timestamp"], page[-1]["id"])
+    
+    def find_message_time(self, group_id: int, tg_message_id: int) -> Optional[int]:
+        """Get the stored epoch-ms time of a Telegram message, if we have it."""
+        with self._cursor(readonly=True) as cursor:
+            cursor.execute(f"""
+                SELECT {self._message_ts()} AS ts FROM messages
+                WHERE group_id = ? AND tg_message_id = ?
+            """, (group_id, tg_message_id))
+            row = cursor.fetchone()
+            return row["ts"] if row else None
+    
     def get_message_count(self, group_id: int) -> int:
         """Get total message count for a group."""
-        with self._cursor() as cursor:
+        with self._cursor(readonly=True) as cursor:
             cursor.execute("SELECT COUNT(*) as count FROM messages WHERE group_id = ?", (group_id,))
             return cursor.fetchone()["count"]
+    
+    # ========== Summary Cache Operations ==========
+    
+    def get_cached_summary(self, cache_key: str, min_created_at: int) -> Optional[str]:
+        """Get a cached summary created at or after `min_created_at` (epoch ms)."""
+        with self._cursor(readonly=True) as cursor:
+            cursor.execute("""
+                SELECT summary FROM summary_cache
+                WHERE cache_key = ? AND created_at >= ?
+            """, (cache_key, min_created_at))
+            row = cursor.fetchone()
+            return row["summary"] if row else None
+    
+    def put_cached_summary(self, cache_key: str, group_id: int, summary: str):
+        """Store a summary in the persistent cache."""
+        with self._cursor() as cursor:
+            cursor.execute("""
+                INSERT OR REPLACE INTO summary_cache (cache_key, group_id, summary, created_at)
+                VALUES (?, ?, ?, ?)
+            """, (cache_key, group_id, summary, _now_ms()))
+    
+    def prune_cached_summaries(self, older_than: int) -> int:
+        """Delete cached summaries created before `older_than` (epoch ms)."""
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM summary_cache WHERE created_at < ?", (older_than,))
+            return cursor.rowcount
+    
+    # ========== Summary Checkpoint Operations ==========
+    
+    def get_summary_checkpoint(self, group_id: int) -> Optional[SummaryCheckpoint]:
+        """Get a group's running summary checkpoint."""
+        with self._cursor(readonly=True) as cursor:
+            cursor.execute("SELECT * FROM summary_checkpoints WHERE group_id = ?", (group_id,))
+            row = cursor.fetchone()
+            
+            if row:
+                return SummaryCheckpoint(
+                    group_id=row["group_id"],
+                    summary=row["summary"],
+                    last_message_id=row["last_message_id"],
+                    language=row["language"],
+                    summary_length=row["summary_length"],
+                    prompt_version=row["prompt_version"],
+                    chain_length=row["chain_length"],
+                    updated_at=row["updated_at"]
+                )
+        return None
+    
+    def save_summary_checkpoint(self, checkpoint: SummaryCheckpoint):
+        """Create or replace a group's running summary checkpoint."""
+        with self._cursor() as cursor:
+            cursor.execute("""
+                INSERT OR REPLACE INTO summary_checkpoints (
+                    group_id, summary, last_message_id, language,
+                    summary_length, prompt_version, chain_length, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (
+                checkpoint.group_id, checkpoint.summary, checkpoint.last_message_id,
+                checkpoint.language, checkpoint.summary_length, checkpoint.prompt_version,
+                checkpoint.chain_length, checkpoint.updated_at or _now_ms()
+            ))
+    
+    def delete_summary_checkpoint(self, group_id: int) -> bool:
+        """Drop a group's checkpoint, forcing a full rebuild next time."""
+        with self._cursor() as cursor:
+            cursor.execute("DELETE FROM summary_checkpoints WHERE group_id = ?", (group_id,))
+            return cursor.rowcount > 0
+    
+    # ========== Summary Job Queue Operations ==========
+    
+    def enqueue_job(self, group_id: int, payload: dict, priority: int, max_attempts: int) -> int:
+        """Add a job to the queue; returns its id."""
+        now = _now_ms()
+        with self._cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO summary_jobs (
+                    group_id, payload, priority, max_attempts, available_at, created_at, updated_at
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (group_id, json.dumps(payload), priority, max_attempts, now, now, now))
+            return cursor.lastrowid
+    
+    def claim_jobs(self, owner: str, limit: int, lease_ms: int) -> list[QueuedJob]:
+        """
+        Lease up to `limit` available jobs to `owner`, most urgent first.
+        
+        Jobs whose previous lease expired are claimed again; a single UPDATE
+        makes the claim atomic across processes sharing the database.
+        """
+        now = _now_ms()
+        with self._cursor() as cursor:
+            cursor.execute("""
+                UPDATE summary_jobs
+                SET status = 'running', lease_owner = ?, available_at = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE id IN (
+                    SELECT id FROM summary_jobs
+                    WHERE status IN ('queued', 'running') AND available_at <= ?
+                    ORDER BY priority, id
+                    LIMIT ?
+                )
+                RETURNING id, group_id, payload, priority, attempts, max_attempts, lease_owner, created_at
+            """, (owner, now + lease_ms, now, now, limit))
+            jobs = [
+                QueuedJob(
+                    id=row["id"],
+                    group_id=row["group_id"],
+                    payload=json.loads(row["payload"]),
+                    priority=row["priority"],
+                    attempts=row["attempts"],
+                    max_attempts=row["max_attempts"],
+                    lease_owner=row["lease_owner"],
+                    created_at=row["created_at"]
+                )
+                for row in cursor.fetchall()
+            ]
+        # RETURNING does not follow the subquery's order
+        return sorted(jobs, key=lambda job: (job.priority, job.id))
+    
+    def extend_job_lease(self, job_id: int, owner: str, lease_ms: int) -> bool:
+        """Push a held lease out; False if the job is no longer ours."""
+        now = _now_ms()
+        with self._cursor() as cursor:
+            cursor.execute("""
+                UPDATE summary_jobs SET available_at = ?, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """, (now + lease_ms, now, job_id, owner))
+            return cursor.rowcount > 0
+    
+    def ack_job(self, job_id: int, owner: str) -> bool:
+        """Mark a held job done; False if the lease had been lost."""
+        with self._cursor() as cursor:
+            cursor.execute("""
+                UPDATE summary_jobs SET status = 'done', updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """, (_now_ms(), job_id, owner))
+            return cursor.rowcount > 0
+    
+    def fail_job(self, job_id: int, owner: str, error: str, retry_at: Optional[int] = None) -> bool:
+        """Record a failed attempt: queue the job again at `retry_at`, or give up."""
+        with self._cursor() as cursor:
+            cursor.execute("""
+                UPDATE summary_jobs
+                SET status = ?, available_at = COALESCE(?, available_at),
+                    last_error = ?, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """, ("queued" if retry_at else "failed", retry_at, error, _now_ms(), job_id, owner))
+            return cursor.rowcount > 0
+    
+    def release_job(self, job_id: int, owner: str) -> bool:
+        """Hand a held job back untried (e.g. on shutdown) for immediate reclaim."""
+        now = _now_ms()
+        with self._cursor() as cursor:
+            cursor.execute("""
+                UPDATE summary_jobs
+                SET status = 'queued', available_at = ?, attempts = attempts - 1, updated_at = ?
+                WHERE id = ? AND lease_owner = ? AND status = 'running'
+            """, (now, now, job_id, owner))
+            return cursor.rowcount > 0
+    
+    def purge_jobs(self, older_than: int) -> int:
+        """Delete finished jobs last updated before `older_than` (epoch ms)."""
+        with self._cursor() as cursor:
+            cursor.execute("""
+                DELETE FROM summary_jobs
+                WHERE status IN ('done', 'failed') AND updated_at < ?
+            """, (older_than,))
+            return cursor.rowcount
+    
+    def job_queue_counts(self) -> dict:
+        """Jobs per status, and how long the oldest available job has waited."""
+        now = _now_ms()
+        with self._cursor(readonly=True) as cursor:
+            cursor.execute("SELECT status, COUNT(*) AS n FROM summary_jobs GROUP BY status")
+            counts = {status: 0 for status in ("queued", "running", "done", "failed")}
+            counts.update({row["status"]: row["n"] for row in cursor.fetchall()})
+            cursor.execute("""
+                SELECT MIN(created_at) AS oldest FROM summary_jobs
+                WHERE status = 'queued' AND available_at <= ?
+            """, (now,))
+            oldest = cursor.fetchone()["oldest"]
+        counts["oldest_queued_ms"] = now - oldest if oldest else 0
+        return counts
+
+
+class AsyncDatabase:
+    """
+    Async wrapper around Database for use from handlers.
+    
+    Writes run on a single dedicated thread so they are serialised in
+    arrival order; reads run on a small thread pool. Either way the event
+    loop never blocks on disk I/O.
+    """
+    
+    def __init__(self, database: Database, reader_threads: int = 4):
+        self.db = database
+        self._backfill_task: Optional[asyncio.Task] = None
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(
+            max_workers=max(1, reader_threads),
+            thread_name_prefix="db-reader"
+        )
+    
+    async def _write(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._writer, partial(func, *args, **kwargs))
+    
+    async def _read(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._readers, partial(func, *args, **kwargs))
+    
+    def start_backfill(self, chunk_size: int = 2000, pause: float = 0.05):
+        """Convert legacy rows in the background, one short write per chunk."""
+        if self.db._backfill_pending and self._backfill_task is None:
+            self._backfill_task = asyncio.create_task(self._run_backfill(chunk_size, pause))
+    
+    async def _run_backfill(self, chunk_size: int, pause: float):
+        total = 0
+        while True:
+            converted = await self._write(self.db.backfill_message_timestamps, chunk_size)
+            if converted == 0:
+                break
+            total += converted
+            # Let queued writes run between chunks
+            await asyncio.sleep(pause)
+        logger.info(f"Message timestamp backfill complete ({total} rows)")
+    
+    async def close(self):
+        """Wait for queued operations and stop the worker threads."""
+        if self._backfill_task is not None:
+            self._backfill_task.cancel()
+            try:
+                await self._backfill_task
+            except asyncio.CancelledError:
+                pass
+            self._backfill_task = None
+        await asyncio.to_thread(self._writer.shutdown, wait=True)
+        await asyncio.to_thread(self._readers.shutdown, wait=True)
+        self.db.close()
+    
+    # ========== Group Operations ==========
+    
+    async def add_group(self, group_id: int, group_name: str, owner_id: int) -> GroupSettings:
+        return await self._write(self.db.add_group, group_id, group_name, owner_id)
+    
+    async def get_group(self, group_id: int) -> Optional[GroupSettings]:
+        return await self._read(self.db.get_group, group_id)
+    
+    async def update_group_settings(self, group_id: int, **kwargs) -> bool:
+        return await self._write(self.db.update_group_settings, group_id, **kwargs)
+    
+    async def get_due_digest_groups(self, before_ms: int) -> list[GroupSettings]:
+        return await self._read(self.db.get_due_digest_groups, before_ms)
+    
+    async def mark_digest_sent(self, group_id: int, at_ms: int):
+        return await self._write(self.db.mark_digest_sent, group_id, at_ms)
+    
+    async def is_group_owner(self, group_id: int, user_id: int) -> bool:
+        return await self._read(self.db.is_group_owner, group_id, user_id)
+    
+    # ========== Paid Users Operations ==========
+    
+    async def add_paid_user(self, user_id: int, user_name: str, group_id: int, expire_date: str) -> bool:
+        return await self._write(self.db.add_paid_user, user_id, user_name, group_id, expire_date)
+    
+    async def get_paid_users(self, group_id: int) -> list[PaidUser]:
+        return await self._read(self.db.get_paid_users, group_id)
+    
+    async def is_paid_user(self, user_id: int, group_id: int) -> bool:
+        return await self._read(self.db.is_paid_user, user_id, group_id)
+    
+    async def remove_paid_user(self, user_id: int, group_id: int) -> bool:
+        return await self._write(self.db.remove_paid_user, user_id, group_id)
+    
+    # ========== Messages Operations ==========
+    
+    async def add_message(
+        self,
+        group_id: int,
+        user_id: int,
+        user_name: str,
+        text: str,
+        ts: int = None,
+        tg_message_id: int = None,
+        reply_to_tg_id: int = None
+    ):
+        return await self._write(
+            self.db.add_message, group_id, user_id, user_name, text, ts, tg_message_id, reply_to_tg_id
+        )
+    
+    async def add_messages(self, rows: list[tuple]) -> list[int]:
+        return await self._write(self.db.add_messages, rows)
+    
+    async def add_repeat_counts(self, increments: list[tuple[int, int]]):
+        return await self._write(self.db.add_repeat_counts, increments)
+    
+    async def get_recent_messages(self, group_id: int, limit: int = 100) -> list[dict]:
+        return await self._read(self.db.get_recent_messages, group_id, limit)
+    
+    async def clear_messages(self, group_id: int) -> int:
+        return await self._write(self.db.clear_messages, group_id)
+    
+    async def trim_messages(self, group_id: int, keep_count: int) -> int:
+        return await self._write(self.db.trim_messages, group_id, keep_count)
+    
+    async def iter_messages_between(
+        self,
+        group_id: int,
+        start_ms: int,
+        end_ms: int,
+        page_size: int = 500
+    ) -> AsyncIterator[dict]:
+        """Async version of Database.iter_messages_between; each page is one read."""
+        after = None
+        while True:
+            page = await self._read(
+                self.db.get_messages_page, group_id, start_ms, end_ms, after, page_size
+            )
+            for message in page:
+                yield message
+            if len(page) < page_size:
+                return
+            after = (page[-1]["timestamp"], page[-1]["id"])
+    
+    async def find_message_time(self, group_id: int, tg_message_id: int) -> Optional[int]:
+        return await self._read(self.db.find_message_time, group_id, tg_message_id)
+    
+    async def get_message_count(self, group_id: int) -> int:
+        return await self._read(self.db.get_message_count, group_id)
+    
+    # ========== Summary Cache Operations ==========
+    
+    async def get_cached_summary(self, cache_key: str, min_created_at: int) -> Optional[str]:
+        return await self._read(self.db.get_cached_summary, cache_key, min_created_at)
+    
+    async def put_cached_summary(self, cache_key: str, group_id: int, summary: str):
+        return await self._write(self.db.put_cached_summary, cache_key, group_id, summary)
+    
+    async def prune_cached_summaries(self, older_than: int) -> int:
+        return await self._write(self.db.prune_cached_summaries, older_than)
+    
+    # ========== Summary Checkpoint Operations ==========
+    
+    async def get_summary_checkpoint(self, group_id: int) -> Optional[SummaryCheckpoint]:
+        return await self._read(self.db.get_summary_checkpoint, group_id)
+    
+    async def save_summary_checkpoint(self, checkpoint: SummaryCheckpoint):
+        return await self._write(self.db.save_summary_checkpoint, checkpoint)
+    
+    async def delete_summary_checkpoint(self, group_id: int) -> bool:
+        return await self._write(self.db.delete_summary_checkpoint, group_id)
+    
+    # ========== Summary Job Queue Operations ==========
+    
+    async def enqueue_job(self, group_id: int, payload: dict, priority: int, max_attempts: int) -> int:
+        return await self._write(self.db.enqueue_job, group_id, payload, priority, max_attempts)
+    
+    async def claim_jobs(self, owner: str, limit: int, lease_ms: int) -> list[QueuedJob]:
+        return await self._write(self.db.claim_jobs, owner, limit, lease_ms)
+    
+    async def extend_job_lease(self, job_id: int, owner: str, lease_ms: int) -> bool:
+        return await self._write(self.db.extend_job_lease, job_id, owner, lease_ms)
+    
+    async def ack_job(self, job_id: int, owner: str) -> bool:
+        return await self._write(self.db.ack_job, job_id, owner)
+    
+    async def fail_job(self, job_id: int, owner: str, error: str, retry_at: Optional[int] = None) -> bool:
+        return await self._write(self.db.fail_job, job_id, owner, error, retry_at)
+    
+    async def release_job(self, job_id: int, owner: str) -> bool:
+        return await self._write(self.db.release_job, job_id, owner)
+    
+    async def purge_jobs(self, older_than: int) -> int:
+        return await self._write(self.db.purge_jobs, older_than)
+    
+    async def job_queue_counts(self) -> dict:
+        return await self._read(self.db.job_queue_counts)
 
 
-# Global database instance
+# Global database instances
 db = Database()
+async_db = AsyncDatabase(db, reader_threads=config.DB_READER_THREADS)
\ No newline at end of file
@@ -2,7 +2,6 @@
 from aiogram import Router, F
 from aiogram.types import Message
 
-from app.database import db
 from app.services.message_store import message_store
 
 router = Router()
@@ -38,5 +37,7 @@ async def handle_group_message(message: Message):
         group_id=message.chat.id,
         user_id=user.id,
         user_name=user_name,
-        text=text
+        text=text,
+        message_id=message.message_id,
+        reply_to=message.reply_to_message.message_id if message.reply_to_message else None
     )
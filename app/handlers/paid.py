@@ -1,10 +1,13 @@
 """Paid users management handler."""
+import time
 from datetime import datetime, timedelta
 from aiogram import Router, F
 from aiogram.filters import Command
 from aiogram.types import CallbackQuery, Message
 
-from app.database import db
+from app.database import async_db
+from app.services.entitlements import entitlements
+from app.services.group_cache import group_cache
 
 router = Router()
 
@@ -21,7 +24,7 @@ async def cmd_add_paid(message: Message):
         return
     
     # Check if user is owner
-    if not db.is_group_owner(chat.id, user.id):
+    if not await group_cache.is_group_owner(chat.id, user.id):
         await message.answer("⚠️ 只有群主可以添加付费用户")
         return
     
@@ -71,7 +74,7 @@ async def cmd_add_paid(message: Message):
             pass
     
     # Add paid user
-    success = db.add_paid_user(target_user_id, user_name, chat.id, expire_date)
+    success = await entitlements.add_paid_user(target_user_id, user_name, chat.id, expire_date)
     
     if success:
         expire_str = datetime.fromisoformat(expire_date).strftime("%Y-%m-%d")
@@ -97,24 +100,24 @@ async def cmd_paid_list(message: Message):
         return
     
     # Check if user is owner
-    if not db.is_group_owner(chat.id, user.id):
+    if not await group_cache.is_group_owner(chat.id, user.id):
         await message.answer("⚠️ 只有群主可以查看付费用户列表")
         return
     
     # Get paid users
-    paid_users = db.get_paid_users(chat.id)
+    paid_users = await async_db.get_paid_users(chat.id)
     
     if not paid_users:
         await message.answer("📭 暂无付费用户")
         return
     
     # Build list
-    now = datetime.now()
+    now_ms = int(time.time() * 1000)
     lines = ["💎 付费用户列表\n"]
     
     for i, pu in enumerate(paid_users, 1):
-        expire_date = datetime.fromisoformat(pu.expire_date)
-        is_expired = expire_date < now
+        expire_date = datetime.fromtimestamp(pu.expire_at / 1000)
+        is_expired = pu.expire_at < now_ms
         status = "🔴 已过期" if is_expired else "🟢 有效"
         
         expire_str = expire_date.strftime("%Y-%m-%d")
@@ -136,7 +139,7 @@ async def callback_remove_paid(callback: CallbackQuery):
     chat = callback.message.chat
     user = callback.from_user
     
-    if not db.is_group_owner(chat.id, user.id):
+    if not await group_cache.is_group_owner(chat.id, user.id):
         await callback.answer("只有群主可以操作", show_alert=True)
         return
     
@@ -147,22 +150,22 @@ async def callback_remove_paid(callback: CallbackQuery):
         await callback.answer("无效的用户ID", show_alert=True)
         return
     
-    success = db.remove_paid_user(user_id, chat.id)
+    success = await entitlements.remove_paid_user(user_id, chat.id)
     
     if success:
         await callback.answer("✅ 已移除付费用户", show_alert=True)
         # Refresh the list
-        paid_users = db.get_paid_users(chat.id)
+        paid_users = await async_db.get_paid_users(chat.id)
         
         if not paid_users:
             await callback.message.edit_text("📭 暂无付费用户")
         else:
-            now = datetime.now()
+            now_ms = int(time.time() * 1000)
             lines = ["💎 付费用户列表\n"]
             
             for i, pu in enumerate(paid_users, 1):
-                expire_date = datetime.fromisoformat(pu.expire_date)
-                is_expired = expire_date < now
+                expire_date = datetime.fromtimestamp(pu.expire_at / 1000)
+                is_expired = pu.expire_at < now_ms
                 status = "🔴 已过期" if is_expired else "🟢 有效"
                 expire_str = expire_date.strftime("%Y-%m-%d")
                 
@@ -1,9 +1,10 @@
 """Settings command handler."""
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import CallbackQuery, Message
+from aiogram.types import CallbackQuery, InlineKeyboardMarkup, Message
 
-from app.database import db
+from app.database import GroupSettings
+from app.services.group_cache import group_cache
 from app.keyboards.main import (
     get_settings_keyboard,
     get_summary_length_keyboard,
@@ -13,6 +14,27 @@ from app.keyboards.main import (
 router = Router()
 
 
+def format_settings(group: GroupSettings) -> str:
+    """Settings overview shown above the settings keyboard."""
+    return f"""⚙️ 群设置
+
+群组：{group.group_name}
+摘要长度：{group.summary_length}
+语言：{group.language}
+每日摘要：{"开启" if group.digest_enabled else "关闭"}
+
+选择下方按钮进行设置："""
+
+
+def settings_keyboard(group: GroupSettings) -> InlineKeyboardMarkup:
+    """Settings keyboard reflecting the group's current settings."""
+    return get_settings_keyboard({
+        "summary_length": group.summary_length,
+        "language": group.language,
+        "digest_enabled": group.digest_enabled
+    })
+
+
 @router.message(Command("settings"))
 async def cmd_settings(message: Message):
     """Handle /settings command."""
@@ -25,31 +47,20 @@ async def cmd_settings(message: Message):
         return
     
     # Check if user is owner
-    if not db.is_group_owner(chat.id, user.id):
+    if not await group_cache.is_group_owner(chat.id, user.id):
         await message.answer("⚠️ 只有群主可以使用此命令")
         return
     
     # Get current settings
-    group = db.get_group(chat.id)
+    group = await group_cache.get_group(chat.id)
     
     if not group:
         await message.answer("❌ 群组未注册，请先发送 /start")
         return
     
-    settings_text = f"""⚙️ 群设置
-
-群组：{group.group_name}
-摘要长度：{group.summary_length}
-语言：{group.language}
-
-选择下方按钮进行设置："""
-    
     await message.answer(
-        settings_text,
-        reply_markup=get_settings_keyboard({
-            "summary_length": group.summary_length,
-            "language": group.language
-        })
+        format_settings(group),
+        reply_markup=settings_keyboard(group)
     )
 
 
@@ -60,28 +71,19 @@ async def callback_settings(callback: CallbackQuery):
     chat = callback.message.chat
     user = callback.from_user
     
-    if not db.is_group_owner(chat.id, user.id):
+    if not await group_cache.is_group_owner(chat.id, user.id):
         await callback.answer("只有群主可以设置", show_alert=True)
         return
     
-    group = db.get_group(chat.id)
+    group = await group_cache.get_group(chat.id)
     
     if not group:
         await callback.answer("群组未注册", show_alert=True)
         return
     
     await callback.message.edit_text(
-        f"""⚙️ 群设置
-
-群组：{group.group_name}
-摘要长度：{group.summary_length}
-语言：{group.language}
-
-选择下方按钮进行设置：""",
-        reply_markup=get_settings_keyboard({
-            "summary_length": group.summary_length,
-            "language": group.language
-        })
+        format_settings(group),
+        reply_markup=settings_keyboard(group)
     )
     await callback.answer()
 
@@ -92,7 +94,7 @@ async def callback_settings_length(callback: CallbackQuery):
     chat = callback.message.chat
     user = callback.from_user
     
-    if not db.is_group_owner(chat.id, user.id):
+    if not await group_cache.is_group_owner(chat.id, user.id):
         await callback.answer("只有群主可以设置", show_alert=True)
         return
     
@@ -109,7 +111,7 @@ async def callback_settings_language(callback: CallbackQuery):
     chat = callback.message.chat
     user = callback.from_user
     
-    if not db.is_group_owner(chat.id, user.id):
+    if not await group_cache.is_group_owner(chat.id, user.id):
         await callback.answer("只有群主可以设置", show_alert=True)
         return
     
@@ -126,28 +128,19 @@ async def callback_set_length(callback: CallbackQuery):
     chat = callback.message.chat
     user = callback.from_user
     
-    if not db.is_group_owner(chat.id, user.id):
+    if not await group_cache.is_group_owner(chat.id, user.id):
         await callback.answer("只有群主可以设置", show_alert=True)
         return
     
     length = callback.data.replace("length_", "")
     
-    db.update_group_settings(chat.id, summary_length=length)
+    await group_cache.update_group_settings(chat.id, summary_length=length)
     
-    group = db.get_group(chat.id)
+    group = await group_cache.get_group(chat.id)
     
     await callback.message.edit_text(
-        f"""⚙️ 群设置
-
-群组：{group.group_name}
-摘要长度：{group.summary_length}
-语言：{group.language}
-
-选择下方按钮进行设置：""",
-        reply_markup=get_settings_keyboard({
-            "summary_length": group.summary_length,
-            "language": group.language
-        })
+        format_settings(group),
+        reply_markup=settings_keyboard(group)
     )
     await callback.answer(f"✅ 摘要长度已设置为 {length}")
 
@@ -158,27 +151,46 @@ async def callback_set_language(callback: CallbackQuery):
     chat = callback.message.chat
     user = callback.from_user
     
-    if not db.is_group_owner(chat.id, user.id):
+    if not await group_cache.is_group_owner(chat.id, user.id):
         await callback.answer("只有群主可以设置", show_alert=True)
         return
     
     language = callback.data.replace("lang_", "")
     
-    db.update_group_settings(chat.id, language=language)
+    await group_cache.update_group_settings(chat.id, language=language)
     
-    group = db.get_group(chat.id)
+    group = await group_cache.get_group(chat.id)
     
     await callback.message.edit_text(
-        f"""⚙️ 群设置
+        format_settings(group),
+        reply_markup=settings_keyboard(group)
+    )
+    await callback.answer(f"✅ 语言已设置为 {language}")
 
-群组：{group.group_name}
-摘要长度：{group.summary_length}
-语言：{group.language}
 
-选择下方按钮进行设置：""",
-        reply_markup=get_settings_keyboard({
-            "summary_length": group.summary_length,
-            "language": group.language
-        })
+@router.callback_query(F.data == "settings_digest")
+async def callback_toggle_digest(callback: CallbackQuery):
+    """Turn the daily digest on or off."""
+    chat = callback.message.chat
+    user = callback.from_user
+    
+    if not await group_cache.is_group_owner(chat.id, user.id):
+        await callback.answer("只有群主可以设置", show_alert=True)
+        return
+    
+    group = await group_cache.get_group(chat.id)
+    
+    if not group:
+        await callback.answer("群组未注册", show_alert=True)
+        return
+    
+    enabled = not group.digest_enabled
+    await group_cache.update_group_settings(chat.id, digest_enabled=enabled)
+    
+    group = await group_cache.get_group(chat.id)
+    
+    await callback.message.edit_text(
+        format_settings(group),
+        reply_markup=settings_keyboard(group)
     )
-    await callback.answer(f"✅ 语言已设置为 {language}")
+    await callback.answer("✅ 已开启每日摘要" if enabled else "✅ 已关闭每日摘要")
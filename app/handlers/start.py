@@ -4,7 +4,7 @@ from aiogram.filters import Command
 from aiogram.types import Message
 
 from app.keyboards.main import get_main_menu_keyboard
-from app.database import db
+from app.services.group_cache import group_cache
 
 router = Router()
 
@@ -32,7 +32,7 @@ async def cmd_start(message: Message):
                     break
             
             # Register the group
-            db.add_group(
+            await group_cache.add_group(
                 group_id=chat.id,
                 group_name=chat.title or "Unknown Group",
                 owner_id=int(owner_id)
@@ -90,6 +90,11 @@ async def cmd_help(message: Message):
 
 📝 摘要命令：
 /summary - 生成群聊摘要
+/summary 2h - 最近2小时的摘要
+/summary today - 今天的摘要
+/summary all - 全部历史的摘要
+/summary since <消息ID> - 从某条消息开始的摘要
+/summary topics - 按话题分段的摘要（可组合，如 /summary 2h topics）
 
 ⚙️ 群主命令：
 /settings - 群设置
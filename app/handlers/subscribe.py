@@ -99,6 +99,11 @@ async def callback_help(callback: CallbackQuery):
 
 📝 摘要命令：
 /summary - 生成群聊摘要
+/summary 2h - 最近2小时的摘要
+/summary today - 今天的摘要
+/summary all - 全部历史的摘要
+/summary since <消息ID> - 从某条消息开始的摘要
+/summary topics - 按话题分段的摘要（可组合，如 /summary 2h topics）
 
 ⚙️ 群主命令：
 /settings - 群设置
@@ -1,15 +1,100 @@
 """Summary command handler."""
 import asyncio
+import logging
+import re
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
 from aiogram import Router
-from aiogram.filters import Command
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message
 
-from app.database import db
-from app.services.minimax import minimax_service
+from app.config import config
+from app.services.entitlements import entitlements
+from app.services.group_cache import group_cache
+from app.services.job_queue import job_queue
+from app.services.llm_scheduler import Priority, llm_scheduler
 from app.services.message_store import message_store
+from app.services.summarizer import SummaryJob, SummaryResult, SummaryWindow, summarizer
+
+logger = logging.getLogger(__name__)
 
 router = Router()
 
+# Telegram rejects longer message texts
+_MAX_MESSAGE_LENGTH = 4096
+
+# Replaces the text of the message showing a summary's progress
+EditText = Callable[[str], Awaitable[object]]
+
+# Summaries being generated; the handler returns without waiting for them,
+# so the chat's later updates are not held up behind a long generation
+_generations: set[asyncio.Task] = set()
+
+# "/summary 30m", "/summary 2h", "/summary 3d"
+_DURATION_RE = re.compile(r"^(\d+)\s*([mhd])$", re.IGNORECASE)
+_DURATION_UNITS = {"m": (60, "分钟"), "h": (3600, "小时"), "d": (86400, "天")}
+
+SUMMARY_USAGE = (
+    "📝 用法：\n"
+    "• /summary - 最近的消息\n"
+    "• /summary 2h - 最近2小时（支持 m/h/d）\n"
+    "• /summary today - 今天的消息\n"
+    "• /summary all - 全部保存的消息\n"
+    "• /summary since <消息ID> - 从某条消息开始（也可回复该消息）\n"
+    "• 末尾加 topics 按话题分段，如 /summary 2h topics"
+)
+
+
+async def resolve_summary_window(message: Message, args: Optional[str]) -> Optional[SummaryWindow]:
+    """
+    Parse /summary arguments into a time window.
+    
+    Returns:
+        None for the default "recent messages" summary
+    
+    Raises:
+        ValueError: With a user-facing explanation if the arguments are invalid
+    """
+    if not args:
+        return None
+    
+    now_ms = int(time.time() * 1000)
+    parts = args.split()
+    keyword = parts[0].lower()
+    
+    if match := _DURATION_RE.match(keyword):
+        amount = int(match.group(1))
+        seconds, unit_name = _DURATION_UNITS[match.group(2).lower()]
+        if amount <= 0:
+            raise ValueError(SUMMARY_USAGE)
+        return SummaryWindow(now_ms - amount * seconds * 1000, now_ms, f"最近{amount}{unit_name}")
+    
+    if keyword == "today":
+        midnight = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        return SummaryWindow(int(midnight.timestamp() * 1000), now_ms, "今天")
+    
+    if keyword == "all":
+        return SummaryWindow(0, now_ms + 1, "全部")
+    
+    if keyword == "since":
+        if message.reply_to_message:
+            target_id = message.reply_to_message.message_id
+        elif len(parts) >= 2 and (digits := re.search(r"(\d+)/?$", parts[1])):
+            # Accept a bare id or a t.me message link
+            target_id = int(digits.group(1))
+        else:
+            raise ValueError(SUMMARY_USAGE)
+        
+        start_ms = await message_store.find_message_time(message.chat.id, target_id)
+        if start_ms is None:
+            raise ValueError("找不到该消息，可能是命令、机器人消息或已被清理")
+        return SummaryWindow(start_ms, now_ms + 1, "指定消息之后")
+    
+    raise ValueError(SUMMARY_USAGE)
+
 
 async def can_generate_summary(user_id: int, chat_id: int, is_owner: bool) -> tuple[bool, str]:
     """
@@ -18,7 +103,7 @@ async def can_generate_summary(user_id: int, chat_id: int, is_owner: bool) -> tu
     Returns:
         (can_generate, reason)
     """
-    group = db.get_group(chat_id)
+    group = await group_cache.get_group(chat_id)
     
     if not group:
         return False, "群组未注册，请先发送 /start"
@@ -28,7 +113,7 @@ async def can_generate_summary(user_id: int, chat_id: int, is_owner: bool) -> tu
         return True, ""
     
     # Check if user is paid
-    if db.is_paid_user(user_id, chat_id):
+    if await entitlements.is_paid_user(user_id, chat_id):
         return True, ""
     
     # Check if group is premium
@@ -36,15 +121,85 @@ async def can_generate_summary(user_id: int, chat_id: int, is_owner: bool) -> tu
         return False, "此群为付费群，请联系群主订阅或成为付费用户"
     
     # Free tier - allow with limit
-    message_count = message_store.get_message_count(chat_id)
+    message_count = await message_store.get_message_count(chat_id)
     if message_count < 10:
         return False, f"消息不足，需要至少10条消息才能生成摘要（当前: {message_count}条）"
     
     return True, ""
 
 
+def format_summary(summary: str, scope: str) -> str:
+    """Format a summary reply."""
+    return f"📊 群聊摘要\n\n{summary}\n\n━━━━━━━━━━━━━━━━━━\n💬 基于{scope}生成"
+
+
+async def summary_priority(user_id: int, chat_id: int, is_owner: bool) -> Priority:
+    """Scheduling class of a summary request: owner, paid user, or free."""
+    if is_owner:
+        return Priority.OWNER
+    if await entitlements.is_paid_user(user_id, chat_id):
+        return Priority.PAID
+    return Priority.FREE
+
+
+class StreamingEditor:
+    """
+    Show progress on the processing message: the queue position while the
+    request waits for an LLM slot, then the summary as its text streams in.
+    
+    Edits run in the background, one at a time and at most once per
+    `interval` seconds; text that arrives in between is shown by the next
+    edit. A flood-control reply pushes the next edit back accordingly.
+    """
+    
+    def __init__(self, edit: EditText, interval: float = config.SUMMARY_EDIT_INTERVAL, footer: str = ""):
+        self.edit = edit
+        self.interval = interval
+        # Kept under the queue position until the summary itself streams in
+        self.footer = footer
+        self._next_edit = 0.0
+        self._shown = ""
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+    
+    async def update(self, text: str):
+        """Offer the text so far; edits the message if one is due."""
+        preview = f"📊 群聊摘要（生成中…）\n\n{text} ▌"
+        if len(preview) > _MAX_MESSAGE_LENGTH:
+            preview = preview[:_MAX_MESSAGE_LENGTH - 2] + " ▌"
+        self._offer(text, preview)
+    
+    async def queued(self, position: int):
+        """Offer the request's current place in the LLM queue."""
+        self._offer(f"queue:{position}", f"⏳ 排队中，当前第 {position} 位，请稍候...{self.footer}")
+    
+    def _offer(self, key: str, preview: str):
+        if self._closed or (self._task and not self._task.done()):
+            return
+        if time.monotonic() < self._next_edit or key == self._shown:
+            return
+        self._next_edit = time.monotonic() + self.interval
+        self._task = asyncio.create_task(self._edit(key, preview))
+    
+    async def close(self):
+        """Stop editing and wait for an edit in progress, before the final edit."""
+        self._closed = True
+        if self._task:
+            await self._task
+    
+    async def _edit(self, key: str, preview: str):
+        try:
+            await self.edit(preview)
+            self._shown = key
+        except TelegramRetryAfter as e:
+            self._next_edit = time.monotonic() + e.retry_after
+        except TelegramAPIError as e:
+            # Progress is best effort; the final edit still goes through
+            logger.warning(f"Progressive summary edit failed: {e}")
+
+
 @router.message(Command("summary"))
-async def cmd_summary(message: Message):
+async def cmd_summary(message: Message, command: CommandObject):
     """Handle /summary command."""
     chat = message.chat
     user = message.from_user
@@ -54,8 +209,23 @@ async def cmd_summary(message: Message):
         await message.answer("❌ 此命令只能在群聊中使用")
         return
     
+    # Make sure buffered messages are visible to the reads below
+    await message_store.flush()
+    
+    # "topics" may follow any window, e.g. "/summary 2h topics"
+    args = (command.args or "").split()
+    topics = bool(args) and args[-1].lower() == "topics"
+    if topics:
+        args.pop()
+    
+    try:
+        window = await resolve_summary_window(message, " ".join(args) or None)
+    except ValueError as e:
+        await message.answer(f"⚠️ {e}")
+        return
+    
     # Check if user is owner
-    is_owner = db.is_group_owner(chat.id, user.id)
+    is_owner = await group_cache.is_group_owner(chat.id, user.id)
     
     # Check permission
     can_generate, reason = await can_generate_summary(user.id, chat.id, is_owner)
@@ -65,32 +235,109 @@ async def cmd_summary(message: Message):
         return
     
     # Get group settings
-    group = db.get_group(chat.id)
+    group = await group_cache.get_group(chat.id)
     
     # Get messages
-    messages = message_store.get_messages_for_summary(chat.id)
+    job = await summarizer.prepare(chat.id, window, topics=topics)
     
-    if not messages:
+    if not job.records:
         await message.answer("📭 暂无消息记录，无法生成摘要")
         return
     
-    # Send processing message
-    processing_msg = await message.answer("⏳ 正在生成摘要，请稍候...")
+    # Repeat request with no new messages - answer straight from the cache
+    cached = await summarizer.get_cached(job, group.language, group.summary_length)
+    if cached:
+        await message.answer(format_summary(cached.text, job.scope))
+        return
+    
+    # Send processing message with an instant local preview of the key messages
+    preview = summarizer.preview(job)
+    footer = f"\n\n🔎 要点预览：\n{preview}" if preview else ""
+    processing_msg = await message.answer(f"⏳ 正在生成摘要，请稍候...{footer}")
+    
+    priority = await summary_priority(user.id, chat.id, is_owner)
+    
+    if config.SUMMARY_QUEUE:
+        # A worker process generates it and edits the processing message
+        await job_queue.enqueue(chat.id, {
+            "chat_id": chat.id,
+            "message_id": processing_msg.message_id,
+            "window": vars(window) if window else None,
+            "topics": topics,
+            "language": group.language,
+            "summary_length": group.summary_length,
+            "priority": int(priority),
+            "footer": footer
+        }, priority)
+        return
     
-    # Generate summary
+    task = asyncio.create_task(deliver_summary(
+        processing_msg.edit_text, job, group.language, group.summary_length, priority, footer
+    ))
+    _generations.add(task)
+    task.add_done_callback(_generations.discard)
+
+
+async def deliver_summary(
+    edit: EditText,
+    job: SummaryJob,
+    language: str,
+    length: str,
+    priority: Priority,
+    footer: str = ""
+):
+    """
+    Generate a prepared summary, queued by priority, and show it through
+    `edit` as the text streams in.
+    """
     try:
-        summary = await minimax_service.generate_summary(
-            messages=messages,
-            language=group.language,
-            length=group.summary_length
-        )
-        
-        if summary:
-            result_text = f"📊 群聊摘要\n\n{summary}\n\n━━━━━━━━━━━━━━━━━━\n💬 基于最近 {len(messages)} 条消息生成"
-            await processing_msg.edit_text(result_text)
+        result = await stream_summary(edit, job, language, length, priority, footer)
+        if result:
+            await show_summary(edit, job, result)
         else:
-            await processing_msg.edit_text("❌ 生成摘要失败，请稍后重试")
+            await edit("❌ 生成摘要失败，请稍后重试")
+    
+    except asyncio.TimeoutError:
+        await edit("⌛ 摘要生成超时，请稍后重试")
             
-    except Exception as e:
-        print(f"Summary generation error: {e}")
-        await processing_msg.edit_text("❌ 生成摘要时出错，请稍后重试")
+    except Exception:
+        logger.exception(f"Summary generation failed for group {job.group_id}")
+        await edit("❌ 生成摘要时出错，请稍后重试")
+
+
+async def stream_summary(
+    edit: EditText,
+    job: SummaryJob,
+    language: str,
+    length: str,
+    priority: Priority,
+    footer: str = ""
+) -> Optional[SummaryResult]:
+    """
+    Generate a prepared summary, queued by priority, showing the queue
+    position and then the text as it streams in through `edit`.
+    
+    Returns:
+        The summary, or None if generation failed
+    
+    Raises:
+        asyncio.TimeoutError: If no result arrived within SUMMARY_WAIT_TIMEOUT
+    """
+    editor = StreamingEditor(edit, footer=footer)
+    try:
+        with llm_scheduler.context(job.group_id, priority, on_queue=editor.queued):
+            return await summarizer.summarize(job, language, length, on_progress=editor.update)
+    finally:
+        await editor.close()
+
+
+async def show_summary(edit: EditText, job: SummaryJob, result: SummaryResult):
+    """Replace the progress shown through `edit` with the finished summary."""
+    if result.fallback:
+        notice = {
+            "cached": "以下为上次生成的摘要",
+            "extractive": "以下为自动摘录的要点"
+        }[result.fallback]
+        await edit(f"⚠️ 摘要服务暂时不可用，{notice}\n\n{format_summary(result.text, job.scope)}")
+    else:
+        await edit(format_summary(result.text, job.scope))
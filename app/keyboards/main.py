@@ -49,6 +49,16 @@ def get_settings_keyboard(current_settings: dict = None) -> InlineKeyboardMarkup
         )
     )
     
+    # Daily digest
+    digest = current_settings.get("digest_enabled", False) if current_settings else False
+    
+    builder.row(
+        InlineKeyboardButton(
+            text=f"📬 每日摘要: {'✅ 开启' if digest else '❌ 关闭'}",
+            callback_data="settings_digest"
+        )
+    )
+    
     builder.row(
         InlineKeyboardButton(text="« 返回", callback_data="back_to_main")
     )
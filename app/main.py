@@ -1,4 +1,5 @@
 """Bot main entry point."""
+import hmac
 import logging
 import sys
 import os
@@ -16,8 +17,21 @@ if os.path.exists(".env"):
     load_dotenv()
 
 from app.config import config
+from app.database import async_db
 from app.handlers import start, summary, settings, paid, subscribe
 from app.handlers.message_listener import router as message_router
+from app.middlewares import RateLimitMiddleware, RequestMemoMiddleware
+from app.services.digest import digest_scheduler
+from app.services.entitlements import entitlements
+from app.services.group_cache import group_cache
+from app.services.job_queue import job_queue
+from app.services.message_store import message_store
+from app.services.llm_scheduler import llm_scheduler
+from app.services.minimax import minimax_service
+from app.services.prompt_builder import prompt_builder
+from app.services.summarizer import summarizer
+from app.services.summary_cache import summary_cache
+from app.webhook import FastAckRequestHandler
 
 # Configure logging
 logging.basicConfig(
@@ -33,10 +47,26 @@ bot = Bot(
     default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
 
+# Pace outgoing messages to the Bot API limits
+rate_limiter = RateLimitMiddleware(
+    global_rate=config.TELEGRAM_GLOBAL_RATE,
+    group_per_minute=config.TELEGRAM_GROUP_RATE_PER_MINUTE,
+    private_rate=config.TELEGRAM_PRIVATE_RATE,
+    chat_burst=config.TELEGRAM_CHAT_BURST,
+    max_retries=config.TELEGRAM_FLOOD_RETRIES,
+    max_retry_after=config.TELEGRAM_MAX_RETRY_AFTER
+)
+if config.TELEGRAM_RATE_LIMIT:
+    bot.session.middleware(rate_limiter)
+
 storage = MemoryStorage()
 dp = Dispatcher(storage=storage)
 
 
+# Per-update memo for cached lookups
+dp.update.outer_middleware(RequestMemoMiddleware())
+
+
 # Register routers
 dp.include_router(start.router)
 dp.include_router(summary.router)
@@ -51,7 +81,14 @@ WEBHOOK_PATH = "/webhook"
 
 
 async def on_startup(bot: Bot) -> None:
-    """Set webhook on startup."""
+    """Start background services and set webhook on startup."""
+    await message_store.start()
+    await minimax_service.start()
+    async_db.start_backfill()
+    await summary_cache.prune()
+    if config.DIGEST_ENABLED:
+        digest_scheduler.start(bot)
+    
     if config.WEBHOOK_URL:
         await bot.set_webhook(
             f"{config.WEBHOOK_URL}{WEBHOOK_PATH}",
@@ -62,8 +99,22 @@ async def on_startup(bot: Bot) -> None:
         logger.warning("WEBHOOK_URL not set, skipping webhook setup")
 
 
+async def on_shutdown(bot: Bot) -> None:
+    """Flush buffered messages and release connections and threads on shutdown."""
+    await digest_scheduler.stop()
+    await minimax_service.close()
+    await message_store.stop()
+    stats = message_store.stats()
+    logger.info(
+        f"Message buffer stopped: {stats.rows_written} rows in {stats.flushes} flushes, "
+        f"max flush {stats.max_flush_ms:.1f}ms"
+    )
+    await async_db.close()
+
+
 # Register startup/shutdown hooks via dispatcher (aiogram 3.x best practice)
 dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
 
 
 async def main_polling():
@@ -81,18 +132,61 @@ def main() -> None:
     # Create aiohttp application
     app = web.Application()
     
+    # Create webhook request handler
+    if config.WEBHOOK_FAST_ACK:
+        webhook_requests_handler = FastAckRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            secret_token=config.WEBHOOK_SECRET or None,
+            workers=config.WEBHOOK_WORKERS,
+            per_chat=config.WEBHOOK_CHAT_QUEUE,
+            max_pending=config.WEBHOOK_MAX_PENDING
+        )
+    else:
+        webhook_requests_handler = SimpleRequestHandler(
+            dispatcher=dp,
+            bot=bot,
+            handle_in_background=False,
+            secret_token=config.WEBHOOK_SECRET or None,
+        )
+    
     # Add health check endpoint
     async def health_check(request):
         return web.Response(text="OK")
     
     app.router.add_get("/health", health_check)
     
-    # Create webhook request handler
-    webhook_requests_handler = SimpleRequestHandler(
-        dispatcher=dp,
-        bot=bot,
-        secret_token=config.WEBHOOK_SECRET or None,
-    )
+    # Runtime metrics for the ingestion pipeline, for holders of the token only
+    async def metrics(request):
+        supplied = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        if not hmac.compare_digest(supplied.encode(), metrics_token.encode()):
+            return web.Response(status=401, text="Unauthorized")
+        return web.json_response({
+            "message_buffer": vars(message_store.stats()),
+            "tail_cache": vars(message_store.cache_stats()),
+            "dedup": vars(message_store.dedup_stats()),
+            "group_cache": vars(group_cache.stats()),
+            "entitlements": vars(entitlements.stats()),
+            "minimax": minimax_service.timing_stats(),
+            "minimax_resilience": minimax_service.resilience_stats(),
+            "summary_cache": vars(summary_cache.stats()),
+            "summary_flights": vars(summarizer.flight_stats()),
+            "summary_fallbacks": summarizer.fallback_stats(),
+            "summary_prompts": prompt_builder.stats(),
+            "llm_scheduler": llm_scheduler.stats(),
+            "digests": vars(digest_scheduler.stats()),
+            "summary_queue": await job_queue.stats(),
+            "webhook_queue": (
+                vars(webhook_requests_handler.stats()) if config.WEBHOOK_FAST_ACK else None
+            ),
+            "telegram_rate_limit": vars(rate_limiter.stats()) if config.TELEGRAM_RATE_LIMIT else None
+        })
+    
+    metrics_token = config.METRICS_TOKEN or config.WEBHOOK_SECRET
+    if metrics_token:
+        app.router.add_get("/metrics", metrics)
+    else:
+        logger.info("/metrics disabled: set METRICS_TOKEN or WEBHOOK_SECRET to enable it")
     
     # Register webhook handler
     webhook_requests_handler.register(app, path=WEBHOOK_PATH)
@@ -0,0 +1,8 @@
+"""Middlewares package."""
+from app.middlewares.rate_limit import RateLimitMiddleware
+from app.middlewares.request_memo import RequestMemoMiddleware
+
+__all__ = [
+    "RateLimitMiddleware",
+    "RequestMemoMiddleware",
+]
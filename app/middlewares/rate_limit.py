@@ -0,0 +1,194 @@
+"""Pace outgoing Telegram messages to stay within the Bot API limits."""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from app.services.resilience import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Methods that post or change a message count towards the limits
+_LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+
+
+@dataclass
+class RateLimitStats:
+    """Outgoing rate limiter counters."""
+    requests: int = 0  # Rate-limited requests
+    delayed: int = 0
+    total_wait_ms: float = 0.0
+    max_wait_ms: float = 0.0
+    coalesced: int = 0  # Edits folded into a newer pending edit of the same message
+    flood_waits: int = 0
+    retries: int = 0
+    chats: int = 0
+
+
+@dataclass(eq=False)
+class _PendingEdit:
+    method: TelegramMethod
+    result: asyncio.Future
+    followers: int = 0
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Hold outgoing messages to a global and a per-chat token bucket.
+
+    Telegram allows about 30 messages a second overall, 20 a minute in a
+    group and one a second in a private chat, and answers anything faster
+    with a flood-control error. Requests that would exceed a bucket wait
+    for their turn instead; a flood-control reply still pauses the chat
+    (or everything, for chat-less requests) for the time Telegram asks and
+    the request is retried, up to `max_retries` times and only for waits
+    of at most `max_retry_after` seconds.
+
+    An edit waiting for its turn is replaced by a newer edit of the same
+    message: only the latest text is sent, and both callers get its
+    result. Edits of one message are sent one at a time, in order.
+    """
+
+    def __init__(
+        self,
+        global_rate: float = 30.0,
+        group_per_minute: float = 20.0,
+        private_rate: float = 1.0,
+        chat_burst: float = 3.0,
+        max_retries: int = 2,
+        max_retry_after: float = 60.0,
+        max_chats: int = 10000
+    ):
+        self.group_rate = group_per_minute / 60
+        self.private_rate = private_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: OrderedDict[Union[int, str], TokenBucket] = OrderedDict()
+        self._pending_edits: dict[Hashable, _PendingEdit] = {}
+        self._edit_locks: dict[Hashable, asyncio.Lock] = {}
+        self._stats = RateLimitStats()
+
+    def stats(self) -> RateLimitStats:
+        """Get a snapshot of the limiter counters."""
+        self._stats.chats = len(self._chats)
+        return RateLimitStats(**vars(self._stats))
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        if not method.__api_method__.startswith(_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+
+        self._stats.requests += 1
+        chat_id = getattr(method, "chat_id", None)
+        message_id = getattr(method, "message_id", None)
+        if method.__api_method__.startswith("edit") and chat_id is not None and message_id is not None:
+            return await self._edit(make_request, bot, method, (method.__api_method__, chat_id, message_id))
+
+        await self._wait_turn(chat_id)
+        return await self._send(make_request, bot, method)
+
+    async def _edit(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+        key: Hashable
+    ) -> Response[TelegramType]:
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # Not sent yet: send this text in its place
+            pending.method = method
+            pending.followers += 1
+            self._stats.coalesced += 1
+            return await asyncio.shield(pending.result)
+
+        pending = self._pending_edits[key] = _PendingEdit(method, asyncio.get_running_loop().create_future())
+        lock = self._edit_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                await self._wait_turn(method.chat_id)
+                # From here on, newer edits wait for this one to be sent
+                del self._pending_edits[key]
+                response = await self._send(make_request, bot, pending.method)
+        except BaseException as e:
+            if self._pending_edits.get(key) is pending:
+                del self._pending_edits[key]
+            if pending.followers:
+                if isinstance(e, asyncio.CancelledError):
+                    pending.result.cancel()
+                else:
+                    pending.result.set_exception(e)
+            raise
+        finally:
+            if not lock.locked() and key not in self._pending_edits:
+                self._edit_locks.pop(key, None)
+
+        if pending.followers:
+            pending.result.set_result(response)
+        return response
+
+    async def _send(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        attempt = 0
+        while True:
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                self._stats.flood_waits += 1
+                bucket = self._global if chat_id is None else self._chat_bucket(chat_id)
+                bucket.pause(e.retry_after)
+                if attempt >= self.max_retries or e.retry_after > self.max_retry_after:
+                    raise
+                attempt += 1
+                self._stats.retries += 1
+                logger.warning(f"Flood control for chat {chat_id}: retrying {method.__api_method__} in {e.retry_after}s")
+                await self._wait_turn(chat_id)
+
+    async def _wait_turn(self, chat_id: Optional[Union[int, str]]):
+        started = time.perf_counter()
+        if chat_id is not None:
+            # The chat first, so a slow chat does not hold global tokens
+            if delay := self._chat_bucket(chat_id).reserve():
+                await asyncio.sleep(delay)
+        if delay := self._global.reserve():
+            await asyncio.sleep(delay)
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        if wait_ms >= 1:
+            self._stats.delayed += 1
+            self._stats.total_wait_ms += wait_ms
+            self._stats.max_wait_ms = max(self._stats.max_wait_ms, wait_ms)
+
+    def _chat_bucket(self, chat_id: Union[int, str]) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is not None:
+            self._chats.move_to_end(chat_id)
+            return bucket
+
+        # Negative ids and @usernames are groups and channels
+        private = isinstance(chat_id, int) and chat_id > 0
+        bucket = TokenBucket(self.private_rate if private else self.group_rate, self.chat_burst)
+        self._chats[chat_id] = bucket
+        if len(self._chats) > self.max_chats:
+            self._chats.popitem(last=False)
+        return bucket
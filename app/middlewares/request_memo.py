@@ -0,0 +1,20 @@
+"""Open a per-update memo scope around handler execution."""
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from app.services.request_memo import request_scope
+
+
+class RequestMemoMiddleware(BaseMiddleware):
+    """Give every update its own memo for cached lookups."""
+    
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any]
+    ) -> Any:
+        with request_scope():
+            return await handler(event, data)
@@ -1,10 +1,38 @@
 """Services package."""
+from app.services.llm_scheduler import llm_scheduler, LLMScheduler, Priority
 from app.services.minimax import minimax_service, MiniMaxService
 from app.services.message_store import message_store, MessageStore
+from app.services.group_cache import group_cache, GroupSettingsCache
+from app.services.entitlements import entitlements, EntitlementIndex
+from app.services.summary_cache import summary_cache, SummaryCache
+from app.services.prompt_builder import prompt_builder, PromptBuilder
+from app.services.map_reduce import map_reduce, MapReduceSummarizer
+from app.services.summarizer import summarizer, Summarizer
+from app.services.digest import digest_scheduler, DigestScheduler
+from app.services.job_queue import job_queue, SummaryJobQueue
 
 __all__ = [
+    "llm_scheduler",
+    "LLMScheduler",
+    "Priority",
     "minimax_service",
     "MiniMaxService",
     "message_store",
     "MessageStore",
+    "group_cache",
+    "GroupSettingsCache",
+    "entitlements",
+    "EntitlementIndex",
+    "summary_cache",
+    "SummaryCache",
+    "prompt_builder",
+    "PromptBuilder",
+    "map_reduce",
+    "MapReduceSummarizer",
+    "summarizer",
+    "Summarizer",
+    "digest_scheduler",
+    "DigestScheduler",
+    "job_queue",
+    "SummaryJobQueue",
 ]
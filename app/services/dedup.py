@@ -0,0 +1,138 @@
+"""Near-duplicate detection for incoming messages (forwards, floods, copy-paste)."""
+import hashlib
+import re
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import NamedTuple, Optional
+
+_CJK = "぀-ヿ㐀-䶿一-鿿가-힯豈-﫿"
+# Single CJK characters, or runs of other letters and digits
+_TERM_RE = re.compile(rf"[{_CJK}]|(?:(?![{_CJK}])[^\W_])+")
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION_RE = re.compile(r"[\s!！.。~～?？]+$")
+
+
+class Signature(NamedTuple):
+    """SimHash of a message, or a hash of its exact text if too short for one."""
+    exact: bool
+    value: int
+
+
+class _Seen(NamedTuple):
+    signature: Signature
+    user_id: int
+    message_id: int
+    ts: int
+
+
+@dataclass
+class DedupStats:
+    """Near-duplicate detector counters."""
+    groups: int = 0
+    checked: int = 0
+    duplicates: int = 0
+
+
+def terms(text: str) -> list[str]:
+    """
+    Every word (and CJK character) of a text, lower-cased.
+
+    Unlike the extractive tokenizer nothing is dropped: "not" or a single
+    digit is exactly the difference between two messages that matter.
+    """
+    return _TERM_RE.findall(text.lower())
+
+
+def simhash(terms: list[str]) -> int:
+    """64-bit SimHash: similar term bags give hashes a few bits apart."""
+    weights = [0] * 64
+    for term in terms:
+        h = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "big")
+        for bit in range(64):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+class DuplicateDetector:
+    """
+    Match messages against a bounded window of each group's recent ones.
+
+    Only messages from the same sender match. Messages with at least
+    `min_terms` terms match when the SimHashes of their words and word
+    pairs differ in at most `max_distance` bits, which leaves room for
+    case, punctuation and emoji but not for a changed or added word;
+    shorter ones only match the same text (ignoring case, spacing and
+    trailing punctuation). Each group keeps its last `window_size` messages
+    from the past `window_ms`, and only the `max_groups` most recently
+    active groups are tracked.
+    """
+
+    def __init__(
+        self,
+        window_size: int = 200,
+        window_ms: int = 600_000,
+        max_distance: int = 3,
+        min_terms: int = 6,
+        max_groups: int = 5000
+    ):
+        self.window_size = window_size
+        self.window_ms = window_ms
+        self.max_distance = max_distance
+        self.min_terms = min_terms
+        self.max_groups = max_groups
+        self._windows: OrderedDict[int, deque[_Seen]] = OrderedDict()
+        self._stats = DedupStats()
+
+    def stats(self) -> DedupStats:
+        """Get a snapshot of the detector counters."""
+        self._stats.groups = len(self._windows)
+        return DedupStats(**vars(self._stats))
+
+    def signature(self, text: str) -> Signature:
+        """Compute the signature of a message text."""
+        words = terms(text)
+        if len(words) >= self.min_terms:
+            # Word pairs make order count: "a b" differs from "b a"
+            return Signature(False, simhash(words + [f"{a} {b}" for a, b in zip(words, words[1:])]))
+        normalised = _TRAILING_PUNCTUATION_RE.sub("", _WHITESPACE_RE.sub(" ", text.strip().lower()))
+        digest = hashlib.blake2b(normalised.encode("utf-8"), digest_size=8).digest()
+        return Signature(True, int.from_bytes(digest, "big"))
+
+    def same(self, a: Signature, b: Signature) -> bool:
+        """Whether two signatures belong to near-identical messages."""
+        if a.exact or b.exact:
+            return a == b
+        return bin(a.value ^ b.value).count("1") <= self.max_distance
+
+    def find(self, group_id: int, user_id: int, signature: Signature, ts: int) -> Optional[int]:
+        """Id of the sender's recent message in the group that this one duplicates."""
+        window = self._windows.get(group_id)
+        if not window:
+            return None
+        for seen in reversed(window):
+            if ts - seen.ts > self.window_ms:
+                break
+            if seen.user_id == user_id and self.same(seen.signature, signature):
+                return seen.message_id
+        return None
+
+    def record(self, duplicate: bool):
+        """Count one checked message and whether it was a duplicate."""
+        self._stats.checked += 1
+        if duplicate:
+            self._stats.duplicates += 1
+
+    def remember(self, group_id: int, user_id: int, signature: Signature, message_id: int, ts: int):
+        """Add a stored message to its group's window."""
+        window = self._windows.get(group_id)
+        if window is None:
+            window = self._windows[group_id] = deque(maxlen=self.window_size)
+            while len(self._windows) > self.max_groups:
+                self._windows.popitem(last=False)
+        else:
+            self._windows.move_to_end(group_id)
+        window.append(_Seen(signature, user_id, message_id, ts))
+
+    def forget(self, group_id: int):
+        """Drop a group's window, e.g. after its messages were cleared."""
+        self._windows.pop(group_id, None)
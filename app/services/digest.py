@@ -0,0 +1,218 @@
+"""Daily group digests, generated off-peak in the background."""
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+
+from app.config import config
+from app.database import async_db
+from app.services.group_cache import group_cache
+from app.services.llm_scheduler import Priority, llm_scheduler
+from app.services.message_store import message_store
+from app.services.summarizer import SummaryWindow, summarizer
+
+logger = logging.getLogger(__name__)
+
+# A digest covers at most the last day, however long ago the previous one was
+_DIGEST_SPAN_MS = 24 * 3600 * 1000
+
+
+@dataclass
+class DigestStats:
+    """Digest scheduler counters."""
+    planned: int = 0
+    running: int = 0
+    sent: int = 0
+    skipped: int = 0  # No messages since the group's last digest
+    failed: int = 0
+    retries: int = 0
+
+
+def format_digest(summary: str, scope: str) -> str:
+    """Format a digest post."""
+    return f"📬 每日摘要\n\n{summary}\n\n━━━━━━━━━━━━━━━━━━\n💬 基于{scope}生成"
+
+
+class DigestScheduler:
+    """
+    Post each opted-in group's daily digest during an off-peak window.
+
+    When the window opens, the due groups get slots spread evenly across
+    it, each jittered within its share, so generations never all start at
+    once; groups that opt in later are slotted into what is left of it. At
+    most `concurrency` digests generate at a time, at background priority.
+
+    A digest covers the messages since the group's previous digest, or
+    the last 24 hours if that is more recent; a group with no messages in
+    that window gets no post. A posted digest is also cached as the
+    group's recent /summary, as long as it covers those messages.
+    """
+
+    def __init__(
+        self,
+        start_hour: int = 4,
+        window_hours: float = 3.0,
+        concurrency: int = 2,
+        poll_interval: float = 60.0,
+        retry_delay: float = 600.0
+    ):
+        self.start_hour = start_hour
+        self.window_hours = window_hours
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        # Group id -> epoch seconds its digest is due, for the current window
+        self._plan: dict[int, float] = {}
+        self._plan_window = 0.0
+        self._jobs: dict[int, asyncio.Task] = {}
+        self._stats = DigestStats()
+
+    def stats(self) -> DigestStats:
+        """Get a snapshot of the scheduler counters."""
+        self._stats.planned = len(self._plan)
+        self._stats.running = len(self._jobs)
+        return DigestStats(**vars(self._stats))
+
+    def window(self, now: datetime) -> tuple[datetime, datetime]:
+        """The off-peak window that `now` is in, or the last one before it."""
+        start = now.replace(hour=self.start_hour, minute=0, second=0, microsecond=0)
+        if start > now:
+            start -= timedelta(days=1)
+        return start, start + timedelta(hours=self.window_hours)
+
+    def start(self, bot: Bot):
+        """Start the background scheduler."""
+        self._bot = bot
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop scheduling and cancel digests in progress."""
+        tasks = [task for task in (self._task, *self._jobs.values()) if task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._jobs.clear()
+        self._plan.clear()
+
+    async def _run(self):
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Digest scheduling failed: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def tick(self, now: Optional[float] = None):
+        """Plan newly due groups and start the digests whose time has come."""
+        now = time.time() if now is None else now
+        window_start, window_end = self.window(datetime.fromtimestamp(now))
+        start_ts, end_ts = window_start.timestamp(), window_end.timestamp()
+
+        if now >= end_ts:
+            # Digests still planned here wait for the next window
+            self._plan.clear()
+            return
+        if start_ts != self._plan_window:
+            self._plan.clear()
+            self._plan_window = start_ts
+
+        due = await async_db.get_due_digest_groups(int(start_ts * 1000))
+        self._schedule(
+            [g.group_id for g in due if g.group_id not in self._plan and g.group_id not in self._jobs],
+            now,
+            end_ts
+        )
+
+        for group_id, due_at in list(self._plan.items()):
+            if due_at <= now:
+                del self._plan[group_id]
+                task = asyncio.create_task(self._digest(group_id, end_ts))
+                self._jobs[group_id] = task
+                task.add_done_callback(lambda _, group_id=group_id: self._jobs.pop(group_id, None))
+
+    def _schedule(self, group_ids: list[int], start_ts: float, end_ts: float):
+        # Stratified jitter: one random time within each group's equal share
+        if not group_ids:
+            return
+        random.shuffle(group_ids)
+        share = (end_ts - start_ts) / len(group_ids)
+        for i, group_id in enumerate(group_ids):
+            self._plan[group_id] = start_ts + i * share + random.uniform(0, share)
+        logger.info(f"Planned {len(group_ids)} digests before {datetime.fromtimestamp(end_ts):%H:%M}")
+
+    async def _digest(self, group_id: int, window_end: float):
+        async with self._semaphore:
+            try:
+                sent = await self._generate_and_send(group_id)
+            except Exception as e:
+                logger.error(f"Digest for group {group_id} failed: {e}")
+                sent = False
+
+        if not sent:
+            self._stats.failed += 1
+            retry_at = time.time() + self.retry_delay
+            if retry_at < window_end:
+                self._stats.retries += 1
+                self._plan[group_id] = retry_at
+
+    async def _generate_and_send(self, group_id: int) -> bool:
+        """Post one group's digest; False if it should be tried again."""
+        group = await group_cache.get_group(group_id)
+        if group is None or not group.digest_enabled:
+            return True
+
+        await message_store.flush()
+        # Ends at now_ms, which becomes the next digest's start once marked sent
+        now_ms = int(time.time() * 1000)
+        day_ago = now_ms - _DIGEST_SPAN_MS
+        if group.digest_last_at > day_ago:
+            window = SummaryWindow(group.digest_last_at, now_ms, "上次摘要以来")
+        else:
+            window = SummaryWindow(day_ago, now_ms, "过去 24 小时")
+        job = await summarizer.prepare(group_id, window)
+        if not job.records:
+            self._stats.skipped += 1
+            await self._mark_sent(group_id, now_ms)
+            return True
+
+        with llm_scheduler.context(group_id, Priority.BACKGROUND):
+            result = await summarizer.summarize(job, group.language, group.summary_length)
+        if result is None or result.fallback:
+            # Try again later rather than post a stale or extractive digest
+            return False
+
+        # The digest also covers what an interactive /summary would pick now,
+        # so one right after it is served from the cache instead of generated
+        recent = await summarizer.prepare(group_id)
+        if recent.records and recent.records[0].timestamp >= window.start_ms:
+            await summarizer.cache_as(recent, result.text, group.language, group.summary_length)
+
+        try:
+            await self._bot.send_message(group_id, format_digest(result.text, job.scope))
+            self._stats.sent += 1
+        except TelegramAPIError as e:
+            # Typically the bot was removed; do not retry every few minutes
+            logger.warning(f"Could not post digest to group {group_id}: {e}")
+        await self._mark_sent(group_id, now_ms)
+        return True
+
+    async def _mark_sent(self, group_id: int, at_ms: int):
+        await async_db.mark_digest_sent(group_id, at_ms)
+        group_cache.invalidate(group_id)
+
+
+digest_scheduler = DigestScheduler(
+    start_hour=config.DIGEST_WINDOW_START_HOUR,
+    window_hours=config.DIGEST_WINDOW_HOURS,
+    concurrency=config.DIGEST_CONCURRENCY
+)
@@ -0,0 +1,101 @@
+"""In-memory index of paid-user entitlements."""
+import asyncio
+import heapq
+import time
+from dataclasses import dataclass
+
+from app.database import to_epoch_ms, async_db
+
+
+@dataclass
+class EntitlementStats:
+    """Entitlement index counters."""
+    groups_loaded: int = 0
+    entries: int = 0
+    lookups: int = 0
+    evictions: int = 0
+
+
+class EntitlementIndex:
+    """
+    Paid-user expiries keyed by (group_id, user_id), loaded lazily per group.
+    
+    Expiries are held as epoch milliseconds, so a permission check is a dict
+    lookup and an integer compare. A min-heap of expiries drops lapsed
+    entitlements; stale heap entries left behind by renewals are skipped.
+    """
+    
+    def __init__(self):
+        self._expiry: dict[tuple[int, int], int] = {}
+        self._heap: list[tuple[int, int, int]] = []
+        self._loaded: set[int] = set()
+        self._locks: dict[int, asyncio.Lock] = {}
+        self._stats = EntitlementStats()
+    
+    def stats(self) -> EntitlementStats:
+        """Get a snapshot of the index counters."""
+        self._stats.groups_loaded = len(self._loaded)
+        self._stats.entries = len(self._expiry)
+        return EntitlementStats(**vars(self._stats))
+    
+    def _lock(self, group_id: int) -> asyncio.Lock:
+        lock = self._locks.get(group_id)
+        if lock is None:
+            lock = self._locks[group_id] = asyncio.Lock()
+        return lock
+    
+    def _set(self, group_id: int, user_id: int, expires_at: int):
+        self._expiry[(group_id, user_id)] = expires_at
+        heapq.heappush(self._heap, (expires_at, group_id, user_id))
+    
+    def _evict_expired(self, now: int):
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, group_id, user_id = heapq.heappop(self._heap)
+            # Only evict if the entry wasn't renewed since this heap item was pushed
+            if self._expiry.get((group_id, user_id)) == expires_at:
+                del self._expiry[(group_id, user_id)]
+                self._stats.evictions += 1
+    
+    async def _ensure_loaded(self, group_id: int):
+        if group_id in self._loaded:
+            return
+        async with self._lock(group_id):
+            if group_id in self._loaded:
+                return
+            for paid_user in await async_db.get_paid_users(group_id):
+                self._set(group_id, paid_user.user_id, paid_user.expire_at)
+            self._loaded.add(group_id)
+    
+    async def is_paid_user(self, user_id: int, group_id: int) -> bool:
+        """Check if user is paid and not expired."""
+        await self._ensure_loaded(group_id)
+        self._stats.lookups += 1
+        now = int(time.time() * 1000)
+        self._evict_expired(now)
+        expires_at = self._expiry.get((group_id, user_id))
+        return expires_at is not None and expires_at > now
+    
+    async def add_paid_user(self, user_id: int, user_name: str, group_id: int, expire_date: str) -> bool:
+        """Add or renew a paid user and update the index."""
+        async with self._lock(group_id):
+            added = await async_db.add_paid_user(user_id, user_name, group_id, expire_date)
+            if added and group_id in self._loaded:
+                self._set(group_id, user_id, to_epoch_ms(expire_date))
+            return added
+    
+    async def remove_paid_user(self, user_id: int, group_id: int) -> bool:
+        """Remove a paid user and drop it from the index."""
+        async with self._lock(group_id):
+            removed = await async_db.remove_paid_user(user_id, group_id)
+            # Any heap item left behind no longer matches and is skipped
+            self._expiry.pop((group_id, user_id), None)
+            return removed
+    
+    def invalidate(self, group_id: int):
+        """Forget a group so it is reloaded on next use."""
+        self._loaded.discard(group_id)
+        for key in [key for key in self._expiry if key[0] == group_id]:
+            del self._expiry[key]
+
+
+entitlements = EntitlementIndex()
@@ -0,0 +1,152 @@
+"""Fast local extractive summaries: pick the messages that matter most."""
+import html
+import math
+import re
+from collections import Counter
+from typing import Sequence
+
+from app.services.prompt_builder import estimate_tokens, is_trivial
+from app.services.tail_cache import TailRecord
+
+# Runs of CJK characters (tokenised as character bigrams) or Latin/digit words
+_TOKEN_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]+|[a-z0-9_]+")
+_CJK_START = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+
+_STOPWORDS = frozenset(
+    "the a an and or but is are was were be to of in on at for with it this that "
+    "i you he she we they my your me not do does did so just".split()
+)
+
+# Messages shorter than this many terms are scored down proportionally
+_FULL_LENGTH_TERMS = 8
+
+
+def tokenize(text: str) -> list[str]:
+    """Latin words plus character bigrams of CJK runs (single characters kept)."""
+    terms: list[str] = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if _CJK_START.match(run):
+            if len(run) == 1:
+                terms.append(run)
+            else:
+                terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        elif len(run) > 1 and run not in _STOPWORDS:
+            terms.append(run)
+    return terms
+
+
+def _normalise(vector: dict[str, float]) -> dict[str, float]:
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    if not norm:
+        return vector
+    return {term: w / norm for term, w in vector.items()}
+
+
+def cosine(a: dict[str, float], b: dict[str, float]) -> float:
+    """Cosine similarity of two normalised sparse vectors."""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(term, 0.0) for term, w in a.items())
+
+
+def tfidf_vectors(counts: Sequence[Counter]) -> list[dict[str, float]]:
+    """Normalised TF-IDF vectors of term counts, IDF taken over the same documents."""
+    document_frequency: Counter[str] = Counter()
+    for terms in counts:
+        document_frequency.update(terms.keys())
+
+    n = len(counts)
+    idf = {term: math.log((n + 1) / (df + 1)) + 1.0 for term, df in document_frequency.items()}
+    return [_normalise({term: tf * idf[term] for term, tf in terms.items()}) for terms in counts]
+
+
+class ExtractiveSummarizer:
+    """
+    Score messages by TF-IDF similarity to the conversation's centroid.
+
+    Messages that share the most distinctive vocabulary with the rest of
+    the chat score highest; trivial replies score zero and very short
+    messages are scored down. Selection for highlights uses maximal
+    marginal relevance so near-identical messages are not all picked.
+    """
+
+    def __init__(self, diversity: float = 0.3):
+        self.diversity = diversity
+
+    def score(self, records: Sequence[TailRecord]) -> tuple[list[float], list[dict[str, float]]]:
+        """Salience per record, plus the normalised TF-IDF vectors."""
+        counts = [Counter(tokenize(r.text)) for r in records]
+        vectors = tfidf_vectors(counts)
+
+        centroid: dict[str, float] = {}
+        for vector in vectors:
+            for term, w in vector.items():
+                centroid[term] = centroid.get(term, 0.0) + w
+        centroid = _normalise(centroid)
+
+        scores = []
+        for record, terms, vector in zip(records, counts, vectors):
+            if not terms or is_trivial(record.text):
+                scores.append(0.0)
+                continue
+            length_factor = min(1.0, sum(terms.values()) / _FULL_LENGTH_TERMS)
+            scores.append(cosine(vector, centroid) * length_factor)
+        return scores, vectors
+
+    def highlights(self, records: Sequence[TailRecord], limit: int = 8) -> list[TailRecord]:
+        """The `limit` most salient, mutually distinct messages, in chat order."""
+        if not records:
+            return []
+        scores, vectors = self.score(records)
+
+        candidates = [i for i, score in enumerate(scores) if score > 0]
+        if not candidates:
+            # Nothing but reactions; fall back to the longest messages
+            candidates = sorted(range(len(records)), key=lambda i: len(records[i].text), reverse=True)
+            return sorted((records[i] for i in candidates[:limit]), key=lambda r: r.id)
+
+        selected: list[int] = []
+        # Highest similarity of each candidate to anything already selected
+        redundancy = {i: 0.0 for i in candidates}
+        while redundancy and len(selected) < limit:
+            best = max(
+                redundancy,
+                key=lambda i: (1 - self.diversity) * scores[i] - self.diversity * redundancy[i]
+            )
+            selected.append(best)
+            del redundancy[best]
+            for i in redundancy:
+                redundancy[i] = max(redundancy[i], cosine(vectors[i], vectors[best]))
+
+        return [records[i] for i in sorted(selected)]
+
+    def prefilter(self, records: Sequence[TailRecord], max_tokens: int) -> list[TailRecord]:
+        """Keep the most salient messages that fit max_tokens, in chat order."""
+        total = sum(estimate_tokens(r.text) for r in records)
+        if total <= max_tokens:
+            return list(records)
+
+        scores, _ = self.score(records)
+        kept: list[int] = []
+        used = 0
+        for i in sorted(range(len(records)), key=lambda i: scores[i], reverse=True):
+            tokens = estimate_tokens(records[i].text)
+            if used + tokens > max_tokens:
+                continue
+            kept.append(i)
+            used += tokens
+        return [records[i] for i in sorted(kept)]
+
+
+def format_highlights(records: Sequence[TailRecord], max_chars: int = 200) -> str:
+    """Bullet list of messages, each cut to max_chars, escaped for HTML parse mode."""
+    lines = []
+    for record in records:
+        text = record.text.strip().replace("\n", " ")
+        if len(text) > max_chars:
+            text = text[:max_chars] + "…"
+        lines.append(f"• {html.escape(record.user_name)}: {html.escape(text)}")
+    return "\n".join(lines)
+
+
+extractive_summarizer = ExtractiveSummarizer()
@@ -0,0 +1,93 @@
+"""Read-through cache for group settings."""
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from app.config import config
+from app.database import GroupSettings, async_db
+from app.services.request_memo import get_request_memo
+
+# Cached "not registered" results use this as their value
+_MISSING = object()
+
+
+@dataclass
+class GroupCacheStats:
+    """Group cache counters."""
+    entries: int = 0
+    hits: int = 0
+    misses: int = 0
+    memo_hits: int = 0
+    invalidations: int = 0
+
+
+class GroupSettingsCache:
+    """
+    Cache GroupSettings by group id in front of the database.
+    
+    Writes through this cache invalidate the affected entry; the TTL only
+    guards against changes made outside this process. Inside a request
+    scope every lookup is additionally memoised so one update never loads
+    the same group twice.
+    """
+    
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._entries: dict[int, tuple[float, object]] = {}
+        self._stats = GroupCacheStats()
+    
+    def stats(self) -> GroupCacheStats:
+        """Get a snapshot of the cache counters."""
+        self._stats.entries = len(self._entries)
+        return GroupCacheStats(**vars(self._stats))
+    
+    async def get_group(self, group_id: int) -> Optional[GroupSettings]:
+        """Get group settings, loading them on a miss."""
+        memo = get_request_memo()
+        memo_key = ("group", group_id)
+        if memo is not None and memo_key in memo:
+            self._stats.memo_hits += 1
+            return memo[memo_key]
+        
+        entry = self._entries.get(group_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self._stats.hits += 1
+            value = entry[1]
+            group = None if value is _MISSING else value
+        else:
+            self._stats.misses += 1
+            group = await async_db.get_group(group_id)
+            self._entries[group_id] = (time.monotonic(), _MISSING if group is None else group)
+        
+        if memo is not None:
+            memo[memo_key] = group
+        return group
+    
+    async def is_group_owner(self, group_id: int, user_id: int) -> bool:
+        """Check if user is group owner."""
+        group = await self.get_group(group_id)
+        return group is not None and group.owner_id == user_id
+    
+    async def add_group(self, group_id: int, group_name: str, owner_id: int) -> GroupSettings:
+        """Add or update a group and cache the stored settings."""
+        self.invalidate(group_id)
+        group = await async_db.add_group(group_id, group_name, owner_id)
+        self._entries[group_id] = (time.monotonic(), _MISSING if group is None else group)
+        return group
+    
+    async def update_group_settings(self, group_id: int, **kwargs) -> bool:
+        """Update group settings and drop the cached copy."""
+        updated = await async_db.update_group_settings(group_id, **kwargs)
+        self.invalidate(group_id)
+        return updated
+    
+    def invalidate(self, group_id: int):
+        """Forget a group in the cache and in the current request memo."""
+        self._stats.invalidations += 1
+        self._entries.pop(group_id, None)
+        memo = get_request_memo()
+        if memo is not None:
+            memo.pop(("group", group_id), None)
+
+
+group_cache = GroupSettingsCache(ttl=config.GROUP_CACHE_TTL)
@@ -0,0 +1,73 @@
+"""Persistent queue of summary jobs shared by the bot and its workers."""
+import time
+from typing import Optional
+
+from app.config import config
+from app.database import QueuedJob, async_db
+from app.services.llm_scheduler import Priority
+
+
+class SummaryJobQueue:
+    """
+    Queue summary work in SQLite and lease it to worker processes.
+
+    A claimed job is leased for `lease_seconds`; the worker extends the
+    lease while it works, and a job whose lease runs out (its worker
+    crashed or was restarted) is claimed again by another. A job that fails
+    is retried after `retry_delay` seconds, up to `max_attempts` claims in
+    all. Finished jobs are kept for `retention_hours`.
+    """
+
+    def __init__(
+        self,
+        lease_seconds: float = 120.0,
+        max_attempts: int = 3,
+        retry_delay: float = 10.0,
+        retention_hours: float = 24.0
+    ):
+        self.lease_ms = int(lease_seconds * 1000)
+        self.max_attempts = max_attempts
+        self.retry_delay_ms = int(retry_delay * 1000)
+        self.retention_ms = int(retention_hours * 3600 * 1000)
+
+    async def enqueue(self, group_id: int, payload: dict, priority: Priority) -> int:
+        """Queue a job; returns its id."""
+        return await async_db.enqueue_job(group_id, payload, int(priority), self.max_attempts)
+
+    async def claim(self, owner: str) -> Optional[QueuedJob]:
+        """Lease the most urgent available job to `owner`, if there is one."""
+        jobs = await async_db.claim_jobs(owner, 1, self.lease_ms)
+        return jobs[0] if jobs else None
+
+    async def heartbeat(self, job: QueuedJob) -> bool:
+        """Extend a held lease; False if the job was lost to another worker."""
+        return await async_db.extend_job_lease(job.id, job.lease_owner, self.lease_ms)
+
+    async def ack(self, job: QueuedJob) -> bool:
+        """Mark a job done."""
+        return await async_db.ack_job(job.id, job.lease_owner)
+
+    async def fail(self, job: QueuedJob, error: str) -> bool:
+        """Record a failed attempt; returns True if the job will be retried."""
+        retry = job.attempts < job.max_attempts
+        retry_at = int(time.time() * 1000) + self.retry_delay_ms if retry else None
+        await async_db.fail_job(job.id, job.lease_owner, error, retry_at)
+        return retry
+
+    async def release(self, job: QueuedJob):
+        """Give a job back without using up an attempt."""
+        await async_db.release_job(job.id, job.lease_owner)
+
+    async def purge(self) -> int:
+        """Delete finished jobs past the retention period."""
+        return await async_db.purge_jobs(int(time.time() * 1000) - self.retention_ms)
+
+    async def stats(self) -> dict:
+        """Jobs per status and the wait of the oldest available one."""
+        return await async_db.job_queue_counts()
+
+
+job_queue = SummaryJobQueue(
+    lease_seconds=config.JOB_LEASE_SECONDS,
+    max_attempts=config.JOB_MAX_ATTEMPTS
+)
@@ -0,0 +1,274 @@
+"""Global scheduler that orders and bounds concurrent LLM calls."""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional
+
+from app.config import config
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    """Request classes, most important first."""
+    OWNER = 0
+    PAID = 1
+    FREE = 2
+    BACKGROUND = 3  # Scheduled work nobody is waiting for
+
+
+# Share of the slots each class gets while several have calls waiting:
+# owner, paid, free and background calls go out 8:4:2:1, so every class
+# keeps moving however busy the ones above it are
+_WEIGHTS = {Priority.OWNER: 8.0, Priority.PAID: 4.0, Priority.FREE: 2.0, Priority.BACKGROUND: 1.0}
+
+# Called with the 1-based queue position while a call waits for a slot
+QueueCallback = Callable[[int], Awaitable[None]]
+
+
+@dataclass
+class SchedulingContext:
+    """Who the LLM calls made in the current context are for."""
+    group_id: int = 0
+    priority: Priority = Priority.FREE
+    on_queue: Optional[QueueCallback] = None
+
+
+_context: ContextVar[SchedulingContext] = ContextVar("llm_scheduling_context", default=SchedulingContext())
+
+
+@dataclass
+class ClassStats:
+    """Queue wait counters for one priority class."""
+    queued: int = 0
+    dispatched: int = 0
+    total_wait_ms: float = 0.0
+    max_wait_ms: float = 0.0
+
+
+@dataclass(order=True)
+class _Waiter:
+    start_tag: float
+    seq: int
+    ctx: SchedulingContext = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    enqueued_at: float = field(compare=False)
+    position: int = field(default=0, compare=False)  # Last one reported to on_queue
+
+
+class LLMScheduler:
+    """
+    Admit at most `max_concurrent` LLM calls at once, in weighted fair order.
+
+    Priority classes share the slots by stride scheduling: while several
+    classes have calls waiting, each gets slots in proportion to its weight,
+    so owner and paid calls overtake free ones already queued from other
+    groups, yet free and background calls still make steady progress under
+    sustained owner load. A class that was idle rejoins at the current pass
+    rather than with credit saved up.
+
+    Within a class, calls are ordered by start-time fair queuing over
+    groups: each call's tag starts where its group's previous call in that
+    class left off, so a group that sends a burst queues behind groups that
+    have been quiet.
+
+    Queue positions are pushed to waiters' on_queue callbacks at most every
+    `notify_interval` seconds, and only to waiters whose position changed.
+    """
+
+    def __init__(self, max_concurrent: int = 8, notify_interval: float = 0.5):
+        self.max_concurrent = max_concurrent
+        self.notify_interval = notify_interval
+        self._in_flight = 0
+        self._queues: dict[Priority, list[_Waiter]] = {priority: [] for priority in Priority}
+        self._seq = itertools.count()
+        # Class level: each class's next pass, and the pass of the last dispatch
+        self._class_pass = {priority: 0.0 for priority in Priority}
+        self._pass = 0.0
+        # Group level, per class: the last dispatched start tag, and each group's next one
+        self._virtual_time = {priority: 0.0 for priority in Priority}
+        self._group_finish: dict[tuple[Priority, int], float] = {}
+        self._stats = {priority: ClassStats() for priority in Priority}
+        self._listeners = 0  # Queued waiters with an on_queue callback
+        self._notifier: Optional[asyncio.Task] = None
+
+    @contextmanager
+    def context(
+        self,
+        group_id: int,
+        priority: Priority,
+        on_queue: Optional[QueueCallback] = None
+    ) -> Iterator[None]:
+        """Attribute LLM calls made inside the block (and tasks it starts)."""
+        token = _context.set(SchedulingContext(group_id, priority, on_queue))
+        try:
+            yield
+        finally:
+            _context.reset(token)
+
+    def stats(self) -> dict:
+        """Concurrency and per-class wait counters."""
+        return {
+            "in_flight": self._in_flight,
+            "queued": self._queued(),
+            "classes": {
+                priority.name.lower(): {
+                    **vars(stats),
+                    "avg_wait_ms": stats.total_wait_ms / stats.dispatched if stats.dispatched else 0.0,
+                }
+                for priority, stats in self._stats.items()
+            },
+        }
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one of the concurrent call slots for the duration of the block."""
+        ctx = _context.get()
+        waiter = self._enqueue(ctx)
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.cancelled():
+                # Still queued; _dispatch() skips it
+                self._stats[ctx.priority].queued -= 1
+                self._forget_listener(waiter)
+                self._schedule_notify()
+            else:
+                # The slot was handed over just as we were cancelled
+                self._release()
+            raise
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    @contextmanager
+    def try_slot(self) -> Iterator[bool]:
+        """Hold a slot for the block if one is free and nobody is queued; yields whether it was."""
+        acquired = self._in_flight < self.max_concurrent and not self._queued()
+        if acquired:
+            self._in_flight += 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self._release()
+
+    def _queued(self) -> int:
+        return sum(stats.queued for stats in self._stats.values())
+
+    def _enqueue(self, ctx: SchedulingContext) -> _Waiter:
+        loop = asyncio.get_running_loop()
+        queue = self._queues[ctx.priority]
+        if not self._stats[ctx.priority].queued:
+            # Idle class: drop cancelled leftovers and rejoin at the current pass
+            queue.clear()
+            self._class_pass[ctx.priority] = max(self._class_pass[ctx.priority], self._pass)
+
+        key = (ctx.priority, ctx.group_id)
+        start_tag = max(self._virtual_time[ctx.priority], self._group_finish.get(key, 0.0))
+        self._group_finish[key] = start_tag + 1.0
+
+        waiter = _Waiter(start_tag, next(self._seq), ctx, loop.create_future(), time.perf_counter())
+        self._stats[ctx.priority].queued += 1
+        if ctx.on_queue is not None:
+            self._listeners += 1
+        heapq.heappush(queue, waiter)
+        self._dispatch()
+        return waiter
+
+    def _release(self):
+        self._in_flight -= 1
+        self._dispatch()
+
+    @staticmethod
+    def _pick_class(passes: dict[Priority, float], waiting: list[Priority]) -> Priority:
+        # Lowest pass after the dispatch, so a heavier class needs less lead;
+        # ties go to the more important class
+        return min(waiting, key=lambda priority: (passes[priority] + 1.0 / _WEIGHTS[priority], priority))
+
+    def _dispatch(self):
+        dispatched = False
+        while self._in_flight < self.max_concurrent:
+            waiting = [priority for priority in Priority if self._stats[priority].queued]
+            if not waiting:
+                break
+            priority = self._pick_class(self._class_pass, waiting)
+            waiter = heapq.heappop(self._queues[priority])
+            if waiter.future.done():
+                # Cancelled while waiting
+                continue
+            self._in_flight += 1
+            self._pass = self._class_pass[priority]
+            self._class_pass[priority] += 1.0 / _WEIGHTS[priority]
+            self._virtual_time[priority] = max(self._virtual_time[priority], waiter.start_tag)
+            self._record_wait(waiter)
+            self._forget_listener(waiter)
+            waiter.future.set_result(None)
+            dispatched = True
+
+        if dispatched:
+            self._prune_groups()
+        self._schedule_notify()
+
+    def _record_wait(self, waiter: _Waiter):
+        wait_ms = (time.perf_counter() - waiter.enqueued_at) * 1000
+        stats = self._stats[waiter.ctx.priority]
+        stats.queued -= 1
+        stats.dispatched += 1
+        stats.total_wait_ms += wait_ms
+        stats.max_wait_ms = max(stats.max_wait_ms, wait_ms)
+
+    def _prune_groups(self):
+        # Groups whose tags fell behind virtual time start afresh anyway
+        if len(self._group_finish) > 1000:
+            self._group_finish = {
+                key: finish for key, finish in self._group_finish.items()
+                if finish > self._virtual_time[key[0]]
+            }
+
+    def _forget_listener(self, waiter: _Waiter):
+        if waiter.ctx.on_queue is not None:
+            self._listeners -= 1
+
+    def _waiting_order(self) -> list[_Waiter]:
+        """Queued calls in the order they would be dispatched if nothing else arrived."""
+        remaining = {
+            priority: sorted(w for w in queue if not w.future.done())
+            for priority, queue in self._queues.items()
+        }
+        passes = dict(self._class_pass)
+        order = []
+        while True:
+            waiting = [priority for priority, queue in remaining.items() if queue]
+            if not waiting:
+                return order
+            priority = self._pick_class(passes, waiting)
+            passes[priority] += 1.0 / _WEIGHTS[priority]
+            order.append(remaining[priority].pop(0))
+
+    def _schedule_notify(self):
+        # One pass per interval however many calls came and went meanwhile
+        if self._listeners and (self._notifier is None or self._notifier.done()):
+            self._notifier = asyncio.create_task(self._notify_positions())
+
+    async def _notify_positions(self):
+        await asyncio.sleep(self.notify_interval)
+        for position, waiter in enumerate(self._waiting_order(), 1):
+            if waiter.ctx.on_queue is None or waiter.position == position:
+                continue
+            waiter.position = position
+            try:
+                await waiter.ctx.on_queue(position)
+            except Exception as e:
+                logger.warning(f"Queue position callback failed: {e}")
+
+
+llm_scheduler = LLMScheduler(max_concurrent=config.LLM_MAX_CONCURRENCY)
@@ -0,0 +1,156 @@
+"""Map-reduce summarisation for windows too long for a single prompt."""
+import asyncio
+import logging
+from typing import Optional, Sequence
+
+from app.config import config
+from app.services.minimax import MiniMaxService, ProgressCallback, minimax_service
+from app.services.prompt_builder import PromptLine, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def chunk_lines(lines: Sequence[PromptLine], max_tokens: int) -> list[list[PromptLine]]:
+    """
+    Split transcript lines into consecutive chunks of at most max_tokens.
+    
+    A single line longer than max_tokens gets a chunk of its own.
+    """
+    chunks: list[list[PromptLine]] = []
+    current: list[PromptLine] = []
+    used = 0
+    for line in lines:
+        if current and used + line.tokens > max_tokens:
+            chunks.append(current)
+            current, used = [], 0
+        current.append(line)
+        used += line.tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class MapReduceSummarizer:
+    """
+    Summarise a long message window in parallel chunks, then merge them.
+    
+    Chunks are summarised concurrently (at most `concurrency` calls at once);
+    retries are left to the service, whose retry policy and circuit breaker
+    only repeat calls that may succeed. Partial summaries are merged
+    oldest-first, in further rounds if they do not fit one prompt.
+    """
+    
+    def __init__(
+        self,
+        service: MiniMaxService = minimax_service,
+        chunk_tokens: int = 6000,
+        concurrency: int = 4
+    ):
+        self.service = service
+        self.chunk_tokens = chunk_tokens
+        self._semaphore = asyncio.Semaphore(concurrency)
+    
+    async def summarize(
+        self,
+        lines: Sequence[PromptLine],
+        language: str = "zh-CN",
+        length: str = "medium",
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[str]:
+        """
+        Summarise a transcript, oldest line first.
+        
+        on_progress follows the call that produces the final text: the only
+        chunk, or the last merge.
+        
+        Returns:
+            The summary, or None if any chunk or merge failed
+        """
+        chunks = chunk_lines(lines, self.chunk_tokens)
+        if not chunks:
+            return None
+        if len(chunks) == 1:
+            return await self._call(
+                self.service.generate_summary_text,
+                "\n".join(line.text for line in chunks[0]),
+                language,
+                length,
+                on_progress
+            )
+        
+        # gather() returns results in argument order, whatever finishes first
+        partials = await asyncio.gather(*(
+            self._call(
+                self.service.generate_summary_text,
+                "\n".join(line.text for line in chunk),
+                language,
+                length
+            )
+            for chunk in chunks
+        ))
+        if any(partial is None for partial in partials):
+            logger.warning(f"Map-reduce: {partials.count(None)}/{len(chunks)} chunks failed")
+            return None
+        
+        return await self._reduce(list(partials), language, length, on_progress)
+    
+    async def _reduce(
+        self,
+        partials: list[str],
+        language: str,
+        length: str,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[str]:
+        while len(partials) > 1:
+            groups = self._group_partials(partials)
+            if len(groups) == 1:
+                return await self._call(self.service.merge_summaries, partials, language, length, on_progress)
+            
+            merged = await asyncio.gather(*(
+                self._call(self.service.merge_summaries, group, language, length)
+                if len(group) > 1 else asyncio.sleep(0, group[0])
+                for group in groups
+            ))
+            if any(summary is None for summary in merged):
+                return None
+            partials = list(merged)
+        return partials[0]
+    
+    def _group_partials(self, partials: list[str]) -> list[list[str]]:
+        # Consecutive runs of partial summaries that fit one merge prompt
+        groups: list[list[str]] = []
+        current: list[str] = []
+        used = 0
+        for partial in partials:
+            tokens = estimate_tokens(partial)
+            if current and used + tokens > self.chunk_tokens:
+                groups.append(current)
+                current, used = [], 0
+            current.append(partial)
+            used += tokens
+        groups.append(current)
+        if len(groups) == len(partials) and len(groups) > 1:
+            # Every summary fills a prompt on its own - pair them up anyway
+            groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+        return groups
+    
+    async def _call(
+        self,
+        fn,
+        payload,
+        language: str,
+        length: str,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[str]:
+        # The service retries what is worth retrying and returns None on failure
+        if self.service.circuit_open:
+            # The call would be refused anyway
+            return None
+        async with self._semaphore:
+            return await fn(payload, language, length, on_progress) or None
+
+
+map_reduce = MapReduceSummarizer(
+    chunk_tokens=config.SUMMARY_CHUNK_TOKENS,
+    concurrency=config.SUMMARY_MAP_CONCURRENCY
+)
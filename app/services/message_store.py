@@ -1,40 +1,213 @@
 """Message store service."""
-from app.database import db
+import logging
+import time
+from typing import AsyncIterator, Optional
 
+from app.config import config
+from app.database import async_db
+from app.services.dedup import DedupStats, DuplicateDetector
+from app.services.retention import RetentionManager
+from app.services.tail_cache import TailCache, TailCacheStats, TailRecord
+from app.services.write_buffer import BufferStats, WriteBehindBuffer
+
+logger = logging.getLogger(__name__)
 
 class MessageStore:
     """Message storage and retrieval."""
-    
+
     # Maximum messages to store per group
     MAX_MESSAGES = 1000
-    
-    # Messages to keep for summary
-    SUMMARY_MESSAGE_LIMIT = 200
-    
-    @staticmethod
-    async def store_message(group_id: int, user_id: int, user_name: str, text: str):
-        """Store a message from the group."""
+
+    # Recent messages offered to the summary prompt builder, which keeps
+    # as many as fit its token budget
+    SUMMARY_MESSAGE_LIMIT = config.SUMMARY_CANDIDATE_MESSAGES
+
+    # Let a group overshoot MAX_MESSAGES by this fraction before trimming
+    TRIM_SLACK = 0.1
+
+    def __init__(self):
+        self.buffer = WriteBehindBuffer(
+            sink=self._write_batch,
+            batch_size=config.INGEST_BATCH_SIZE,
+            flush_interval=config.INGEST_FLUSH_INTERVAL,
+            max_queue=config.INGEST_MAX_QUEUE
+        )
+        self.retention = RetentionManager(MessageStore.MAX_MESSAGES, MessageStore.TRIM_SLACK)
+        self.tail_cache = TailCache(
+            per_group=MessageStore.SUMMARY_MESSAGE_LIMIT,
+            max_bytes=config.TAIL_CACHE_MAX_BYTES
+        )
+        self.dedup = DuplicateDetector(
+            window_size=config.DEDUP_WINDOW_SIZE,
+            window_ms=config.DEDUP_WINDOW_SECONDS * 1000,
+            max_distance=config.DEDUP_MAX_DISTANCE
+        )
+        # Off in processes that do not ingest messages themselves (summary
+        # workers): their cache would never see the other process's writes
+        self.tail_cache_enabled = True
+
+    async def start(self):
+        """Start the background ingestion flusher."""
+        self.buffer.start()
+
+    async def stop(self):
+        """Stop the flusher, writing any buffered messages."""
+        await self.buffer.stop()
+
+    async def flush(self):
+        """Write buffered messages so reads see everything received so far."""
+        await self.buffer.flush()
+
+    def stats(self) -> BufferStats:
+        """Get ingestion buffer stats (queue depth, flush latency)."""
+        return self.buffer.stats()
+
+    def cache_stats(self) -> TailCacheStats:
+        """Get tail cache stats."""
+        return self.tail_cache.stats()
+
+    def dedup_stats(self) -> DedupStats:
+        """Get near-duplicate detector stats."""
+        return self.dedup.stats()
+
+    async def store_message(
+        self,
+        group_id: int,
+        user_id: int,
+        user_name: str,
+        text: str,
+        message_id: int = None,
+        reply_to: int = None
+    ):
+        """Queue a message from the group for storage."""
         if not text or not text.strip():
             return
-        
-        # Store in database
-        db.add_message(group_id, user_id, user_name, text)
-        
-        # Cleanup old messages if needed
-        count = db.get_message_count(group_id)
-        if count > MessageStore.MAX_MESSAGES:
-            # Keep only the most recent messages
-            db.trim_messages(group_id, MessageStore.MAX_MESSAGES)
-    
-    @staticmethod
-    def get_messages_for_summary(group_id: int) -> list[dict]:
-        """Get messages for summary generation."""
-        return db.get_recent_messages(group_id, MessageStore.SUMMARY_MESSAGE_LIMIT)
-    
-    @staticmethod
-    def get_message_count(group_id: int) -> int:
+
+        await self.buffer.put(
+            (group_id, user_id, user_name, text, int(time.time() * 1000), message_id, reply_to)
+        )
+
+    async def _write_batch(self, rows: list[tuple]):
+        """
+        Persist a batch of buffered messages and apply retention.
+
+        Only a failed insert fails the batch (and has the buffer retry it):
+        once the rows are committed, a retry would store them twice, so the
+        bookkeeping after it is best effort.
+        """
+        kept, signatures, repeats = self._collapse_duplicates(rows)
+        ids = await async_db.add_messages([tuple(row) for row in kept])
+        try:
+            await self._after_insert(ids, kept, signatures, repeats)
+        except Exception:
+            logger.exception("Bookkeeping after storing %d messages failed", len(ids))
+            # Reload what may now be out of step from SQLite on next use
+            for group_id in {row[0] for row in rows}:
+                self.tail_cache.invalidate(group_id)
+                self.retention.forget(group_id)
+
+    async def _after_insert(
+        self,
+        ids: list[int],
+        kept: list[list],
+        signatures: list,
+        repeats: dict[tuple[int, int], int]
+    ):
+        # Feed the tail cache, duplicate windows and per-group counters
+        by_group: dict[int, list[TailRecord]] = {}
+        for message_id, signature, row in zip(ids, signatures, kept):
+            group_id, user_id, user_name, text, ts, tg_message_id, reply_to, repeat_count = row
+            if signature is not None:
+                self.dedup.remember(group_id, user_id, signature, message_id, ts)
+            by_group.setdefault(group_id, []).append(
+                TailRecord(message_id, user_name, text, ts, repeat_count, tg_message_id, reply_to)
+            )
+        for group_id, records in by_group.items():
+            self.tail_cache.append(group_id, records)
+            # Trimming only happens past the slack
+            await self.retention.record_inserts(group_id, len(records))
+
+        # Copies of messages stored by earlier batches only bump their count
+        if repeats:
+            await async_db.add_repeat_counts([
+                (extra, message_id) for (_, message_id), extra in repeats.items()
+            ])
+            by_group_repeats: dict[int, dict[int, int]] = {}
+            for (group_id, message_id), extra in repeats.items():
+                by_group_repeats.setdefault(group_id, {})[message_id] = extra
+            for group_id, increments in by_group_repeats.items():
+                self.tail_cache.add_repeats(group_id, increments)
+
+    def _collapse_duplicates(self, rows: list[tuple]):
+        """
+        Split a batch into rows to insert and copies of already stored messages.
+
+        Returns:
+            (rows to insert with a trailing repeat_count, their signatures,
+            {(group_id, message_id): extra_copies} for earlier messages)
+        """
+        kept: list[list] = []
+        signatures: list = []
+        repeats: dict[tuple[int, int], int] = {}
+        if not config.DEDUP_ENABLED:
+            return [[*row, 1] for row in rows], [None] * len(rows), repeats
+
+        for row in rows:
+            group_id, user_id, text, ts = row[0], row[1], row[3], row[4]
+            signature = self.dedup.signature(text)
+
+            # A copy of the sender's row earlier in this batch
+            match = next((
+                i for i in range(len(kept) - 1, -1, -1)
+                if kept[i][0] == group_id and kept[i][1] == user_id
+                and self.dedup.same(signatures[i], signature)
+            ), None)
+            if match is not None:
+                kept[match][-1] += 1
+                self.dedup.record(duplicate=True)
+                continue
+
+            # A copy of a stored message
+            message_id = self.dedup.find(group_id, user_id, signature, ts)
+            self.dedup.record(duplicate=message_id is not None)
+            if message_id is not None:
+                repeats[(group_id, message_id)] = repeats.get((group_id, message_id), 0) + 1
+                continue
+
+            kept.append([*row, 1])
+            signatures.append(signature)
+        return kept, signatures, repeats
+
+    async def get_messages_for_summary(self, group_id: int) -> list[dict]:
+        """Get messages for summary generation, from the tail cache when possible."""
+        limit = MessageStore.SUMMARY_MESSAGE_LIMIT
+        if not self.tail_cache_enabled:
+            return await async_db.get_recent_messages(group_id, limit)
+
+        cached = self.tail_cache.get(group_id, limit)
+        if cached is not None:
+            return cached
+
+        # Miss (cold group or restart): load from SQLite with writes held off,
+        # so no batch lands between the read and the cache fill
+        async with self.buffer.exclusive():
+            messages = await async_db.get_recent_messages(group_id, limit)
+            self.tail_cache.load(group_id, [
+                TailRecord.from_dict(m) for m in messages
+            ])
+        return messages
+
+    def iter_messages_in_window(self, group_id: int, start_ms: int, end_ms: int) -> AsyncIterator[dict]:
+        """Stream stored messages with start_ms <= timestamp < end_ms, oldest first."""
+        return async_db.iter_messages_between(group_id, start_ms, end_ms)
+
+    async def find_message_time(self, group_id: int, message_id: int) -> Optional[int]:
+        """Get the time we received a Telegram message, if it is still stored."""
+        return await async_db.find_message_time(group_id, message_id)
+
+    async def get_message_count(self, group_id: int) -> int:
         """Get total message count."""
-        return db.get_message_count(group_id)
+        return await self.retention.get_count(group_id)
 
 
 message_store = MessageStore()
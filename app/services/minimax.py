@@ -1,10 +1,83 @@
 """MiniMax API service for text generation."""
+import asyncio
 import json
-from typing import Optional
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Iterable, Optional
 
 import aiohttp
 
 from app.config import config
+from app.services.llm_scheduler import llm_scheduler
+from app.services.resilience import (
+    CircuitBreaker,
+    LatencyTracker,
+    PermanentError,
+    ResilienceStats,
+    RetryableError,
+    RetryPolicy,
+    parse_retry_after,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever prompt wording changes, so cached summaries are not reused
+PROMPT_VERSION = 1
+
+# base_resp codes worth retrying: rate limits, then internal errors/timeouts
+_RATE_LIMIT_API_CODES = {1002, 1039}
+_RETRYABLE_API_CODES = _RATE_LIMIT_API_CODES | {1000, 1001, 1013}
+
+# Called with the reply text received so far while a streamed reply arrives
+ProgressCallback = Callable[[str], Awaitable[None]]
+
+
+@dataclass
+class CallTimings:
+    """Latency breakdown of one API call."""
+    started: float = field(default_factory=time.perf_counter)
+    status: int = 0
+    reused_connection: bool = False
+    connect_ms: float = 0.0
+    ttfb_ms: float = 0.0
+    total_ms: float = 0.0
+    streamed: bool = False
+    first_content_ms: float = 0.0
+
+
+async def _on_connection_create_start(session, ctx: SimpleNamespace, params):
+    ctx.connect_started = time.perf_counter()
+
+
+async def _on_connection_create_end(session, ctx: SimpleNamespace, params):
+    timings = ctx.trace_request_ctx
+    if isinstance(timings, CallTimings):
+        timings.connect_ms = (time.perf_counter() - ctx.connect_started) * 1000
+
+
+async def _on_connection_reuseconn(session, ctx: SimpleNamespace, params):
+    timings = ctx.trace_request_ctx
+    if isinstance(timings, CallTimings):
+        timings.reused_connection = True
+
+
+async def _on_request_end(session, ctx: SimpleNamespace, params):
+    # Fires once response headers have arrived
+    timings = ctx.trace_request_ctx
+    if isinstance(timings, CallTimings):
+        timings.ttfb_ms = (time.perf_counter() - timings.started) * 1000
+
+
+def _trace_config() -> aiohttp.TraceConfig:
+    trace = aiohttp.TraceConfig()
+    trace.on_connection_create_start.append(_on_connection_create_start)
+    trace.on_connection_create_end.append(_on_connection_create_end)
+    trace.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace.on_request_end.append(_on_request_end)
+    return trace
 
 
 class MiniMaxService:
@@ -14,12 +87,73 @@ class MiniMaxService:
         self.api_key = config.MINIMAX_API_KEY
         self.group_id = config.MINIMAX_GROUP_ID
         self.base_url = config.MINIMAX_BASE_URL
+        self._session: Optional[aiohttp.ClientSession] = None
+        # Timings of the most recent calls, newest last
+        self.recent_timings: deque[CallTimings] = deque(maxlen=100)
+        self.retry_policy = RetryPolicy(
+            max_attempts=config.MINIMAX_MAX_ATTEMPTS,
+            base_delay=config.MINIMAX_RETRY_BASE_DELAY,
+            max_delay=config.MINIMAX_RETRY_MAX_DELAY
+        )
+        self.breaker = CircuitBreaker(
+            failure_threshold=config.MINIMAX_BREAKER_THRESHOLD,
+            reset_timeout=config.MINIMAX_BREAKER_RESET
+        )
+        self.latency = LatencyTracker()
+        self._resilience = ResilienceStats()
+    
+    async def start(self):
+        """Open the shared HTTP session (keep-alive, DNS cache)."""
+        if self._session is not None and not self._session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=config.MINIMAX_MAX_CONNECTIONS,
+            keepalive_timeout=config.MINIMAX_KEEPALIVE_TIMEOUT,
+            ttl_dns_cache=300,
+            enable_cleanup_closed=True
+        )
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=60),
+            trace_configs=[_trace_config()]
+        )
+    
+    async def close(self):
+        """Close the shared HTTP session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        # Opened lazily when used outside the bot's startup hook
+        if self._session is None or self._session.closed:
+            await self.start()
+        return self._session
+    
+    def timing_stats(self) -> dict:
+        """Summarise recent call timings."""
+        calls = list(self.recent_timings)
+        if not calls:
+            return {"calls": 0}
+        streamed = [t for t in calls if t.streamed and t.first_content_ms]
+        return {
+            "calls": len(calls),
+            "streamed_calls": len(streamed),
+            "reused_connections": sum(1 for t in calls if t.reused_connection),
+            "avg_connect_ms": sum(t.connect_ms for t in calls) / len(calls),
+            "avg_ttfb_ms": sum(t.ttfb_ms for t in calls) / len(calls),
+            "avg_total_ms": sum(t.total_ms for t in calls) / len(calls),
+            "avg_first_content_ms": (
+                sum(t.first_content_ms for t in streamed) / len(streamed) if streamed else 0.0
+            ),
+        }
     
     async def generate_summary(
         self,
-        messages: list[dict],
+        messages: Iterable[dict],
         language: str = "zh-CN",
-        length: str = "medium"
+        length: str = "medium",
+        on_progress: Optional[ProgressCallback] = None
     ) -> Optional[str]:
         """
         Generate a summary of messages using MiniMax API.
@@ -28,10 +162,128 @@ class MiniMaxService:
             messages: List of message dicts with user_name, text, timestamp
             language: Output language (zh-CN, en, etc.)
             length: Summary length (short, medium, long)
+            on_progress: Stream the reply, reporting the text so far
+        
+        Returns:
+            Generated summary text or None on error
+        """
+        # Format messages for the prompt
+        messages_text = "\n".join(self.format_message(msg) for msg in messages)
+        
+        return await self.generate_summary_text(messages_text, language, length, on_progress)
+    
+    @staticmethod
+    def format_message(msg: dict) -> str:
+        """Format one message as a transcript line."""
+        line = f"{msg.get('user_name', '用户')}: {msg.get('text', '')}"
+        if msg.get("repeat_count", 1) > 1:
+            line += f" ×{msg['repeat_count']}"
+        return line
+    
+    async def generate_summary_text(
+        self,
+        messages_text: str,
+        language: str = "zh-CN",
+        length: str = "medium",
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[str]:
+        """
+        Generate a summary of an already formatted transcript.
+        
+        Args:
+            messages_text: Messages as "user_name: text" lines
+            language: Output language (zh-CN, en, etc.)
+            length: Summary length (short, medium, long)
+            on_progress: Stream the reply, reporting the text so far
         
         Returns:
             Generated summary text or None on error
         """
+        user_prompt = f"""群聊消息记录：
+{messages_text}
+
+请生成摘要："""
+        
+        return await self.chat_completion(
+            self._summary_system_prompt(language, length),
+            user_prompt,
+            max_tokens=2048,
+            on_progress=on_progress
+        )
+    
+    async def generate_incremental_summary(
+        self,
+        previous_summary: str,
+        messages_text: str,
+        language: str = "zh-CN",
+        length: str = "medium",
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[str]:
+        """
+        Update an earlier summary with the messages that followed it.
+        
+        Args:
+            previous_summary: Summary covering the messages before the new ones
+            messages_text: New messages as "user_name: text" lines
+            language: Output language (zh-CN, en, etc.)
+            length: Summary length (short, medium, long)
+            on_progress: Stream the reply, reporting the text so far
+        
+        Returns:
+            Updated summary text or None on error
+        """
+        user_prompt = f"""此前的群聊摘要：
+{previous_summary}
+
+之后的新消息：
+{messages_text}
+
+请将新消息的内容整合进摘要，删去已不重要的旧细节，输出更新后的完整摘要："""
+        
+        return await self.chat_completion(
+            self._summary_system_prompt(language, length),
+            user_prompt,
+            max_tokens=2048,
+            on_progress=on_progress
+        )
+    
+    async def merge_summaries(
+        self,
+        partial_summaries: list[str],
+        language: str = "zh-CN",
+        length: str = "medium",
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[str]:
+        """
+        Combine summaries of consecutive parts of a chat into one.
+        
+        Args:
+            partial_summaries: Part summaries, oldest part first
+            language: Output language (zh-CN, en, etc.)
+            length: Summary length (short, medium, long)
+            on_progress: Stream the reply, reporting the text so far
+        
+        Returns:
+            Merged summary text or None on error
+        """
+        parts_text = "\n\n".join(
+            f"第{i}部分：\n{summary}" for i, summary in enumerate(partial_summaries, 1)
+        )
+        
+        user_prompt = f"""以下是同一段群聊按时间顺序分段后的各部分摘要：
+{parts_text}
+
+请合并为一份完整的摘要，去除重复内容并保留时间上的先后关系："""
+        
+        return await self.chat_completion(
+            self._summary_system_prompt(language, length),
+            user_prompt,
+            max_tokens=2048,
+            on_progress=on_progress
+        )
+    
+    @staticmethod
+    def _summary_system_prompt(language: str, length: str) -> str:
         # Build prompt based on length
         length_prompt = {
             "short": "简洁地总结，最多100字",
@@ -39,58 +291,13 @@ class MiniMaxService:
             "long": "详细总结，约400字"
         }.get(length, "中等长度总结，约200字")
         
-        # Format messages for the prompt
-        formatted_messages = []
-        for msg in messages:
-            formatted_messages.append(f"{msg.get('user_name', '用户')}: {msg.get('text', '')}")
-        
-        messages_text = "\n".join(formatted_messages)
-        
-        # Build the prompt
-        system_prompt = f"""你是一个群聊摘要助手。请根据以下群聊消息生成摘要。
+        return f"""你是一个群聊摘要助手。请根据以下群聊消息生成摘要。
 要求：
 1. 使用{language}语言
 2. {length_prompt}
 3. 突出讨论重点和关键结论
 4. 如果有分歧意见也需要指出
 5. 保持客观简洁"""
-
-        user_prompt = f"""群聊消息记录：
-{messages_text}
-
-请生成摘要："""
-        
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/text/chatcompletion_v2",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "abab6.5s-chat",
-                        "group_id": self.group_id,
-                        "messages": [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
-                        "temperature": 0.7,
-                        "max_tokens": 2048
-                    },
-                    timeout=aiohttp.ClientTimeout(total=60)
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        if "choices" in result and len(result["choices"]) > 0:
-                            return result["choices"][0]["message"]["content"]
-                    else:
-                        error_text = await response.text()
-                        print(f"MiniMax API error: {response.status} - {error_text}")
-                        return None
-        except Exception as e:
-            print(f"MiniMax API exception: {e}")
-            return None
     
     async def generate_summary_simple(
         self,
@@ -109,37 +316,267 @@ class MiniMaxService:
         """
         system_prompt = f"""你是一个群聊摘要助手。请简洁地总结群聊内容，使用{language}语言。"""
 
+        return await self.chat_completion(
+            system_prompt,
+            f"请总结以下群聊内容：\n{messages_text}",
+            max_tokens=1024
+        )
+    
+    async def chat_completion(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int = 2048,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[str]:
+        """
+        Run one chat completion over the shared session.
+        
+        Each attempt waits for a slot from the global LLM scheduler, which
+        orders it by the group and priority set with `llm_scheduler.context()`.
+        Rate limits, server errors and timeouts are retried with jittered
+        backoff; while the circuit breaker is open, calls fail fast.
+        
+        With on_progress (and MINIMAX_STREAM on) the reply is streamed and
+        on_progress is awaited with the accumulated text after each chunk.
+        
+        Returns:
+            The reply text or None on error
+        """
+        stats = self._resilience
+        stats.calls += 1
+        streamed = on_progress is not None and config.MINIMAX_STREAM
+        
+        for attempt in range(1, self.retry_policy.max_attempts + 1):
+            if not self.breaker.allow():
+                stats.circuit_rejections += 1
+                break
+            
+            try:
+                async with llm_scheduler.slot():
+                    if config.MINIMAX_HEDGE and not streamed:
+                        text = await self._hedged(system_prompt, user_prompt, max_tokens)
+                    else:
+                        text = await self._complete(system_prompt, user_prompt, max_tokens, on_progress)
+            except RetryableError as e:
+                logger.warning(f"MiniMax call failed (attempt {attempt}): {e}")
+                if self.breaker.record_failure():
+                    stats.circuit_opened += 1
+                    logger.warning("MiniMax circuit breaker opened")
+                if attempt == self.retry_policy.max_attempts:
+                    break
+                stats.retries += 1
+                if e.retry_after is not None:
+                    stats.retry_after_honoured += 1
+                await asyncio.sleep(self.retry_policy.delay(attempt, e.retry_after))
+                continue
+            except PermanentError as e:
+                # The API answered; it is the request that is wrong
+                logger.error(f"MiniMax API error: {e}")
+                self.breaker.record_success()
+                break
+            except asyncio.CancelledError:
+                self.breaker.release_probe()
+                raise
+            
+            self.breaker.record_success()
+            stats.successes += 1
+            return text
+        
+        stats.failures += 1
+        return None
+    
+    @property
+    def circuit_open(self) -> bool:
+        """Whether calls are currently refused by the circuit breaker."""
+        return self.breaker.is_open
+    
+    def resilience_stats(self) -> dict:
+        """Outcome counters plus breaker state and hedging threshold."""
+        hedge_after = self.latency.percentile(0.95)
+        return {
+            **vars(self._resilience),
+            "circuit_state": self.breaker.state,
+            "hedge_after_ms": hedge_after * 1000 if hedge_after is not None else None,
+        }
+    
+    async def _hedged(self, system_prompt: str, user_prompt: str, max_tokens: int) -> str:
+        # Fire a second identical request once the first is slower than p95;
+        # whichever succeeds first wins and the other is cancelled
+        hedge_after = self.latency.percentile(0.95)
+        primary = asyncio.ensure_future(self._complete(system_prompt, user_prompt, max_tokens, None))
+        try:
+            if hedge_after is None:
+                return await primary
+            
+            done, _ = await asyncio.wait({primary}, timeout=hedge_after)
+            if done:
+                return primary.result()
+            
+            # The hedge needs a scheduler slot of its own, and must not take one
+            # from a queued call; without a free slot the primary carries on alone
+            with llm_scheduler.try_slot() as acquired:
+                if not acquired:
+                    self._resilience.hedges_skipped += 1
+                    return await primary
+                
+                self._resilience.hedges_started += 1
+                hedge = asyncio.ensure_future(self._complete(system_prompt, user_prompt, max_tokens, None))
+                pending = {primary, hedge}
+                try:
+                    while True:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            if task.exception() is None:
+                                if task is hedge:
+                                    self._resilience.hedges_won += 1
+                                return task.result()
+                        if not pending:
+                            # Both failed; report the hedge's error
+                            raise hedge.exception()
+                finally:
+                    # Before the hedge's slot is given back
+                    hedge.cancel()
+        finally:
+            # Also when our caller is cancelled: asyncio.wait() leaves the
+            # requests running, and the caller's slot is about to be released
+            primary.cancel()
+    
+    async def _complete(
+        self,
+        system_prompt: str,
+        user_prompt: str,
+        max_tokens: int,
+        on_progress: Optional[ProgressCallback]
+    ) -> str:
+        """
+        Make one request.
+        
+        Raises:
+            RetryableError: Rate limited, server error, timeout or broken reply
+            PermanentError: The request was rejected
+        """
+        stats = self._resilience
+        timings = CallTimings()
+        timings.streamed = on_progress is not None and config.MINIMAX_STREAM
+        session = await self._get_session()
+        
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.base_url}/text/chatcompletion_v2",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "model": "abab6.5s-chat",
-                        "group_id": self.group_id,
-                        "messages": [
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": f"请总结以下群聊内容：\n{messages_text}"}
-                        ],
-                        "temperature": 0.7,
-                        "max_tokens": 1024
-                    },
-                    timeout=aiohttp.ClientTimeout(total=60)
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        if "choices" in result and len(result["choices"]) > 0:
-                            return result["choices"][0]["message"]["content"]
+            async with session.post(
+                f"{self.base_url}/text/chatcompletion_v2",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json={
+                    "model": "abab6.5s-chat",
+                    "group_id": self.group_id,
+                    "messages": [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": user_prompt}
+                    ],
+                    "temperature": 0.7,
+                    "max_tokens": max_tokens,
+                    "stream": timings.streamed
+                },
+                trace_request_ctx=timings
+            ) as response:
+                timings.status = response.status
+                if response.status == 429 or response.status >= 500:
+                    if response.status == 429:
+                        stats.rate_limited += 1
                     else:
-                        error_text = await response.text()
-                        print(f"MiniMax API error: {response.status} - {error_text}")
-                        return None
-        except Exception as e:
-            print(f"MiniMax API exception: {e}")
+                        stats.server_errors += 1
+                    raise RetryableError(
+                        f"HTTP {response.status} - {(await response.text())[:200]}",
+                        retry_after=parse_retry_after(response.headers.get("Retry-After"))
+                    )
+                if response.status != 200:
+                    stats.permanent_errors += 1
+                    raise PermanentError(f"HTTP {response.status} - {(await response.text())[:200]}")
+                
+                if timings.streamed:
+                    text = await self._read_stream(response, timings, on_progress)
+                else:
+                    text = self._reply_text(await response.json(content_type=None))
+        except asyncio.TimeoutError as e:
+            stats.timeouts += 1
+            raise RetryableError("request timed out") from e
+        except aiohttp.ClientError as e:
+            stats.connection_errors += 1
+            raise RetryableError(f"connection error: {e}") from e
+        except ValueError as e:
+            # Malformed JSON body or event
+            stats.server_errors += 1
+            raise RetryableError(f"malformed reply: {e}") from e
+        finally:
+            timings.total_ms = (time.perf_counter() - timings.started) * 1000
+            self.recent_timings.append(timings)
+            logger.info(
+                f"MiniMax call: status={timings.status} reused={timings.reused_connection} "
+                f"connect={timings.connect_ms:.0f}ms ttfb={timings.ttfb_ms:.0f}ms "
+                f"total={timings.total_ms:.0f}ms"
+                + (f" first_content={timings.first_content_ms:.0f}ms" if timings.streamed else "")
+            )
+        
+        if not text:
+            stats.server_errors += 1
+            raise RetryableError("empty reply")
+        self.latency.record(timings.total_ms / 1000)
+        return text
+    
+    def _reply_text(self, payload: dict) -> Optional[str]:
+        # Errors can also come back as HTTP 200 with a non-zero base_resp code
+        base_resp = payload.get("base_resp") or {}
+        code = base_resp.get("status_code", 0)
+        if code in _RETRYABLE_API_CODES:
+            if code in _RATE_LIMIT_API_CODES:
+                self._resilience.rate_limited += 1
+            else:
+                self._resilience.server_errors += 1
+            raise RetryableError(f"API error {code} - {base_resp.get('status_msg', '')}")
+        if code:
+            self._resilience.permanent_errors += 1
+            raise PermanentError(f"API error {code} - {base_resp.get('status_msg', '')}")
+        
+        choices = payload.get("choices")
+        if not choices:
             return None
+        choice = choices[0]
+        return (choice.get("message") or {}).get("content") or (choice.get("delta") or {}).get("content")
+    
+    async def _read_stream(
+        self,
+        response: aiohttp.ClientResponse,
+        timings: CallTimings,
+        on_progress: ProgressCallback
+    ) -> Optional[str]:
+        # Server-sent events: "data: {json}" lines, ending with "data: [DONE]"
+        text = ""
+        async for raw_line in response.content:
+            line = raw_line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            
+            chunk = json.loads(data)
+            if not chunk.get("choices"):
+                # Only an error chunk has no choices; raises if it is one
+                self._reply_text(chunk)
+                continue
+            choice = chunk["choices"][0]
+            delta = (choice.get("delta") or {}).get("content")
+            if delta:
+                if not text:
+                    timings.first_content_ms = (time.perf_counter() - timings.started) * 1000
+                text += delta
+                await on_progress(text)
+            elif choice.get("finish_reason") and (choice.get("message") or {}).get("content"):
+                # The closing chunk repeats the whole reply
+                text = choice["message"]["content"]
+        return text or None
 
 
 # Global service instance
@@ -0,0 +1,236 @@
+"""Turn stored messages into a compact transcript that fits a token budget."""
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import NamedTuple, Optional, Sequence
+
+from app.config import config
+from app.services.tail_cache import TailRecord
+
+# CJK ideographs, kana and hangul are roughly one token per character
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯豈-﫿]")
+
+# Replies that carry no content on their own ("ok", "+1", "哈哈哈", "👍")
+_TRIVIAL_RE = re.compile(
+    r"(?:ok(?:ay)?|k+|\+1|1|yes|yep|no|lol|lmao|thx|thanks|ty|gg|"
+    r"哈+|嗯+|哦+|噢+|啊+|好+的?|好滴|收到|了解|对+|是的?|谢谢|感谢|666+|牛|赞|草|[?？!！。.~～]+)"
+    r"[\s!！.。~～]*",
+    re.IGNORECASE
+)
+# Emoji/sticker-only messages: nothing a word or CJK character could be made of
+_NO_WORDS_RE = re.compile(r"[^\w぀-ヿ㐀-䶿一-鿿가-힯]+")
+
+# Separator between merged messages of one author
+_MERGE_SEPARATOR = " / "
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: one per CJK character, one per 4 other characters."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def is_trivial(text: str) -> bool:
+    """Whether a message is a bare acknowledgement or reaction."""
+    text = text.strip()
+    return bool(_TRIVIAL_RE.fullmatch(text) or _NO_WORDS_RE.fullmatch(text))
+
+
+class PromptLine(NamedTuple):
+    """One transcript line and the stored messages it stands for."""
+    first_id: int
+    last_id: int
+    text: str
+    tokens: int  # Including the newline
+
+
+@dataclass
+class PromptStats:
+    """What building one transcript did."""
+    messages: int = 0
+    messages_used: int = 0
+    raw_tokens: int = 0
+    prompt_tokens: int = 0
+    truncated: int = 0
+    collapsed: int = 0
+    merged: int = 0
+    dropped: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.raw_tokens - self.prompt_tokens
+
+
+@dataclass
+class BuiltPrompt:
+    """Transcript lines, oldest first, plus build stats."""
+    lines: list[PromptLine]
+    stats: PromptStats
+
+    @property
+    def text(self) -> str:
+        return "\n".join(line.text for line in self.lines)
+
+    @property
+    def first_id(self) -> Optional[int]:
+        return self.lines[0].first_id if self.lines else None
+
+
+def _line(first_id: int, last_id: int, text: str) -> PromptLine:
+    return PromptLine(first_id, last_id, text, estimate_tokens(text) + 1)
+
+
+class PromptBuilder:
+    """
+    Build summary transcripts under a token budget.
+
+    - Messages over `max_message_tokens` keep their head and tail with the
+      middle elided; messages stored with repeats get a "×N" suffix.
+    - Runs of `trivial_run` or more trivial replies collapse into one line.
+    - Consecutive messages by the same author merge into one line.
+    - With a budget, lines are kept newest-first until it is spent.
+    """
+
+    def __init__(self, budget_tokens: int = 6000, max_message_tokens: int = 300, trivial_run: int = 2):
+        self.budget_tokens = budget_tokens
+        self.max_message_tokens = max_message_tokens
+        self.trivial_run = trivial_run
+        self._totals = PromptStats()
+        self._builds = 0
+
+    def stats(self) -> dict:
+        """Cumulative counters across all builds."""
+        totals = self._totals
+        return {
+            "builds": self._builds,
+            "messages": totals.messages,
+            "messages_used": totals.messages_used,
+            "raw_tokens": totals.raw_tokens,
+            "prompt_tokens": totals.prompt_tokens,
+            "tokens_saved": totals.tokens_saved,
+            "truncated": totals.truncated,
+            "collapsed": totals.collapsed,
+            "merged": totals.merged,
+            "dropped": totals.dropped,
+        }
+
+    def build(self, records: Sequence[TailRecord], fit: bool = True) -> BuiltPrompt:
+        """
+        Build a transcript of records, oldest first.
+
+        Args:
+            records: Messages, oldest first
+            fit: Drop the oldest lines that do not fit the token budget
+        """
+        stats = PromptStats(messages=len(records))
+        # What sending every copy verbatim would have cost
+        stats.raw_tokens = sum(
+            (estimate_tokens(f"{r.user_name}: {r.text}") + 1) * r.repeat_count for r in records
+        )
+
+        lines = self._compact(records, stats)
+        if fit:
+            lines = self._fit(lines, self.budget_tokens, stats)
+
+        stats.prompt_tokens = sum(line.tokens for line in lines)
+        if lines:
+            first_id = lines[0].first_id
+            stats.messages_used = sum(1 for r in records if r.id >= first_id)
+
+        self._record(stats)
+        return BuiltPrompt(lines, stats)
+
+    def _compact(self, records: Sequence[TailRecord], stats: PromptStats) -> list[PromptLine]:
+        lines: list[PromptLine] = []
+        i = 0
+        while i < len(records):
+            # Collapse a run of trivial replies, whoever sent them
+            j = i
+            while j < len(records) and is_trivial(records[j].text):
+                j += 1
+            if j - i >= self.trivial_run:
+                run = records[i:j]
+                counts: Counter[str] = Counter()
+                for r in run:
+                    counts[r.text.strip()] += r.repeat_count
+                shown = "、".join(
+                    f"{text} ×{n}" if n > 1 else text for text, n in counts.most_common(3)
+                )
+                total = sum(counts.values())
+                lines.append(_line(run[0].id, run[-1].id, f"（{total} 条简短回复：{shown}）"))
+                stats.collapsed += len(run)
+                i = j
+                continue
+
+            # Merge this author's consecutive messages, stopping at a trivial
+            # reply or once the line is as long as one message may be
+            record = records[i]
+            texts = [self._render(record, stats)]
+            merged_tokens = estimate_tokens(texts[0])
+            j = i + 1
+            while (
+                j < len(records)
+                and records[j].user_name == record.user_name
+                and not is_trivial(records[j].text)
+                and merged_tokens < self.max_message_tokens
+            ):
+                texts.append(self._render(records[j], stats))
+                merged_tokens += estimate_tokens(texts[-1])
+                j += 1
+            stats.merged += j - i - 1
+            lines.append(_line(
+                record.id, records[j - 1].id,
+                f"{record.user_name}: {_MERGE_SEPARATOR.join(texts)}"
+            ))
+            i = j
+        return lines
+
+    def _render(self, record: TailRecord, stats: PromptStats) -> str:
+        text = self._truncate(record.text, stats)
+        if record.repeat_count > 1:
+            return f"{text} ×{record.repeat_count}"
+        return text
+
+    def _truncate(self, text: str, stats: PromptStats) -> str:
+        text = text.strip()
+        tokens = estimate_tokens(text)
+        if tokens <= self.max_message_tokens:
+            return text
+
+        # Keep the same share of characters as of tokens, 2/3 head and 1/3 tail
+        keep = max(1, len(text) * self.max_message_tokens // tokens)
+        head, tail = keep * 2 // 3, keep // 3
+        omitted = len(text) - head - tail
+        stats.truncated += 1
+        return f"{text[:head]} …[省略{omitted}字]… {text[len(text) - tail:]}"
+
+    @staticmethod
+    def _fit(lines: list[PromptLine], budget: int, stats: PromptStats) -> list[PromptLine]:
+        # Newest first; always keep at least the newest line
+        used = 0
+        keep = 0
+        for line in reversed(lines):
+            if keep and used + line.tokens > budget:
+                break
+            used += line.tokens
+            keep += 1
+        stats.dropped = len(lines) - keep
+        return lines[len(lines) - keep:]
+
+    def _record(self, stats: PromptStats):
+        self._builds += 1
+        totals = self._totals
+        totals.messages += stats.messages
+        totals.messages_used += stats.messages_used
+        totals.raw_tokens += stats.raw_tokens
+        totals.prompt_tokens += stats.prompt_tokens
+        totals.truncated += stats.truncated
+        totals.collapsed += stats.collapsed
+        totals.merged += stats.merged
+        totals.dropped += stats.dropped
+
+
+prompt_builder = PromptBuilder(
+    budget_tokens=config.SUMMARY_TOKEN_BUDGET,
+    max_message_tokens=config.SUMMARY_MAX_MESSAGE_TOKENS
+)
@@ -0,0 +1,21 @@
+"""Per-update memo shared by services during a single handler run."""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Generator, Optional
+
+_memo: ContextVar[Optional[dict]] = ContextVar("request_memo", default=None)
+
+
+@contextmanager
+def request_scope() -> Generator[dict, None, None]:
+    """Open a fresh memo for the duration of one update."""
+    token = _memo.set({})
+    try:
+        yield _memo.get()
+    finally:
+        _memo.reset(token)
+
+
+def get_request_memo() -> Optional[dict]:
+    """Get the memo of the current update, or None outside a request scope."""
+    return _memo.get()
@@ -0,0 +1,182 @@
+"""Retry, circuit breaker, hedging and rate limiting building blocks for outbound API calls."""
+import random
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional
+
+
+class RetryableError(Exception):
+    """A failed call that may succeed if tried again (429, 5xx, timeouts)."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PermanentError(Exception):
+    """A failed call that would fail the same way again (bad request, auth)."""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds from a Retry-After header; HTTP dates are not used by our APIs."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, never shorter than Retry-After."""
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before retry number `attempt` (1 for the first retry)."""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            return max(retry_after, backoff)
+        return backoff
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing dependency for a while.
+
+    - closed: calls go through; `failure_threshold` consecutive failures
+      open the circuit.
+    - open: calls are refused for `reset_timeout` seconds.
+    - half-open: one probe call is let through; its success closes the
+      circuit, its failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = 0.0
+        self._state = CircuitBreaker.CLOSED
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self._state == CircuitBreaker.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return CircuitBreaker.HALF_OPEN
+        return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls are currently being refused."""
+        state = self.state
+        return state == CircuitBreaker.OPEN or (state == CircuitBreaker.HALF_OPEN and self._probing)
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; claims the probe when half-open."""
+        state = self.state
+        if state == CircuitBreaker.CLOSED:
+            return True
+        if state == CircuitBreaker.HALF_OPEN and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self._failures = 0
+        self._probing = False
+        self._state = CircuitBreaker.CLOSED
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if this opened the circuit."""
+        self._failures += 1
+        if self._probing or (self._state == CircuitBreaker.CLOSED and self._failures >= self.failure_threshold):
+            self._probing = False
+            self._state = CircuitBreaker.OPEN
+            self._opened_at = time.monotonic()
+            return True
+        return False
+
+    def release_probe(self):
+        """Give up the half-open probe without an outcome (e.g. cancelled)."""
+        self._probing = False
+
+
+class TokenBucket:
+    """
+    Allow `rate` calls per second on average, in bursts of up to `capacity`.
+    
+    reserve() hands out tokens on credit and says how long to wait before
+    using one, so callers queue up in order without polling. pause() stops
+    refilling for a while, e.g. after the server asked us to back off.
+    """
+    
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._stamp = time.monotonic()  # Refilled up to here; later while paused
+    
+    def _refill(self, now: float):
+        if now > self._stamp:
+            self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+            self._stamp = now
+    
+    def reserve(self) -> float:
+        """Take a token; returns the seconds to wait before it may be used."""
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens -= 1
+        return max(0.0, self._stamp - now) + max(0.0, -self._tokens) / self.rate
+    
+    def pause(self, seconds: float):
+        """Hand out no fresh tokens for `seconds`."""
+        now = time.monotonic()
+        self._refill(now)
+        self._tokens = min(self._tokens, 0.0)
+        self._stamp = max(self._stamp, now + seconds)
+
+
+class LatencyTracker:
+    """Recent successful call latencies, for the hedging threshold."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque[float] = deque(maxlen=window)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency at the given fraction (e.g. 0.95), once enough samples exist."""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+@dataclass
+class ResilienceStats:
+    """Outcome counters of a resilient client."""
+    calls: int = 0
+    successes: int = 0
+    failures: int = 0
+    retries: int = 0
+    retry_after_honoured: int = 0
+    rate_limited: int = 0
+    server_errors: int = 0
+    timeouts: int = 0
+    connection_errors: int = 0
+    permanent_errors: int = 0
+    circuit_opened: int = 0
+    circuit_rejections: int = 0
+    hedges_started: int = 0
+    hedges_won: int = 0
+    hedges_skipped: int = 0  # No free slot to hedge with
@@ -0,0 +1,55 @@
+"""Per-group message retention."""
+from typing import Optional
+
+from app.database import async_db
+
+
+class RetentionManager:
+    """
+    Keep per-group message counts in memory and trim in amortised batches.
+    
+    The count for a group is loaded from SQLite once and then maintained
+    from inserts. A group is only trimmed back to `max_messages` once it
+    passes `max_messages * (1 + slack)`, so each trim deletes a whole range
+    of old ids and the per-insert cost stays constant.
+    """
+    
+    def __init__(self, max_messages: int, slack: float = 0.1):
+        self.max_messages = max_messages
+        self.trim_threshold = max(max_messages + 1, int(max_messages * (1 + slack)))
+        self._counts: dict[int, int] = {}
+        self.trims = 0
+        self.rows_trimmed = 0
+    
+    async def record_inserts(self, group_id: int, added: int):
+        """Account for `added` newly stored messages and trim if over the threshold."""
+        count = self._counts.get(group_id)
+        if count is None:
+            # First sight of this group - the stored rows already include `added`
+            count = await async_db.get_message_count(group_id)
+        else:
+            count += added
+        
+        if count > self.trim_threshold:
+            deleted = await async_db.trim_messages(group_id, self.max_messages)
+            self.trims += 1
+            self.rows_trimmed += deleted
+            count = max(0, count - deleted)
+        
+        self._counts[group_id] = count
+    
+    async def get_count(self, group_id: int) -> int:
+        """Get the message count for a group, loading it once if unknown."""
+        count = self._counts.get(group_id)
+        if count is None:
+            count = await async_db.get_message_count(group_id)
+            self._counts[group_id] = count
+        return count
+    
+    def cached_count(self, group_id: int) -> Optional[int]:
+        """Get the in-memory count without touching the database."""
+        return self._counts.get(group_id)
+    
+    def forget(self, group_id: int):
+        """Drop the counter so it is reloaded on next use."""
+        self._counts.pop(group_id, None)
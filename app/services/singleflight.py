@@ -0,0 +1,101 @@
+"""Coalesce concurrent identical work onto a single in-flight task."""
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, Hashable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+@dataclass
+class SingleFlightStats:
+    """Single-flight counters."""
+    in_flight: int = 0
+    leaders: int = 0
+    followers: int = 0
+    failures: int = 0
+    timeouts: int = 0
+    abandoned: int = 0
+
+
+class _Flight(Generic[T]):
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[T]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Run at most one task per key; concurrent callers share its result.
+    
+    - The first caller (leader) starts the work as a separate task; later
+      callers (followers) with the same key await that task.
+    - A caller that is cancelled or times out only stops waiting. The task
+      keeps running for the others and is cancelled once nobody waits on it.
+    - If the task raises, every waiter gets the exception, and the key is
+      freed right away so the next call starts fresh.
+    """
+    
+    def __init__(self):
+        self._flights: dict[Hashable, _Flight] = {}
+        self._stats = SingleFlightStats()
+    
+    def stats(self) -> SingleFlightStats:
+        """Get a snapshot of the counters."""
+        self._stats.in_flight = len(self._flights)
+        return SingleFlightStats(**vars(self._stats))
+    
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[T]],
+        timeout: Optional[float] = None
+    ) -> tuple[T, bool]:
+        """
+        Run `fn` or join the in-flight run for `key`.
+        
+        Returns:
+            (result, shared) where shared is True for followers
+        
+        Raises:
+            asyncio.TimeoutError: If the result isn't ready within `timeout`
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.create_task(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._release(key, flight))
+            self._stats.leaders += 1
+        else:
+            self._stats.followers += 1
+        
+        flight.waiters += 1
+        try:
+            result = await asyncio.wait_for(asyncio.shield(flight.task), timeout)
+        except asyncio.TimeoutError:
+            self._stats.timeouts += 1
+            self._leave(flight)
+            raise
+        except asyncio.CancelledError:
+            self._leave(flight)
+            raise
+        except Exception:
+            flight.waiters -= 1
+            raise
+        
+        flight.waiters -= 1
+        return result, shared
+    
+    def _leave(self, flight: _Flight):
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            self._stats.abandoned += 1
+            flight.task.cancel()
+    
+    def _release(self, key: Hashable, flight: _Flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled() and flight.task.exception() is not None:
+            self._stats.failures += 1
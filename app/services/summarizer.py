@@ -0,0 +1,352 @@
+"""Summary generation pipeline shared by commands and background jobs."""
+import asyncio
+import html
+import logging
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from app.config import config
+from app.database import SummaryCheckpoint, async_db
+from app.services.extractive import extractive_summarizer, format_highlights
+from app.services.map_reduce import map_reduce
+from app.services.message_store import message_store
+from app.services.minimax import PROMPT_VERSION, ProgressCallback, minimax_service
+from app.services.prompt_builder import BuiltPrompt, prompt_builder
+from app.services.singleflight import SingleFlight, SingleFlightStats
+from app.services.summary_cache import summary_cache
+from app.services.tail_cache import TailRecord
+from app.services.topics import Topic, topic_segmenter
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SummaryWindow:
+    """Time range of messages to summarise."""
+    start_ms: int
+    end_ms: int
+    label: str
+
+
+@dataclass
+class SummaryJob:
+    """Messages selected for one summary."""
+    group_id: int
+    records: list[TailRecord]
+    scope: str   # Human-readable description, e.g. "最近 200 条消息"
+    window: str  # Stable window descriptor used in cache keys
+    prompt: BuiltPrompt
+    topics: bool = False  # Summarise each topic thread separately
+
+
+@dataclass
+class SummaryResult:
+    """Outcome of a summary request."""
+    text: str
+    from_cache: bool = False
+    shared: bool = False  # Joined another request's in-flight generation
+    fallback: Optional[str] = None  # "cached" or "extractive" while MiniMax is unavailable
+
+
+class Summarizer:
+    """
+    Select messages, then serve summaries from cache or generate them.
+    
+    Identical concurrent requests share one generation, and each group has
+    at most one generation running at a time; a different request for the
+    same group waits its turn and re-checks the cache first.
+    """
+    
+    def __init__(self):
+        self._flights = SingleFlight()
+        self._group_locks: dict[int, asyncio.Lock] = {}
+        self._fallbacks: Counter[str] = Counter()
+        self._topic_slots = asyncio.Semaphore(config.SUMMARY_MAP_CONCURRENCY)
+    
+    def flight_stats(self) -> SingleFlightStats:
+        """Get single-flight counters."""
+        return self._flights.stats()
+    
+    def fallback_stats(self) -> dict:
+        """Get counts of fallback summaries served, by kind."""
+        return {"cached": self._fallbacks["cached"], "extractive": self._fallbacks["extractive"]}
+    
+    async def prepare(
+        self,
+        group_id: int,
+        window: Optional[SummaryWindow] = None,
+        topics: bool = False
+    ) -> SummaryJob:
+        """Collect the messages a summary will cover, optionally split by topic."""
+        if window is None:
+            records = [
+                TailRecord.from_dict(m)
+                for m in await message_store.get_messages_for_summary(group_id)
+            ]
+            # Keep as many recent messages as fit the token budget
+            prompt = prompt_builder.build(records)
+            if prompt.lines:
+                records = [r for r in records if r.id >= prompt.first_id]
+            job = SummaryJob(group_id, records, f"最近 {len(records)} 条消息", "recent", prompt)
+        else:
+            # Stream the window page by page into compact records; all of it is
+            # summarised, in chunks if need be
+            records = [
+                TailRecord.from_dict(m)
+                async for m in message_store.iter_messages_in_window(group_id, window.start_ms, window.end_ms)
+            ]
+            salient = records
+            if config.SUMMARY_PREFILTER_TOKENS:
+                # Only the most salient messages of a long window reach the LLM
+                salient = extractive_summarizer.prefilter(records, config.SUMMARY_PREFILTER_TOKENS)
+            prompt = prompt_builder.build(salient, fit=False)
+            job = SummaryJob(group_id, records, f"{window.label}的 {len(records)} 条消息", window.label, prompt)
+        
+        if topics:
+            job.topics = True
+            job.window = f"{job.window}|topics"
+        
+        stats = prompt.stats
+        logger.info(
+            f"Summary prompt for group {group_id} ({job.window}): "
+            f"{stats.messages_used}/{stats.messages} messages, {stats.prompt_tokens} tokens, "
+            f"{stats.tokens_saved} saved"
+        )
+        return job
+    
+    def cache_key(self, job: SummaryJob, language: str, length: str) -> str:
+        """Cache key for a job with the given output settings."""
+        return summary_cache.make_key(
+            group_id=job.group_id,
+            first_id=job.records[0].id if job.records else 0,
+            newest_id=job.records[-1].id if job.records else 0,
+            count=len(job.records),
+            window=job.window,
+            language=language,
+            summary_length=length,
+            prompt_version=PROMPT_VERSION
+        )
+    
+    async def get_cached(self, job: SummaryJob, language: str, length: str) -> Optional[SummaryResult]:
+        """Get the cached summary of a job without generating one."""
+        cached = await summary_cache.get(self.cache_key(job, language, length))
+        if cached is None:
+            return None
+        return SummaryResult(cached, from_cache=True)
+    
+    async def cache_as(self, job: SummaryJob, text: str, language: str, length: str):
+        """Cache a summary generated for a wider job under this job's key too."""
+        if job.records:
+            await summary_cache.put(self.cache_key(job, language, length), job.group_id, text)
+    
+    async def summarize(
+        self,
+        job: SummaryJob,
+        language: str,
+        length: str,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[SummaryResult]:
+        """
+        Summarise a prepared job, from the cache when possible.
+        
+        on_progress receives the partial text while this call generates the
+        summary itself; a call that joins another's generation gets none.
+        
+        While the MiniMax circuit breaker is open this does not wait for it:
+        it serves the group's last summary, or failing that an extract of
+        the messages themselves, marked as a fallback.
+        
+        Returns:
+            The summary, or None if generation failed
+        
+        Raises:
+            asyncio.TimeoutError: If no result arrived within SUMMARY_WAIT_TIMEOUT
+        """
+        key = self.cache_key(job, language, length)
+        cached = await summary_cache.get(key)
+        if cached is not None:
+            return SummaryResult(cached, from_cache=True)
+        
+        if minimax_service.circuit_open:
+            return await self._fallback(job, language, length)
+        
+        text, shared = await self._flights.do(
+            key,
+            lambda: self._generate(job, key, language, length, on_progress),
+            timeout=config.SUMMARY_WAIT_TIMEOUT
+        )
+        if not text:
+            if minimax_service.circuit_open:
+                return await self._fallback(job, language, length)
+            return None
+        return SummaryResult(text, shared=shared)
+    
+    async def _fallback(self, job: SummaryJob, language: str, length: str) -> SummaryResult:
+        checkpoint = await async_db.get_summary_checkpoint(job.group_id)
+        if (
+            checkpoint is not None
+            and checkpoint.language == language
+            and checkpoint.summary_length == length
+        ):
+            self._fallbacks["cached"] += 1
+            return SummaryResult(checkpoint.summary, fallback="cached")
+        
+        self._fallbacks["extractive"] += 1
+        highlights = extractive_summarizer.highlights(job.records)
+        return SummaryResult(format_highlights(highlights), fallback="extractive")
+    
+    def preview(self, job: SummaryJob, limit: int = 5) -> str:
+        """Key messages of a job, picked locally in milliseconds."""
+        return format_highlights(extractive_summarizer.highlights(job.records, limit), max_chars=80)
+    
+    async def _generate(
+        self,
+        job: SummaryJob,
+        key: str,
+        language: str,
+        length: str,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[str]:
+        lock = self._group_locks.get(job.group_id)
+        if lock is None:
+            lock = self._group_locks[job.group_id] = asyncio.Lock()
+        
+        async with lock:
+            # The run we waited behind may have produced this exact summary
+            cached = await summary_cache.get(key)
+            if cached is not None:
+                return cached
+            
+            if job.topics:
+                text = await self._generate_topics(job, language, length, on_progress)
+            elif job.window != "recent":
+                # Time windows can exceed one prompt; split and merge them
+                text = await map_reduce.summarize(job.prompt.lines, language, length, on_progress)
+            elif config.SUMMARY_INCREMENTAL:
+                text = await self._generate_incremental(job, language, length, on_progress)
+            else:
+                text = await minimax_service.generate_summary_text(job.prompt.text, language, length, on_progress)
+            if text:
+                await summary_cache.put(key, job.group_id, text)
+            return text
+    
+    async def _generate_topics(
+        self,
+        job: SummaryJob,
+        language: str,
+        length: str,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[str]:
+        """
+        Summarise each topic thread briefly and in parallel, then join the
+        sections. A thread whose summary fails shows its key messages.
+        """
+        topics = topic_segmenter.segment(job.records)
+        logger.info(f"Split {len(job.records)} messages of group {job.group_id} into {len(topics)} topics")
+        if len(topics) < 2:
+            # Nothing to split; one summary of the whole transcript
+            return await map_reduce.summarize(job.prompt.lines, language, length, on_progress)
+        
+        sections: list[Optional[str]] = [None] * len(topics)
+        
+        async def summarize_topic(i: int, topic: Topic) -> Optional[str]:
+            async def progress(text: str):
+                sections[i] = text
+                await on_progress(self._format_topics(topics, sections))
+            
+            # Long threads keep their most salient messages
+            records = extractive_summarizer.prefilter(topic.records, config.SUMMARY_TOKEN_BUDGET)
+            async with self._topic_slots:
+                text = await minimax_service.generate_summary(
+                    [r.as_dict() for r in records], language, "short", progress if on_progress else None
+                )
+            sections[i] = text
+            return text
+        
+        results = await asyncio.gather(*(summarize_topic(i, topic) for i, topic in enumerate(topics)))
+        if not any(results):
+            return None
+        
+        for i, (topic, text) in enumerate(zip(topics, results)):
+            if not text:
+                sections[i] = format_highlights(extractive_summarizer.highlights(topic.records, 3), max_chars=120)
+        return self._format_topics(topics, sections)
+    
+    @staticmethod
+    def _format_topics(topics: list[Topic], sections: list[Optional[str]]) -> str:
+        parts = []
+        for number, (topic, text) in enumerate(zip(topics, sections), 1):
+            start = datetime.fromtimestamp(topic.records[0].timestamp / 1000)
+            end = datetime.fromtimestamp(topic.records[-1].timestamp / 1000)
+            time_format = "%H:%M" if start.date() == end.date() else "%m-%d %H:%M"
+            # Names are user input; the reply is sent in HTML parse mode
+            people = "、".join(html.escape(name) for name in topic.participants())
+            if len(topic.participants(4)) > 3:
+                people += " 等"
+            title = "其他" if topic.other else f"话题 {number}"
+            parts.append(
+                f"🧵 {title}（{topic.size} 条，{start.strftime(time_format)}–{end.strftime(time_format)}，{people}）\n"
+                f"{text or '…'}"
+            )
+        return "\n\n".join(parts)
+    
+    async def _generate_incremental(
+        self,
+        job: SummaryJob,
+        language: str,
+        length: str,
+        on_progress: Optional[ProgressCallback] = None
+    ) -> Optional[str]:
+        """
+        Extend the group's running summary with only the messages after it.
+        
+        Falls back to a full rebuild when there is no usable checkpoint: the
+        settings or prompt changed, the chain of updates got too long, or so
+        much happened that the checkpoint no longer overlaps the window.
+        """
+        newest_id = job.records[-1].id
+        checkpoint = await async_db.get_summary_checkpoint(job.group_id)
+        
+        usable = (
+            checkpoint is not None
+            and checkpoint.language == language
+            and checkpoint.summary_length == length
+            and checkpoint.prompt_version == PROMPT_VERSION
+            and checkpoint.chain_length < config.SUMMARY_MAX_CHAIN
+            and job.records[0].id <= checkpoint.last_message_id <= newest_id
+        )
+        
+        if usable and checkpoint.last_message_id == newest_id:
+            # Nothing new since the checkpoint
+            return checkpoint.summary
+        
+        if usable:
+            new_records = [r for r in job.records if r.id > checkpoint.last_message_id]
+            text = await minimax_service.generate_incremental_summary(
+                previous_summary=checkpoint.summary,
+                messages_text=prompt_builder.build(new_records).text,
+                language=language,
+                length=length,
+                on_progress=on_progress
+            )
+            chain_length = checkpoint.chain_length + 1
+        else:
+            text = await minimax_service.generate_summary_text(job.prompt.text, language, length, on_progress)
+            chain_length = 0
+        
+        if text:
+            await async_db.save_summary_checkpoint(SummaryCheckpoint(
+                group_id=job.group_id,
+                summary=text,
+                last_message_id=newest_id,
+                language=language,
+                summary_length=length,
+                prompt_version=PROMPT_VERSION,
+                chain_length=chain_length
+            ))
+        return text
+
+
+summarizer = Summarizer()
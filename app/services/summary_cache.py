@@ -0,0 +1,105 @@
+"""Content-addressed cache of generated summaries."""
+import hashlib
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from app.config import config
+from app.database import async_db
+
+
+@dataclass
+class SummaryCacheStats:
+    """Summary cache counters."""
+    entries: int = 0
+    hits: int = 0
+    persistent_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class SummaryCache:
+    """
+    LRU + TTL cache of summaries keyed by the exact input that produced them.
+    
+    The key covers the group, the message range (first/newest id and count),
+    the window, the output settings and the prompt version, so any new
+    message or settings change yields a new key and stale entries simply
+    age out. With `persistent` set, entries are also written to SQLite and
+    survive restarts.
+    """
+    
+    def __init__(self, max_entries: int = 512, ttl: float = 3600.0, persistent: bool = False):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.persistent = persistent
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._stats = SummaryCacheStats()
+    
+    @staticmethod
+    def make_key(
+        group_id: int,
+        first_id: int,
+        newest_id: int,
+        count: int,
+        window: str,
+        language: str,
+        summary_length: str,
+        prompt_version: int
+    ) -> str:
+        """Build the cache key for one summary input."""
+        raw = f"{group_id}|{first_id}|{newest_id}|{count}|{window}|{language}|{summary_length}|{prompt_version}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    
+    def stats(self) -> SummaryCacheStats:
+        """Get a snapshot of the cache counters."""
+        self._stats.entries = len(self._entries)
+        return SummaryCacheStats(**vars(self._stats))
+    
+    async def get(self, key: str) -> Optional[str]:
+        """Get a cached summary, checking SQLite after a memory miss."""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if time.monotonic() - entry[0] < self.ttl:
+                self._entries.move_to_end(key)
+                self._stats.hits += 1
+                return entry[1]
+            del self._entries[key]
+        
+        if self.persistent:
+            min_created_at = int((time.time() - self.ttl) * 1000)
+            summary = await async_db.get_cached_summary(key, min_created_at)
+            if summary is not None:
+                self._stats.persistent_hits += 1
+                self._remember(key, summary)
+                return summary
+        
+        self._stats.misses += 1
+        return None
+    
+    async def put(self, key: str, group_id: int, summary: str):
+        """Cache a freshly generated summary."""
+        self._remember(key, summary)
+        if self.persistent:
+            await async_db.put_cached_summary(key, group_id, summary)
+    
+    async def prune(self) -> int:
+        """Drop expired entries from the persistent tier."""
+        if not self.persistent:
+            return 0
+        return await async_db.prune_cached_summaries(int((time.time() - self.ttl) * 1000))
+    
+    def _remember(self, key: str, summary: str):
+        self._entries[key] = (time.monotonic(), summary)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats.evictions += 1
+
+
+summary_cache = SummaryCache(
+    max_entries=config.SUMMARY_CACHE_SIZE,
+    ttl=config.SUMMARY_CACHE_TTL,
+    persistent=config.SUMMARY_CACHE_PERSISTENT
+)
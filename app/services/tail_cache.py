@@ -0,0 +1,168 @@
+"""In-memory cache of the most recent messages per group."""
+import sys
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Iterable, NamedTuple, Optional
+
+# Rough per-record overhead (tuple, deque slot, ints) on top of the strings
+_RECORD_OVERHEAD = 120
+
+
+class TailRecord(NamedTuple):
+    """Compact cached message."""
+    id: int
+    user_name: str
+    text: str
+    timestamp: int  # epoch milliseconds
+    repeat_count: int = 1  # Near-duplicate copies collapsed into this message
+    tg_message_id: Optional[int] = None
+    reply_to: Optional[int] = None  # Telegram message_id this one replied to
+
+    @classmethod
+    def from_dict(cls, message: dict) -> "TailRecord":
+        return cls(
+            message["id"],
+            message["user_name"],
+            message["text"],
+            message["timestamp"],
+            message.get("repeat_count", 1),
+            message.get("tg_message_id"),
+            message.get("reply_to")
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "user_name": self.user_name,
+            "text": self.text,
+            "timestamp": self.timestamp,
+            "repeat_count": self.repeat_count,
+            "tg_message_id": self.tg_message_id,
+            "reply_to": self.reply_to
+        }
+
+
+def _record_size(record: TailRecord) -> int:
+    return sys.getsizeof(record.user_name) + sys.getsizeof(record.text) + _RECORD_OVERHEAD
+
+
+class _GroupTail:
+    """Tail of one group plus its accounted size."""
+
+    __slots__ = ("records", "complete", "size")
+
+    def __init__(self, maxlen: int, complete: bool):
+        self.records: deque[TailRecord] = deque(maxlen=maxlen)
+        # True once the tail is known to hold every recent message, i.e. it
+        # was loaded from SQLite rather than started mid-stream after a restart
+        self.complete = complete
+        self.size = 0
+
+
+@dataclass
+class TailCacheStats:
+    """Tail cache counters."""
+    groups: int = 0
+    bytes: int = 0
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+
+class TailCache:
+    """
+    Bounded per-group tail of recent messages with LRU eviction.
+
+    Each group keeps at most `per_group` records. When the total estimated
+    size passes `max_bytes`, least recently used groups are evicted whole.
+    """
+
+    def __init__(self, per_group: int, max_bytes: int):
+        self.per_group = per_group
+        self.max_bytes = max_bytes
+        self._groups: OrderedDict[int, _GroupTail] = OrderedDict()
+        self._bytes = 0
+        self._stats = TailCacheStats()
+
+    def stats(self) -> TailCacheStats:
+        """Get a snapshot of the cache counters."""
+        self._stats.groups = len(self._groups)
+        self._stats.bytes = self._bytes
+        return TailCacheStats(**vars(self._stats))
+
+    def append(self, group_id: int, records: Iterable[TailRecord]):
+        """Append newly stored messages to a group's tail."""
+        tail = self._groups.get(group_id)
+        if tail is None:
+            tail = self._groups[group_id] = _GroupTail(self.per_group, complete=False)
+        else:
+            self._groups.move_to_end(group_id)
+
+        for record in records:
+            if len(tail.records) == tail.records.maxlen:
+                dropped = tail.records[0]
+                tail.size -= _record_size(dropped)
+                self._bytes -= _record_size(dropped)
+            tail.records.append(record)
+            size = _record_size(record)
+            tail.size += size
+            self._bytes += size
+
+        # A full tail holds the newest per_group messages regardless of history
+        if len(tail.records) == tail.records.maxlen:
+            tail.complete = True
+
+        self._evict(keep=group_id)
+
+    def load(self, group_id: int, records: Iterable[TailRecord]):
+        """Replace a group's tail with rows loaded from the database."""
+        self.invalidate(group_id)
+        tail = self._groups[group_id] = _GroupTail(self.per_group, complete=True)
+        for record in records:
+            tail.records.append(record)
+        tail.size = sum(_record_size(r) for r in tail.records)
+        self._bytes += tail.size
+        self._evict(keep=group_id)
+
+    def get(self, group_id: int, limit: int) -> Optional[list[dict]]:
+        """Get up to `limit` most recent messages, or None if the tail can't answer."""
+        tail = self._groups.get(group_id)
+        if tail is None or limit > self.per_group or not (tail.complete or len(tail.records) >= limit):
+            self._stats.misses += 1
+            return None
+
+        self._groups.move_to_end(group_id)
+        self._stats.hits += 1
+        start = max(0, len(tail.records) - limit)
+        return [tail.records[i].as_dict() for i in range(start, len(tail.records))]
+
+    def add_repeats(self, group_id: int, increments: dict[int, int]):
+        """Add extra copies to cached messages, given {message_id: extra_copies}."""
+        tail = self._groups.get(group_id)
+        if tail is None:
+            return
+        remaining = dict(increments)
+        # Duplicates match recent messages, so search from the newest end
+        for i in range(len(tail.records) - 1, -1, -1):
+            if not remaining:
+                break
+            record = tail.records[i]
+            extra = remaining.pop(record.id, 0)
+            if extra:
+                tail.records[i] = record._replace(repeat_count=record.repeat_count + extra)
+
+    def invalidate(self, group_id: int):
+        """Drop a group's tail."""
+        tail = self._groups.pop(group_id, None)
+        if tail is not None:
+            self._bytes -= tail.size
+
+    def _evict(self, keep: int):
+        while self._bytes > self.max_bytes and len(self._groups) > 1:
+            group_id, tail = next(iter(self._groups.items()))
+            if group_id == keep:
+                self._groups.move_to_end(group_id)
+                continue
+            del self._groups[group_id]
+            self._bytes -= tail.size
+            self._stats.evictions += 1
@@ -0,0 +1,157 @@
+"""Split a conversation into topic threads before summarising it."""
+import math
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+from app.config import config
+from app.services.extractive import cosine, tfidf_vectors, tokenize
+from app.services.prompt_builder import is_trivial
+from app.services.tail_cache import TailRecord
+
+# Messages with fewer terms than this carry too little to compare by content
+_MIN_TERMS = 3
+
+# Bonus towards a thread whose latest message is by the same author
+_SAME_AUTHOR_BONUS = 0.08
+
+
+@dataclass
+class Topic:
+    """A thread of messages about one subject, oldest first."""
+    records: list[TailRecord]
+    other: bool = False  # Pooled small threads rather than one subject
+
+    @property
+    def size(self) -> int:
+        """Messages in the thread, counting collapsed repeats."""
+        return sum(r.repeat_count for r in self.records)
+
+    def participants(self, limit: int = 3) -> list[str]:
+        """The most active authors, most active first."""
+        counts = Counter(r.user_name for r in self.records)
+        return [name for name, _ in counts.most_common(limit)]
+
+
+@dataclass(eq=False)
+class _Thread:
+    records: list[TailRecord] = field(default_factory=list)
+    centroid: dict[str, float] = field(default_factory=dict)
+    norm: float = 0.0
+
+    def add(self, record: TailRecord, vector: dict[str, float]):
+        self.records.append(record)
+        for term, w in vector.items():
+            self.centroid[term] = self.centroid.get(term, 0.0) + w
+        self.norm = math.sqrt(sum(w * w for w in self.centroid.values()))
+
+    def similarity(self, vector: dict[str, float]) -> float:
+        if not self.norm:
+            return 0.0
+        return cosine(vector, self.centroid) / self.norm
+
+
+class TopicSegmenter:
+    """
+    Group messages into threads in a single pass, oldest first.
+
+    - A reply joins the thread of the message it replies to.
+    - Other messages join the open thread whose TF-IDF centroid they are
+      most similar to, with similarity decaying over the time since the
+      thread's last message, if that beats `similarity`.
+    - Short or trivial messages follow the most recently active thread.
+    - A thread closes after `max_gap_ms` without messages.
+
+    Threads smaller than `min_size` are pooled into one "other" topic, as
+    are all but the `max_topics` largest.
+    """
+
+    def __init__(
+        self,
+        max_topics: int = 5,
+        max_gap_ms: int = 1_800_000,
+        similarity: float = 0.12,
+        min_size: int = 3
+    ):
+        self.max_topics = max_topics
+        self.max_gap_ms = max_gap_ms
+        self.similarity = similarity
+        self.min_size = min_size
+
+    def segment(self, records: Sequence[TailRecord]) -> list[Topic]:
+        """Topics in order of their first message, any "other" topic last."""
+        counts = [Counter(tokenize(r.text)) for r in records]
+        vectors = tfidf_vectors(counts)
+
+        threads: list[_Thread] = []
+        open_threads: list[_Thread] = []
+        thread_of: dict[int, _Thread] = {}  # By Telegram message_id
+        latest: Optional[_Thread] = None
+        for record, terms, vector in zip(records, counts, vectors):
+            open_threads = [
+                t for t in open_threads if record.timestamp - t.records[-1].timestamp <= self.max_gap_ms
+            ]
+            thread = self._choose(record, terms, vector, open_threads, thread_of, latest)
+            if thread is None:
+                thread = _Thread()
+                threads.append(thread)
+            if thread not in open_threads:
+                open_threads.append(thread)
+            thread.add(record, vector)
+            if record.tg_message_id is not None:
+                thread_of[record.tg_message_id] = thread
+            latest = thread
+
+        return self._finalise(threads)
+
+    def _choose(
+        self,
+        record: TailRecord,
+        terms: Counter,
+        vector: dict[str, float],
+        open_threads: list[_Thread],
+        thread_of: dict[int, _Thread],
+        latest: Optional[_Thread]
+    ) -> Optional[_Thread]:
+        # An explicit reply is the strongest signal, however old the thread
+        if record.reply_to is not None and record.reply_to in thread_of:
+            return thread_of[record.reply_to]
+
+        if not open_threads:
+            return None
+
+        if sum(terms.values()) < _MIN_TERMS or is_trivial(record.text):
+            return latest if latest in open_threads else None
+
+        best, best_score = None, self.similarity
+        for thread in open_threads:
+            gap = record.timestamp - thread.records[-1].timestamp
+            score = thread.similarity(vector) * (1 - gap / (2 * self.max_gap_ms))
+            if thread.records[-1].user_name == record.user_name:
+                score += _SAME_AUTHOR_BONUS
+            if score > best_score:
+                best, best_score = thread, score
+        return best
+
+    def _finalise(self, threads: list[_Thread]) -> list[Topic]:
+        topics = [Topic(t.records) for t in threads]
+        ranked = sorted(topics, key=lambda t: t.size, reverse=True)
+        kept = [t for t in ranked[:self.max_topics] if t.size >= self.min_size]
+        if len(kept) < len(topics) and len(kept) == self.max_topics:
+            # The "other" topic takes the smallest one's slot
+            kept.pop()
+        kept_ids = {id(t) for t in kept}
+        pooled = [t for t in topics if id(t) not in kept_ids]
+
+        kept.sort(key=lambda t: t.records[0].id)
+        if pooled:
+            records = sorted((r for t in pooled for r in t.records), key=lambda r: r.id)
+            kept.append(Topic(records, other=True))
+        return kept
+
+
+topic_segmenter = TopicSegmenter(
+    max_topics=config.SUMMARY_TOPIC_MAX,
+    max_gap_ms=config.SUMMARY_TOPIC_GAP_MINUTES * 60_000,
+    similarity=config.SUMMARY_TOPIC_SIMILARITY
+)
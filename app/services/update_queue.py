@@ -0,0 +1,171 @@
+"""Bounded per-chat queues of incoming updates served by a worker pool."""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UpdateQueueStats:
+    """Update queue counters."""
+    pending: int = 0
+    chats: int = 0
+    busy_workers: int = 0
+    accepted: int = 0
+    processed: int = 0
+    errors: int = 0
+    shed: int = 0      # Dropped to make room (or instead of queueing)
+    rejected: int = 0  # Refused; the sender should redeliver later
+    max_pending: int = 0
+    total_wait_ms: float = 0.0
+    max_wait_ms: float = 0.0
+
+
+class _Entry(NamedTuple):
+    item: Any
+    sheddable: bool
+    enqueued_at: float
+
+
+class KeyedUpdateQueue:
+    """
+    Process items in order per key (chat), and different keys in parallel.
+
+    Each key has its own queue of at most `per_key` items; `workers` tasks
+    take turns over the keys with pending items, one item per turn, so a
+    busy chat cannot starve the others and no key is ever handled by two
+    workers at once.
+
+    Load shedding, once `max_pending` items wait in total or a key's queue
+    is full:
+    - a sheddable item (e.g. a plain group message) is dropped;
+    - otherwise the oldest sheddable item of the same key is dropped to
+      make room, and failing that the item is rejected so the sender can
+      redeliver it later.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], Awaitable[None]],
+        workers: int = 32,
+        per_key: int = 100,
+        max_pending: int = 5000
+    ):
+        self.handler = handler
+        self.workers = workers
+        self.per_key = per_key
+        self.max_pending = max_pending
+        self._queues: dict[Hashable, deque[_Entry]] = {}
+        # Keys with pending items that no worker holds, in turn order
+        self._ready: Optional[asyncio.Queue] = None
+        self._tasks: list[asyncio.Task] = []
+        self._pending = 0
+        self._busy = 0
+        self._stats = UpdateQueueStats()
+
+    def stats(self) -> UpdateQueueStats:
+        """Get a snapshot of the queue counters."""
+        self._stats.pending = self._pending
+        self._stats.chats = len(self._queues)
+        self._stats.busy_workers = self._busy
+        return UpdateQueueStats(**vars(self._stats))
+
+    def start(self):
+        """Start the worker pool."""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        # Keys queued before start() still need their turn
+        for key in self._queues:
+            self._ready.put_nowait(key)
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    async def stop(self, timeout: float = 10.0):
+        """Wait up to `timeout` seconds for pending items, then stop the workers."""
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._busy) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._pending:
+            logger.warning(f"Update queue stopped with {self._pending} items unprocessed")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, key: Hashable, item: Any, sheddable: bool = False) -> bool:
+        """
+        Queue an item behind the key's earlier ones.
+
+        Returns:
+            False if the item was rejected and should be redelivered later;
+            True if it was queued, or deliberately shed
+        """
+        queue = self._queues.get(key)
+        full = self._pending >= self.max_pending or (queue is not None and len(queue) >= self.per_key)
+        if full:
+            if sheddable:
+                self._count_shed()
+                return True
+            if not self._evict_sheddable(queue):
+                self._stats.rejected += 1
+                return False
+
+        if queue is None:
+            queue = self._queues[key] = deque()
+            if self._ready is not None:
+                self._ready.put_nowait(key)
+        queue.append(_Entry(item, sheddable, time.perf_counter()))
+        self._pending += 1
+        self._stats.accepted += 1
+        self._stats.max_pending = max(self._stats.max_pending, self._pending)
+        return True
+
+    def _evict_sheddable(self, queue: Optional[deque]) -> bool:
+        # Only the same key's items may go, or another chat would lose
+        # updates for this one's burst
+        if not queue:
+            return False
+        for i, entry in enumerate(queue):
+            if entry.sheddable:
+                del queue[i]
+                self._pending -= 1
+                self._count_shed()
+                return True
+        return False
+
+    def _count_shed(self):
+        self._stats.shed += 1
+        if self._stats.shed % 100 == 1:
+            # Once per hundred, or an overload would flood the log too
+            logger.warning(f"Update queue full: {self._stats.shed} updates shed so far")
+
+    async def _work(self):
+        while True:
+            key = await self._ready.get()
+            queue = self._queues[key]
+            entry = queue.popleft()
+            self._pending -= 1
+            self._busy += 1
+            self._record_wait(entry)
+            try:
+                await self.handler(entry.item)
+                self._stats.processed += 1
+            except Exception as e:
+                self._stats.errors += 1
+                logger.error(f"Update handling failed for {key}: {e}")
+            finally:
+                self._busy -= 1
+                if queue:
+                    # Back of the line, behind the other waiting keys
+                    self._ready.put_nowait(key)
+                else:
+                    del self._queues[key]
+
+    def _record_wait(self, entry: _Entry):
+        wait_ms = (time.perf_counter() - entry.enqueued_at) * 1000
+        self._stats.total_wait_ms += wait_ms
+        self._stats.max_wait_ms = max(self._stats.max_wait_ms, wait_ms)
@@ -0,0 +1,199 @@
+"""Write-behind buffer for batched message ingestion."""
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Queued by stop() to let the flusher finish its current batch and exit
+_STOP = object()
+
+
+@dataclass
+class BufferStats:
+    """Write buffer counters."""
+    queue_depth: int = 0
+    flushes: int = 0
+    rows_written: int = 0
+    failed_flushes: int = 0
+    dropped_rows: int = 0  # Given up on after repeated failed flushes
+    last_batch_size: int = 0
+    last_flush_ms: float = 0.0
+    max_flush_ms: float = 0.0
+
+
+class WriteBehindBuffer:
+    """
+    Collect rows in an asyncio queue and hand them to a sink in batches.
+
+    A background flusher task drains the queue whenever `batch_size` rows
+    are pending or `flush_interval` seconds have passed since the first
+    pending row, whichever comes first.
+
+    A batch the sink fails to write goes back to the front of the buffer
+    and is retried with exponential backoff; only after `max_retries`
+    failed retries in a row is it dropped. The sink must therefore only
+    raise when nothing of the batch was written.
+    """
+
+    def __init__(
+        self,
+        sink: Callable[[list[Any]], Awaitable[None]],
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        max_retries: int = 5,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 10.0
+    ):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # Rows the flusher has taken off the queue but not written yet
+        self._pending: list[Any] = []
+        self._lock = asyncio.Lock()
+        # Failed flushes in a row of the batch at the front of _pending
+        self._failures = 0
+        self._task: Optional[asyncio.Task] = None
+        self._stats = BufferStats()
+
+    @property
+    def lock(self) -> asyncio.Lock:
+        """Lock held while a batch is being written."""
+        return self._lock
+
+    @property
+    def running(self) -> bool:
+        """Whether the flusher task is active."""
+        return self._task is not None and not self._task.done()
+
+    def stats(self) -> BufferStats:
+        """Get a snapshot of the buffer counters."""
+        self._stats.queue_depth = self._queue.qsize() + len(self._pending)
+        return BufferStats(**vars(self._stats))
+
+    async def put(self, row: Any):
+        """Queue a row for writing."""
+        if not self.running:
+            # No flusher (e.g. scripts or tests) - write through
+            async with self._lock:
+                self._pending.append(row)
+                await self._drain_locked()
+            return
+        await self._queue.put(row)
+
+    def start(self):
+        """Start the background flusher."""
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flusher and write everything still queued."""
+        if self.running:
+            await self._queue.put(_STOP)
+            await self._task
+        self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Write all currently queued rows immediately."""
+        async with self._lock:
+            await self._drain_locked()
+
+    @asynccontextmanager
+    async def exclusive(self) -> AsyncIterator[None]:
+        """Flush queued rows and hold off further writes for the duration of the block."""
+        async with self._lock:
+            await self._drain_locked()
+            yield
+
+    async def _drain_locked(self):
+        # The flusher may keep collecting into _pending while we write, so
+        # pick it up again on every pass until both it and the queue are empty
+        stop_seen = False
+        while self._pending or (not stop_seen and not self._queue.empty()):
+            batch, self._pending = self._pending, []
+            while len(batch) < self.batch_size and not stop_seen and not self._queue.empty():
+                row = self._queue.get_nowait()
+                if row is _STOP:
+                    stop_seen = True
+                else:
+                    batch.append(row)
+            if not await self._write_locked(batch):
+                await asyncio.sleep(self._retry_delay())
+
+        if stop_seen:
+            # Leave the stop marker for the flusher
+            self._queue.put_nowait(_STOP)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            if not self._pending:
+                first = await self._queue.get()
+                if first is _STOP:
+                    return
+                self._pending.append(first)
+            deadline = loop.time() + self.flush_interval
+
+            while len(self._pending) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                self._pending.append(row)
+
+            async with self._lock:
+                # flush() may already have written these while we waited
+                batch, self._pending = self._pending, []
+                written = await self._write_locked(batch)
+            if not written:
+                await asyncio.sleep(self._retry_delay())
+
+    def _retry_delay(self) -> float:
+        return min(self.retry_max_delay, self.retry_base_delay * 2 ** (self._failures - 1))
+
+    async def _write_locked(self, batch: list[Any]) -> bool:
+        """Write a batch; False if it was put back to be retried."""
+        if not batch:
+            return True
+
+        started = time.perf_counter()
+        try:
+            await self.sink(batch)
+        except Exception:
+            self._stats.failed_flushes += 1
+            self._failures += 1
+            if self._failures > self.max_retries:
+                self._failures = 0
+                self._stats.dropped_rows += len(batch)
+                logger.exception("Dropping %d buffered rows after %d failed flushes", len(batch), self.max_retries + 1)
+                return True
+            logger.exception("Failed to flush %d buffered rows, will retry", len(batch))
+            # Ahead of anything collected since, so rows keep their order
+            self._pending[:0] = batch
+            return False
+
+        self._failures = 0
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self._stats.flushes += 1
+        self._stats.rows_written += len(batch)
+        self._stats.last_batch_size = len(batch)
+        self._stats.last_flush_ms = elapsed_ms
+        self._stats.max_flush_ms = max(self._stats.max_flush_ms, elapsed_ms)
+        return True
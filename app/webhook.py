@@ -0,0 +1,98 @@
+"""Webhook request handler that acknowledges updates before processing them."""
+import logging
+from typing import Any
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler
+
+from app.services.update_queue import KeyedUpdateQueue, UpdateQueueStats
+
+logger = logging.getLogger(__name__)
+
+# Update fields whose payload carries the chat it belongs to
+_CHAT_UPDATE_FIELDS = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "my_chat_member", "chat_member", "chat_join_request", "message_reaction"
+)
+
+
+def update_chat_id(update: dict) -> int:
+    """Chat an update belongs to, or its sender for chat-less updates (0 if neither)."""
+    for field in _CHAT_UPDATE_FIELDS:
+        if chat := update.get(field, {}).get("chat"):
+            return chat["id"]
+    if callback := update.get("callback_query"):
+        if message := callback.get("message"):
+            return message["chat"]["id"]
+        return callback["from"]["id"]
+    for payload in update.values():
+        if isinstance(payload, dict) and "from" in payload:
+            return payload["from"]["id"]
+    return 0
+
+
+def is_sheddable(update: dict) -> bool:
+    """Whether an update may be dropped under load: group chatter, not commands or buttons."""
+    message = update.get("message") or update.get("edited_message")
+    if message is None:
+        return False
+    text = message.get("text") or message.get("caption") or ""
+    return message["chat"]["type"] in ("group", "supergroup") and not text.startswith("/")
+
+
+class FastAckRequestHandler(SimpleRequestHandler):
+    """
+    Answer Telegram at once and process updates from per-chat queues.
+
+    Updates of one chat are handled in the order they arrived while chats
+    run in parallel on a bounded worker pool, so a command sees every
+    message sent before it. Handlers must therefore return quickly and
+    hand long work (summary generation) to a task of its own. When the
+    queues are full, plain group messages are shed; other updates get a
+    503 so Telegram redelivers them later instead of this process piling
+    up tasks.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret_token: str = None,
+        workers: int = 32,
+        per_chat: int = 100,
+        max_pending: int = 5000,
+        **data: Any
+    ):
+        super().__init__(dispatcher, bot, secret_token=secret_token, **data)
+        self.queue = KeyedUpdateQueue(self._process, workers=workers, per_key=per_chat, max_pending=max_pending)
+
+    def stats(self) -> UpdateQueueStats:
+        """Get the update queue counters."""
+        return self.queue.stats()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Queue the update behind its chat's earlier ones and answer at once."""
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+
+        update = await request.json(loads=bot.session.json_loads)
+        self.queue.start()
+        if not self.queue.submit(update_chat_id(update), update, sheddable=is_sheddable(update)):
+            return web.Response(status=503, text="Busy")
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
+
+    async def _process(self, update: dict):
+        result = await self.dispatcher.feed_raw_update(self.bot, update, **self.data)
+        # A handler may answer with a method instead of calling it
+        if isinstance(result, TelegramMethod):
+            await self.dispatcher.silent_call_request(self.bot, result)
+
+    async def close(self):
+        """Finish queued updates, then close the bot session."""
+        await self.queue.stop()
+        await super().close()
@@ -0,0 +1,198 @@
+"""Summary worker entry point: run queued /summary jobs outside the bot process.
+
+Start with `python -m app.worker` alongside a bot running with SUMMARY_QUEUE=true.
+"""
+import asyncio
+import logging
+import os
+import signal
+import socket
+from functools import partial
+
+# Load environment variables from .env file if it exists
+if os.path.exists(".env"):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from aiogram.exceptions import TelegramAPIError
+
+from app.config import config
+from app.database import QueuedJob, async_db
+from app.handlers.summary import show_summary, stream_summary
+from app.middlewares import RateLimitMiddleware
+from app.services.job_queue import job_queue
+from app.services.llm_scheduler import Priority
+from app.services.message_store import message_store
+from app.services.minimax import minimax_service
+from app.services.summarizer import SummaryWindow, summarizer
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+# How often finished jobs are purged from the queue table
+_PURGE_INTERVAL = 3600.0
+
+
+class SummaryWorker:
+    """
+    Run up to `concurrency` queued summary jobs at a time.
+
+    Each slot claims one job, keeps its lease alive while the summary is
+    generated, and acks the job once the user's processing message shows
+    the result. Stopping hands jobs in progress back to the queue, so
+    another worker picks them up straight away.
+    """
+
+    def __init__(self, bot: Bot, concurrency: int = 4, poll_interval: float = 1.0):
+        self.bot = bot
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def run(self):
+        """Process jobs until cancelled."""
+        await asyncio.gather(
+            self._purge_finished(),
+            *(self._slot(f"{self.worker_id}:{i}") for i in range(self.concurrency))
+        )
+
+    async def _slot(self, owner: str):
+        while True:
+            claim = asyncio.ensure_future(job_queue.claim(owner))
+            try:
+                job = await asyncio.shield(claim)
+            except asyncio.CancelledError:
+                # Stopped mid-claim: the lease may already be ours
+                job = await claim
+                if job is not None:
+                    await job_queue.release(job)
+                raise
+            except Exception as e:
+                logger.error(f"Claiming a summary job failed: {e}")
+                job = None
+            if job is None:
+                await asyncio.sleep(self.poll_interval)
+                continue
+            await self._process(job)
+
+    async def _process(self, job: QueuedJob):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            if job.attempts > job.max_attempts:
+                # Workers kept dying on this one; give up on it
+                await job_queue.fail(job, "lease expired on every attempt")
+                await self._edit(job, "❌ 生成摘要失败，请稍后重试")
+                return
+            await self._run_job(job)
+            await job_queue.ack(job)
+        except asyncio.CancelledError:
+            await job_queue.release(job)
+            raise
+        except Exception as e:
+            logger.error(f"Summary job {job.id} failed (attempt {job.attempts}): {e}")
+            if await job_queue.fail(job, str(e) or type(e).__name__):
+                await self._edit(job, "⏳ 生成摘要失败，稍后自动重试...")
+            else:
+                await self._edit(job, "❌ 生成摘要失败，请稍后重试")
+        finally:
+            heartbeat.cancel()
+
+    async def _run_job(self, job: QueuedJob):
+        """Generate and show a job's summary; raises if it should be retried."""
+        payload = job.payload
+        window = SummaryWindow(**payload["window"]) if payload["window"] else None
+        prepared = await summarizer.prepare(job.group_id, window, topics=payload["topics"])
+        edit = partial(self.bot.edit_message_text, chat_id=payload["chat_id"], message_id=payload["message_id"])
+        if not prepared.records:
+            await edit("📭 暂无消息记录，无法生成摘要")
+            return
+
+        result = await stream_summary(
+            edit,
+            prepared,
+            payload["language"],
+            payload["summary_length"],
+            Priority(payload["priority"]),
+            payload.get("footer", "")
+        )
+        if result is None:
+            raise RuntimeError("summary generation failed")
+        if result.fallback and job.attempts < job.max_attempts:
+            # MiniMax is down; a later attempt may still get a real summary
+            raise RuntimeError(f"only a {result.fallback} fallback was available")
+        await show_summary(edit, prepared, result)
+
+    async def _edit(self, job: QueuedJob, text: str):
+        try:
+            await self.bot.edit_message_text(
+                text, chat_id=job.payload["chat_id"], message_id=job.payload["message_id"]
+            )
+        except TelegramAPIError as e:
+            logger.warning(f"Could not update the message of summary job {job.id}: {e}")
+
+    async def _heartbeat(self, job: QueuedJob):
+        # Renew well before the lease runs out
+        interval = job_queue.lease_ms / 3000
+        while True:
+            await asyncio.sleep(interval)
+            if not await job_queue.heartbeat(job):
+                logger.warning(f"Summary job {job.id} lease was lost to another worker")
+                return
+
+    async def _purge_finished(self):
+        while True:
+            try:
+                purged = await job_queue.purge()
+                if purged:
+                    logger.info(f"Purged {purged} finished summary jobs")
+            except Exception as e:
+                logger.error(f"Purging summary jobs failed: {e}")
+            await asyncio.sleep(_PURGE_INTERVAL)
+
+
+async def main():
+    """Run the worker until SIGTERM or SIGINT."""
+    bot = Bot(
+        token=config.TELEGRAM_BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+    if config.TELEGRAM_RATE_LIMIT:
+        # Paced separately from the bot process, which has buckets of its own
+        bot.session.middleware(RateLimitMiddleware(
+            global_rate=config.TELEGRAM_GLOBAL_RATE,
+            group_per_minute=config.TELEGRAM_GROUP_RATE_PER_MINUTE,
+            private_rate=config.TELEGRAM_PRIVATE_RATE,
+            chat_burst=config.TELEGRAM_CHAT_BURST,
+            max_retries=config.TELEGRAM_FLOOD_RETRIES,
+            max_retry_after=config.TELEGRAM_MAX_RETRY_AFTER
+        ))
+    # Messages are ingested by the bot process; always read them from SQLite
+    message_store.tail_cache_enabled = False
+    await minimax_service.start()
+
+    worker = SummaryWorker(bot, config.WORKER_CONCURRENCY, config.WORKER_POLL_INTERVAL)
+    task = asyncio.create_task(worker.run())
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, task.cancel)
+
+    logger.info(f"Summary worker {worker.worker_id} started with {worker.concurrency} slots")
+    try:
+        await task
+    except asyncio.CancelledError:
+        logger.info("Summary worker stopping; jobs in progress were returned to the queue")
+    finally:
+        await minimax_service.close()
+        await bot.session.close()
+        await async_db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
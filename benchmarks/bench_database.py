@@ -0,0 +1,60 @@
+"""Benchmark Database.add_message / get_recent_messages with and without pooling.
+
+Usage:
+    python benchmarks/bench_database.py [--ops 2000] [--groups 10]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# The app config requires these; the benchmark never talks to either API
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "benchmark")
+os.environ.setdefault("MINIMAX_API_KEY", "benchmark")
+# Keep the module-level app database out of the working directory
+os.environ.setdefault("DATABASE_URL", str(Path(tempfile.gettempdir()) / "bench_app.db"))
+
+from app.database import Database  # noqa: E402
+
+
+def bench(label: str, pooled: bool, ops: int, groups: int):
+    """Run the add/read workload against a fresh database file."""
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Database(str(Path(tmp) / "bench.db"), pooled=pooled)
+
+        started = time.perf_counter()
+        for i in range(ops):
+            db.add_message(i % groups, i, f"user{i % 50}", f"benchmark message number {i}")
+        add_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for i in range(ops):
+            db.get_recent_messages(i % groups, 200)
+        read_elapsed = time.perf_counter() - started
+
+        db.close()
+
+    print(
+        f"{label:<8} add_message: {ops / add_elapsed:>9.0f} ops/s "
+        f"({add_elapsed / ops * 1e6:>7.1f} us/op)   "
+        f"get_recent_messages: {ops / read_elapsed:>9.0f} ops/s "
+        f"({read_elapsed / ops * 1e6:>7.1f} us/op)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--groups", type=int, default=10)
+    args = parser.parse_args()
+
+    bench("legacy", pooled=False, ops=args.ops, groups=args.groups)
+    bench("pooled", pooled=True, ops=args.ops, groups=args.groups)
+
+
+if __name__ == "__main__":
+    main()
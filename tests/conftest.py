@@ -0,0 +1,13 @@
+"""Shared test setup."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# The app config requires these; tests never talk to either API
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "test")
+os.environ.setdefault("MINIMAX_API_KEY", "test")
+# Keep the module-level app database out of the working directory
+os.environ.setdefault("DATABASE_URL", str(Path(tempfile.mkdtemp()) / "test_app.db"))
@@ -0,0 +1,42 @@
+"""Tests for near-duplicate collapsing at ingest."""
+import sys
+
+import app.services  # noqa: F401
+from app.services.dedup import DuplicateDetector
+
+# The package exports the instance under the module's name
+message_store = sys.modules["app.services.message_store"].message_store
+
+
+def _same(detector: DuplicateDetector, a: str, b: str) -> bool:
+    return detector.same(detector.signature(a), detector.signature(b))
+
+
+def test_changed_words_are_not_duplicates():
+    detector = DuplicateDetector()
+
+    assert not _same(detector, "we should use Postgres", "we should not use Postgres")
+    assert not _same(detector, "we should use Postgres for the new service", "we should not use Postgres for the new service")
+    assert not _same(detector, "meet Monday at 3 in room B", "meet Tuesday at 3 in room B")
+    assert not _same(detector, "明天下午三点在会议室开会讨论项目", "明天下午四点在会议室开会讨论项目")
+
+
+def test_cosmetic_differences_are_duplicates():
+    detector = DuplicateDetector()
+
+    assert _same(detector, "Check out this amazing offer at example.com now!!!", "check out this amazing offer at example.com now 🔥")
+    assert _same(detector, "明天下午三点在会议室开会讨论项目", "明天下午三点在会议室开会讨论项目！！")
+
+
+def test_only_the_same_sender_is_collapsed():
+    text = "Check out this amazing offer at example.com now"
+    rows = [
+        (1, 10, "alice", text, 1000, 1, None),
+        (1, 20, "bob", text, 1001, 2, None),
+        (1, 10, "alice", text + "!", 1002, 3, None),
+    ]
+
+    kept, _, repeats = message_store._collapse_duplicates(rows)
+
+    assert [(row[2], row[-1]) for row in kept] == [("alice", 2), ("bob", 1)]
+    assert repeats == {}
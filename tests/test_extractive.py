@@ -0,0 +1,24 @@
+"""Tests for the local extractive summaries."""
+from app.services.extractive import format_highlights
+from app.services.tail_cache import TailRecord
+
+
+def test_highlights_escape_html():
+    records = [
+        TailRecord(1, "Tom & Jerry", "use <b and a < b", 0),
+        TailRecord(2, "<admin>", "plain text", 0),
+    ]
+
+    text = format_highlights(records)
+
+    assert text == (
+        "• Tom &amp; Jerry: use &lt;b and a &lt; b\n"
+        "• &lt;admin&gt;: plain text"
+    )
+
+
+def test_highlights_are_cut_before_escaping():
+    text = format_highlights([TailRecord(1, "a", "<" * 10, 0)], max_chars=4)
+
+    # Never cut through an entity
+    assert text == "• a: &lt;&lt;&lt;&lt;…"
@@ -0,0 +1,102 @@
+"""Tests for the LLM call scheduler."""
+import asyncio
+
+from app.services.llm_scheduler import LLMScheduler, Priority
+
+
+async def _dispatch_order(requests: list[tuple[str, int, Priority]]) -> list[str]:
+    """Queue the requests behind a held slot and record the order they get one."""
+    scheduler = LLMScheduler(max_concurrent=1)
+    order = []
+    held = asyncio.Event()
+    release = asyncio.Event()
+
+    async def hold():
+        async with scheduler.slot():
+            held.set()
+            await release.wait()
+
+    async def call(name: str, group_id: int, priority: Priority):
+        with scheduler.context(group_id, priority):
+            async with scheduler.slot():
+                order.append(name)
+
+    holder = asyncio.create_task(hold())
+    await held.wait()
+    calls = []
+    for request in requests:
+        calls.append(asyncio.create_task(call(*request)))
+        await asyncio.sleep(0)
+    release.set()
+    await asyncio.gather(holder, *calls)
+    return order
+
+
+def test_owner_and_paid_overtake_free_calls_of_other_groups():
+    requests = [(f"free-g{i}", i, Priority.FREE) for i in range(1, 6)]
+    requests += [("owner", 100, Priority.OWNER), ("paid", 101, Priority.PAID)]
+
+    order = asyncio.run(_dispatch_order(requests))
+
+    assert order == ["owner", "paid", "free-g1", "free-g2", "free-g3", "free-g4", "free-g5"]
+
+
+def test_background_calls_wait_for_free_ones():
+    requests = [("digest", 1, Priority.BACKGROUND), ("free", 2, Priority.FREE)]
+
+    assert asyncio.run(_dispatch_order(requests)) == ["free", "digest"]
+
+
+def test_bursting_group_queues_behind_quiet_groups_of_its_class():
+    requests = [(f"burst-{i}", 1, Priority.FREE) for i in range(3)]
+    requests += [("quiet", 2, Priority.FREE)]
+
+    order = asyncio.run(_dispatch_order(requests))
+
+    assert order == ["burst-0", "quiet", "burst-1", "burst-2"]
+
+
+def test_lower_classes_are_not_starved_by_sustained_owner_load():
+    requests = [(f"owner-{i}", 100 + i, Priority.OWNER) for i in range(30)]
+    requests += [(f"free-{i}", 1, Priority.FREE) for i in range(5)]
+    requests += [(f"digest-{i}", 2, Priority.BACKGROUND) for i in range(5)]
+
+    order = asyncio.run(_dispatch_order(requests))
+
+    # Owner calls get four slots per free call and eight per background one,
+    # long before the owner backlog is gone
+    first = [name.split("-")[0] for name in order[:20]]
+    assert first.count("free") >= 3
+    assert first.count("digest") >= 1
+    assert order.index("digest-0") < order.index("owner-29")
+
+
+def test_queue_positions_are_pushed_only_when_they_change():
+    async def run():
+        scheduler = LLMScheduler(max_concurrent=1, notify_interval=0.01)
+        reports = {name: [] for name in ("a", "b", "c")}
+        release = asyncio.Event()
+
+        async def call(name: str):
+            async def on_queue(position: int):
+                reports[name].append(position)
+
+            with scheduler.context(ord(name), Priority.FREE, on_queue):
+                async with scheduler.slot():
+                    await release.wait()
+
+        tasks = []
+        for name in reports:
+            tasks.append(asyncio.create_task(call(name)))
+            await asyncio.sleep(0)
+        await asyncio.sleep(0.05)
+        # Nothing changed: no repeats
+        scheduler._schedule_notify()
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(*tasks)
+        return reports
+
+    reports = asyncio.run(run())
+
+    assert reports == {"a": [], "b": [1], "c": [2]}
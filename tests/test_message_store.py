@@ -0,0 +1,34 @@
+"""Tests for buffered message ingestion."""
+import asyncio
+import sys
+
+import app.services  # noqa: F401
+from app.database import db
+
+MessageStore = sys.modules["app.services.message_store"].MessageStore
+
+
+def test_failed_bookkeeping_does_not_store_the_batch_twice(monkeypatch):
+    store = MessageStore()
+    group_id = -4242
+
+    async def broken_record_inserts(group_id, added):
+        raise RuntimeError("injected")
+
+    monkeypatch.setattr(store.retention, "record_inserts", broken_record_inserts)
+
+    async def ingest():
+        store.buffer.start()
+        await store.store_message(group_id, 1, "alice", "first message", message_id=1)
+        await store.store_message(group_id, 2, "bob", "second message", message_id=2)
+        await store.stop()
+
+    asyncio.run(ingest())
+
+    messages = db.get_recent_messages(group_id, 10)
+    assert [(m["text"], m["repeat_count"]) for m in messages] == [
+        ("first message", 1), ("second message", 1)
+    ]
+    assert store.stats().failed_flushes == 0
+    # The group's cached state was dropped rather than left half-updated
+    assert store.tail_cache.get(group_id, 10) is None
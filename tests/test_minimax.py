@@ -0,0 +1,31 @@
+"""Tests for the MiniMax request hedging."""
+import asyncio
+
+from app.services.minimax import MiniMaxService
+
+
+def test_cancelled_caller_cancels_the_running_request():
+    async def run() -> bool:
+        service = MiniMaxService()
+        for _ in range(service.latency.min_samples):
+            service.latency.record(0.01)
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def complete(*args):
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        service._complete = complete
+        caller = asyncio.create_task(service._hedged("system", "user", 100))
+        await started.wait()
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        await asyncio.gather(caller, return_exceptions=True)
+        return caller.cancelled()
+
+    assert asyncio.run(run())
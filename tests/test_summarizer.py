@@ -0,0 +1,37 @@
+"""Tests for the summary pipeline's formatting."""
+import asyncio
+import sys
+
+import app.services  # noqa: F401
+from app.services.extractive import format_highlights
+from app.services.tail_cache import TailRecord
+from app.services.topics import Topic
+
+summarizer_module = sys.modules["app.services.summarizer"]
+
+Summarizer = summarizer_module.Summarizer
+
+
+def test_topic_headers_escape_participant_names():
+    records = [TailRecord(1, "<b>oss", "hi", 0), TailRecord(2, "R&D", "<b hello", 60_000)]
+    fallback = format_highlights(records)
+
+    text = Summarizer._format_topics([Topic(records)], [fallback])
+
+    assert "&lt;b&gt;oss、R&amp;D" in text or "R&amp;D、&lt;b&gt;oss" in text
+    assert "<b" not in text
+
+
+def test_digest_text_is_served_for_the_recent_summary_it_covers():
+    summarizer = summarizer_module.summarizer
+    records = [TailRecord(1, "a", "hello", 0), TailRecord(2, "b", "world", 60_000)]
+    recent = summarizer_module.SummaryJob(-42, records, "最近 2 条消息", "recent", None)
+
+    async def run():
+        await summarizer.cache_as(recent, "digest text", "zh-CN", "medium")
+        return await summarizer.get_cached(recent, "zh-CN", "medium")
+
+    result = asyncio.run(run())
+
+    assert result is not None and result.from_cache
+    assert result.text == "digest text"
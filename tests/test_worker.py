@@ -0,0 +1,78 @@
+"""Tests for the summary worker's retry handling."""
+import asyncio
+
+import app.worker as worker_module
+from app.database import async_db
+from app.services.job_queue import job_queue
+from app.services.llm_scheduler import Priority
+from app.services.summarizer import SummaryJob, SummaryResult, summarizer
+from app.services.tail_cache import TailRecord
+
+
+class FakeBot:
+    """Records the texts the worker shows on the processing message."""
+
+    def __init__(self):
+        self.edits = []
+
+    async def edit_message_text(self, text, chat_id, message_id):
+        self.edits.append(text)
+
+
+def _payload() -> dict:
+    return {
+        "chat_id": -100, "message_id": 7, "window": None, "topics": False,
+        "language": "zh-CN", "summary_length": "medium", "priority": int(Priority.FREE)
+    }
+
+
+async def _prepare(group_id, window=None, topics=False) -> SummaryJob:
+    return SummaryJob(group_id, [TailRecord(1, "a", "hello", 0)], "scope", "recent", None)
+
+
+async def _run() -> FakeBot:
+    """Queue one job and process it until there is nothing left to claim."""
+    bot = FakeBot()
+    worker = worker_module.SummaryWorker(bot)
+    await job_queue.enqueue(-100, _payload(), Priority.FREE)
+    while (job := await job_queue.claim("test-worker")) is not None:
+        await worker._process(job)
+    return bot
+
+
+def test_failing_generation_is_retried_then_dead_lettered(monkeypatch):
+    calls = []
+
+    async def stream_summary(*args):
+        calls.append(args)
+        return None
+
+    monkeypatch.setattr(summarizer, "prepare", _prepare)
+    monkeypatch.setattr(worker_module, "stream_summary", stream_summary)
+    monkeypatch.setattr(job_queue, "retry_delay_ms", 0)
+
+    bot = asyncio.run(_run())
+    counts = asyncio.run(async_db.job_queue_counts())
+
+    assert len(calls) == job_queue.max_attempts
+    assert bot.edits[-1] == "❌ 生成摘要失败，请稍后重试"
+    assert counts["failed"] == 1 and counts["queued"] == 0 and counts["running"] == 0
+
+
+def test_successful_retry_is_acked(monkeypatch):
+    results = [None, SummaryResult("the summary")]
+
+    async def stream_summary(*args):
+        return results.pop(0)
+
+    monkeypatch.setattr(summarizer, "prepare", _prepare)
+    monkeypatch.setattr(worker_module, "stream_summary", stream_summary)
+    monkeypatch.setattr(job_queue, "retry_delay_ms", 0)
+
+    before = asyncio.run(async_db.job_queue_counts())
+    bot = asyncio.run(_run())
+    after = asyncio.run(async_db.job_queue_counts())
+
+    assert not results
+    assert "the summary" in bot.edits[-1]
+    assert after["done"] == before["done"] + 1